@@ -1,9 +1,9 @@
 import os
+import io
 import time
+import argparse
+import unicodedata
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -13,8 +13,15 @@ import logging
 from dotenv import load_dotenv
 import json
 from typing import Dict, Optional, Tuple, List
+from pool_navegadores import obtener_pool
+from sesion_esiclinic import iniciar_sesion
+from indice_pacientes import cargar_indice, normalizar_dni, ruta_pacientes
+from cache_excel import ruta_cache
+from almacenamiento import escribir_atomico
+from esperas import esperar_ajax, esperar_modal, intentar
 
 # Configuración de logging
+os.makedirs('logs', exist_ok=True)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -27,8 +34,7 @@ logger = logging.getLogger(__name__)
 
 # Configuración inicial
 CONFIG = {
-    'BASE_URL': "https://esiclinic.com/",
-    'EXCEL_PATH': "data/clientes/pacientes.xlsx",
+    'EXCEL_PATH': None,  # None: la exportación de pacientes más reciente (indice_pacientes.ruta_pacientes)
     'SCREENSHOT_DIR': "data/screenshots",
     'WAIT_TIMEOUT': 15,
     'SHORT_WAIT': 5,
@@ -48,14 +54,12 @@ except FileNotFoundError:
 # Cargar variables de entorno
 load_dotenv("env/.env")
 
+def ruta_excel() -> str:
+    """Archivo de pacientes configurado o, si no hay ninguno, la última exportación"""
+    return CONFIG['EXCEL_PATH'] or ruta_pacientes()
+
 class ESIClinicPageObjects:
     """Clase para mantener todos los selectores de la página"""
-    LOGIN = {
-        'username_field': (By.ID, "esi_user"),
-        'password_field': (By.ID, "esi_pass"),
-        'login_button': (By.ID, "bt_acceder")
-    }
-    
     PATIENT_FORM = {
         'new_patient_button': (By.CSS_SELECTOR, 'button#bt_nuevo, #bt_nuevo, [title*="Añadir nuevo"]'),
         'name_field': (By.ID, "Tnombre"),
@@ -84,32 +88,21 @@ class ESIClinicAutomator:
         self._create_dirs()
         
     def _setup_driver(self):
-        """Configura el driver de Chrome con opciones"""
-        self.options = webdriver.ChromeOptions()
-        
-        if CONFIG['HEADLESS']:
-            self.options.add_argument("--headless=new")
-            self.options.add_argument("--window-size=1920,1080")
-        
-        self.options.add_argument("--no-sandbox")
-        self.options.add_argument("--disable-dev-shm-usage")
-        self.options.add_argument("--disable-gpu")
-        self.options.add_argument("--start-maximized")
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=self.options)
+        """Toma prestado un navegador del pool compartido"""
+        self.driver = obtener_pool().obtener()
         self.driver.implicitly_wait(CONFIG['IMPLICIT_WAIT'])
         
     def _create_dirs(self):
         """Crea directorios necesarios si no existen"""
         os.makedirs(CONFIG['SCREENSHOT_DIR'], exist_ok=True)
-        os.makedirs(os.path.dirname(CONFIG['EXCEL_PATH']), exist_ok=True)
+        os.makedirs(os.path.dirname(ruta_excel()), exist_ok=True)
         
     def close(self):
-        """Cierra el navegador y realiza limpieza"""
+        """Devuelve el navegador al pool y realiza limpieza"""
         if hasattr(self, 'driver'):
-            self.driver.quit()
-            logger.info("Navegador cerrado correctamente")
+            self.driver.implicitly_wait(0)
+            obtener_pool().devolver(self.driver)
+            logger.info("Navegador devuelto al pool")
             
     def _take_screenshot(self, prefix: str = "error"):
         """Toma un screenshot y guarda con timestamp"""
@@ -140,23 +133,8 @@ class ESIClinicAutomator:
             bool: True si el login fue exitoso, False en caso contrario
         """
         try:
-            logger.info("Accediendo a ESIClinic...")
-            self.driver.get(CONFIG['BASE_URL'])
-            
-            # Ingresar credenciales
-            self.wait.until(EC.presence_of_element_located(
-                self.page.LOGIN['username_field']
-            )).send_keys(os.getenv("USUARIO_ESICLINIC"))
-            
-            self.driver.find_element(*self.page.LOGIN['password_field']).send_keys(
-                os.getenv("PASSWORD_ESICLINIC")
-            )
-            
-            # Click en login
-            self.driver.find_element(*self.page.LOGIN['login_button']).click()
-            
-            # Esperar redirección
-            self.wait.until(EC.url_contains("agenda.php"))
+            if not iniciar_sesion(self.driver):
+                raise RuntimeError("No se pudo iniciar sesión en esiclinic")
             logger.info("Login exitoso")
             return True
             
@@ -215,26 +193,17 @@ class ESIClinicAutomator:
             - message: Mensaje descriptivo del resultado
         """
         try:
-            if not os.path.exists(CONFIG['EXCEL_PATH']):
+            if not os.path.exists(ruta_excel()) and not os.path.exists(ruta_cache(ruta_excel())):
                 logger.warning("Archivo Excel no encontrado, se omitirá verificación de duplicados")
                 return True, None
                 
             try:
-                # Intentar leer con diferentes motores por compatibilidad
-                try:
-                    df = pd.read_excel(CONFIG['EXCEL_PATH'])
-                except:
-                    df = pd.read_excel(CONFIG['EXCEL_PATH'], engine='openpyxl')
-                
-                # Verificar estructura del DataFrame
-                required_columns = {'CIF', 'E-Mail'}
-                if not required_columns.issubset(df.columns):
-                    logger.warning("El archivo Excel no tiene las columnas esperadas")
-                    return True, None
+                # Índice de pacientes: solo relee el Excel si ha cambiado desde la última vez
+                indice = cargar_indice(ruta_excel())
                 
                 # Buscar duplicados
-                dni_duplicate = not df[df['CIF'].str.lower() == patient_data['dni'].lower()].empty
-                email_duplicate = not df[df['E-Mail'].str.lower() == patient_data['email'].lower()].empty
+                dni_duplicate = bool(indice.por_dni(patient_data['dni']))
+                email_duplicate = bool(indice.por_email(patient_data['email']))
                 
                 if dni_duplicate:
                     return False, "Error: Este DNI ya existe en la base de datos"
@@ -284,11 +253,13 @@ class ESIClinicAutomator:
         except Exception as modal_error:
             logger.debug(f"No se detectó modal de confirmación: {str(modal_error)}")
 
-    def create_patient(self, patient_data: Dict) -> bool:
+    def create_patient(self, patient_data: Dict, reload_page: bool = True) -> bool:
         """Crea un nuevo paciente en el sistema
         
         Args:
             patient_data: Diccionario con los datos del paciente
+            reload_page: Recargar pacientes.php antes de abrir el formulario; en una
+                importación por lotes se reutiliza la página si ya está abierta
             
         Returns:
             bool: True si el paciente fue creado exitosamente
@@ -297,8 +268,9 @@ class ESIClinicAutomator:
             logger.info("Abriendo formulario de paciente...")
             
             # Intentar acceso directo primero
-            self.driver.get('https://app.esiclinic.com/pacientes.php?autoclose=1&load=')
-            time.sleep(3)
+            if reload_page or "pacientes.php" not in self.driver.current_url:
+                self.driver.get('https://app.esiclinic.com/pacientes.php?autoclose=1&load=')
+                intentar(esperar_ajax, self.driver)
             
             # Localizar y hacer clic en el botón "+" para nuevo paciente
             try:
@@ -306,12 +278,12 @@ class ESIClinicAutomator:
                     EC.element_to_be_clickable(self.page.PATIENT_FORM['new_patient_button']))
                 self.driver.execute_script("arguments[0].click();", new_patient_button)
                 logger.info("Botón '+' encontrado y clickeado")
-                time.sleep(2)
+                intentar(esperar_modal, self.driver, self.page.PATIENT_FORM['name_field'], CONFIG['WAIT_TIMEOUT'])
             except Exception as btn_e:
                 logger.warning(f"No se pudo encontrar el botón '+': {str(btn_e)}")
                 logger.info("Intentando método alternativo para abrir formulario...")
                 self.driver.get('https://app.esiclinic.com/pacientes.php?action=new')
-                time.sleep(3)
+                intentar(esperar_ajax, self.driver)
 
             # Rellenar el formulario
             fields_map = {
@@ -376,6 +348,182 @@ class ESIClinicAutomator:
             self._take_screenshot("patient_creation_error")
             return False
 
+def crear_paciente(patient_data: Dict, permitir_email_duplicado: bool = False) -> Dict:
+    """Crea un paciente sin preguntar nada por terminal (para la API y otros scripts)
+    
+    Args:
+        patient_data: Diccionario con los datos del paciente (mismas claves que get_patient_data)
+        permitir_email_duplicado: Crear el paciente aunque su email ya esté registrado
+        
+    Returns:
+        Diccionario {"ok": bool, "mensaje": str, "errores": [str]}
+    """
+    errors = ESIClinicAutomator.validate_patient_data(patient_data)
+    if errors:
+        return {"ok": False, "mensaje": "Datos no válidos", "errores": errors}
+    
+    allow_create, duplicate_msg = ESIClinicAutomator.check_excel_duplicates(patient_data)
+    if not allow_create or (duplicate_msg and not permitir_email_duplicado):
+        return {"ok": False, "mensaje": duplicate_msg, "errores": [duplicate_msg]}
+    
+    automator = ESIClinicAutomator()
+    try:
+        if not automator.login():
+            return {"ok": False, "mensaje": "Error en el login", "errores": ["Error en el login"]}
+        if not automator.create_patient(patient_data):
+            return {"ok": False, "mensaje": "Hubo un error al crear el paciente", "errores": []}
+        return {"ok": True, "mensaje": duplicate_msg or "Paciente creado", "errores": []}
+    finally:
+        automator.close()
+
+# Columnas aceptadas en los archivos de importación (también las de la exportación de esiclinic),
+# por orden de preferencia: se usa la primera que tenga valor (Teléfono solo si Móvil está vacío)
+COLUMNAS_IMPORTACION = {
+    'nombre': ['nombre'],
+    'apellidos': ['apellidos'],
+    'dni': ['dni', 'nif', 'cif', 'dni/nif'],
+    'movil': ['movil', 'telefono'],
+    'email': ['email', 'e-mail', 'correo'],
+    'fecha_nacimiento': ['fecha_nacimiento', 'fecha nacimiento', 'fecha de nacimiento'],
+}
+CAMPOS_INFORME = ['fila', 'dni', 'nombre', 'apellidos', 'estado', 'mensaje']
+
+def _clave_columna(columna) -> str:
+    texto = unicodedata.normalize("NFKD", str(columna)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.strip().lower().split())
+
+def leer_archivo_pacientes(ruta: str) -> List[Dict]:
+    """Lee un CSV o Excel de pacientes y devuelve sus filas con las claves de get_patient_data"""
+    if os.path.splitext(ruta)[1].lower() == ".csv":
+        df = pd.read_csv(ruta, dtype=str, sep=None, engine="python")
+    else:
+        df = pd.read_excel(ruta, dtype=str)
+    columnas = {}
+    for columna in df.columns:
+        columnas.setdefault(_clave_columna(columna), columna)
+    pacientes = []
+    for fila in df.fillna("").to_dict("records"):
+        paciente = {}
+        for campo, alias in COLUMNAS_IMPORTACION.items():
+            valores = (str(fila[columnas[a]]).strip() for a in alias if a in columnas)
+            paciente[campo] = next((v for v in valores if v), "")
+        paciente['email'] = paciente['email'].lower()
+        pacientes.append(paciente)
+    return pacientes
+
+def ruta_informe(ruta: str) -> str:
+    return os.path.splitext(ruta)[0] + ".informe.csv"
+
+def leer_informe(ruta_inf: str) -> Dict[int, Dict]:
+    """Resultados de una importación anterior, por número de fila"""
+    if not os.path.exists(ruta_inf):
+        return {}
+    df = pd.read_csv(ruta_inf, dtype=str).fillna("")
+    filas = df.to_dict("records")
+    for fila in filas:
+        fila['fila'] = int(fila['fila'])
+    return {fila['fila']: fila for fila in filas}
+
+def guardar_informe(ruta_inf: str, resultados: Dict[int, Dict]):
+    filas = [resultados[n] for n in sorted(resultados)]
+    buffer = io.StringIO()
+    pd.DataFrame(filas, columns=CAMPOS_INFORME).to_csv(buffer, index=False)
+    escribir_atomico(ruta_inf, buffer.getvalue(), fsync=False)
+
+def preparar_importacion(pacientes: List[Dict], permitir_email_duplicado: bool = False) -> List[Dict]:
+    """Valida todas las filas y las compara con el índice de pacientes y entre sí, sin navegador
+    
+    Returns:
+        Lista de resultados {"fila", "dni", "nombre", "apellidos", "estado", "mensaje"} donde estado es
+        "pendiente", "invalido" o "duplicado"; la fila 1 es la primera fila de datos
+    """
+    try:
+        indice = cargar_indice(ruta_excel())
+    except FileNotFoundError:
+        logger.warning("Archivo Excel no encontrado, se omitirá verificación de duplicados")
+        indice = None
+    
+    vistos_dni, vistos_email = {}, {}
+    resultados = []
+    for numero, paciente in enumerate(pacientes, 1):
+        resultado = {'fila': numero, 'dni': paciente['dni'], 'nombre': paciente['nombre'],
+                     'apellidos': paciente['apellidos'], 'estado': 'pendiente', 'mensaje': ''}
+        errores = ESIClinicAutomator.validate_patient_data(paciente)
+        dni = normalizar_dni(paciente['dni'])
+        if errores:
+            resultado.update(estado='invalido', mensaje="; ".join(errores))
+        elif indice is not None and indice.por_dni(dni):
+            resultado.update(estado='duplicado', mensaje="Este DNI ya existe en la base de datos")
+        elif dni in vistos_dni:
+            resultado.update(estado='duplicado', mensaje=f"DNI repetido en la fila {vistos_dni[dni]}")
+        elif not permitir_email_duplicado and indice is not None and indice.por_email(paciente['email']):
+            resultado.update(estado='duplicado', mensaje="Este email ya está registrado")
+        elif not permitir_email_duplicado and paciente['email'] in vistos_email:
+            resultado.update(estado='duplicado', mensaje=f"Email repetido en la fila {vistos_email[paciente['email']]}")
+        vistos_dni.setdefault(dni, numero)
+        vistos_email.setdefault(paciente['email'], numero)
+        resultados.append(resultado)
+    return resultados
+
+def importar_pacientes(ruta: str, permitir_email_duplicado: bool = False, reanudar: bool = True) -> Dict:
+    """Crea en esiclinic todos los pacientes de un CSV/Excel con una sola sesión
+    
+    Primero se validan y deduplican todas las filas en memoria; después se crean una a una
+    en el mismo navegador. El resultado de cada fila se guarda en <archivo>.informe.csv tras
+    cada paciente, y al volver a ejecutar se saltan las filas ya creadas.
+    
+    Returns:
+        Diccionario {"creados", "fallidos", "omitidos", "informe"}
+    """
+    pacientes = leer_archivo_pacientes(ruta)
+    ruta_inf = ruta_informe(ruta)
+    anteriores = leer_informe(ruta_inf) if reanudar else {}
+    
+    resultados = {}
+    for resultado in preparar_importacion(pacientes, permitir_email_duplicado):
+        anterior = anteriores.get(resultado['fila'])
+        if anterior and anterior['estado'] == 'creado' and normalizar_dni(anterior['dni']) == normalizar_dni(resultado['dni']):
+            resultado = anterior
+        resultados[resultado['fila']] = resultado
+    guardar_informe(ruta_inf, resultados)
+    
+    pendientes = [r for r in resultados.values() if r['estado'] in ('pendiente', 'error')]
+    ya_creados = sum(1 for r in resultados.values() if r['estado'] == 'creado')
+    print(f"📋 {len(pacientes)} filas: {len(pendientes)} por crear, {ya_creados} ya creadas, "
+          f"{len(pacientes) - len(pendientes) - ya_creados} omitidas (ver {ruta_inf})")
+    
+    if pendientes:
+        automator = ESIClinicAutomator()
+        try:
+            if not automator.login():
+                print("❌ Error en el login, no se puede proceder")
+                return {"creados": 0, "fallidos": len(pendientes), "omitidos": len(pacientes) - len(pendientes) - ya_creados,
+                        "informe": ruta_inf}
+            for resultado in pendientes:
+                paciente = pacientes[resultado['fila'] - 1]
+                print(f"\n👤 [{resultado['fila']}/{len(pacientes)}] {paciente['nombre']} {paciente['apellidos']}")
+                if automator.create_patient(paciente, reload_page=False):
+                    resultado.update(estado='creado', mensaje=datetime.now().isoformat(timespec="seconds"))
+                else:
+                    resultado.update(estado='error', mensaje="Hubo un error al crear el paciente")
+                    # Página limpia para el siguiente paciente
+                    automator.driver.get('https://app.esiclinic.com/pacientes.php?autoclose=1&load=')
+                    intentar(esperar_ajax, automator.driver)
+                guardar_informe(ruta_inf, resultados)
+        finally:
+            automator.close()
+    
+    estados = [r['estado'] for r in resultados.values()]
+    resumen = {
+        "creados": estados.count('creado') - ya_creados,
+        "fallidos": estados.count('error'),
+        "omitidos": estados.count('invalido') + estados.count('duplicado'),
+        "informe": ruta_inf,
+    }
+    print(f"\n📊 Importación terminada: {resumen['creados']} creados, {resumen['fallidos']} con error, "
+          f"{resumen['omitidos']} omitidos. Informe: {ruta_inf}")
+    return resumen
+
 def get_patient_data() -> Dict:
     """Obtiene los datos del paciente por terminal
     
@@ -457,4 +605,16 @@ def main():
             automator.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Crea pacientes en esiclinic")
+    parser.add_argument("--importar", metavar="ARCHIVO", help="CSV o Excel con los pacientes a crear")
+    parser.add_argument("--permitir-email-duplicado", action="store_true",
+                        help="crear también los pacientes cuyo email ya está registrado")
+    parser.add_argument("--desde-cero", action="store_true",
+                        help="ignorar el informe de una importación anterior")
+    args = parser.parse_args()
+    # El navegador arranca mientras se leen el archivo o los datos por terminal
+    obtener_pool().calentar_en_segundo_plano(1)
+    if args.importar:
+        importar_pacientes(args.importar, args.permitir_email_duplicado, reanudar=not args.desde_cero)
+    else:
+        main()
\ No newline at end of file
@@ -1,109 +1,73 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import os
-import time
 import traceback
-import pandas as pd
+from datetime import datetime
 from dotenv import load_dotenv
 from google_sheets import subir_a_google_sheets
+from pool_navegadores import obtener_pool, fijar_carpeta_descargas
+from sesion_esiclinic import iniciar_sesion
+from cliente_esiclinic import ClienteEsiclinic, descargar_por_http
+from cache_excel import cachear_exportacion
+from indice_pacientes import CARPETA_PACIENTES, EXTENSIONES_PACIENTES, ruta_pacientes
+from esperas import esperar_red_inactiva, esperar_descarga, intentar
 
 # Configuración común
 load_dotenv("env/.env")
-DOWNLOAD_DIR = os.path.abspath("data/clientes")
+DOWNLOAD_DIR = CARPETA_PACIENTES
 
 def eliminar_archivos_antiguos():
     """Elimina archivos Excel antiguos en la carpeta de descarga"""
     for filename in os.listdir(DOWNLOAD_DIR):
-        if filename.endswith(('.xls', '.xlsx')) and not filename.startswith('~$'):
+        if filename.endswith(EXTENSIONES_PACIENTES) and not filename.startswith('~$'):
             try:
                 os.remove(os.path.join(DOWNLOAD_DIR, filename))
                 print(f" Archivo antiguo eliminado: {filename}")
             except Exception as e:
                 print(f" No se pudo eliminar el archivo {filename}: {str(e)}")
 
-def convertir_a_xlsx(ruta_archivo):
-    if ruta_archivo.endswith('.xls'):
-        nuevo_nombre = ruta_archivo.replace('.xls', '.xlsx')
-        
-        df = pd.read_excel(ruta_archivo, engine='xlrd')  # Abres el .xls
-        df.to_excel(nuevo_nombre, index=False, engine='openpyxl')  # Guardas como .xlsx
-        
-        os.remove(ruta_archivo)  # Borras el .xls original si quieres
-        
-        print(f" Archivo convertido correctamente a XLSX: {nuevo_nombre}")
-        return nuevo_nombre
-    return ruta_archivo
+def preparar_descarga(ruta_archivo):
+    """Renombra la descarga a pacientes.<ext> y crea su caché tipada (sin convertir el Excel)"""
+    destino = ruta_pacientes(os.path.splitext(ruta_archivo)[1])
+    if os.path.abspath(ruta_archivo) != destino:
+        os.replace(ruta_archivo, destino)
+    cachear_exportacion(destino)
+    return destino
 
 def configurar_navegador():
-    """Configura y retorna una instancia del navegador Chrome"""
+    """Presta un navegador del pool compartido con las descargas en DOWNLOAD_DIR"""
     if not os.path.exists(DOWNLOAD_DIR):
         os.makedirs(DOWNLOAD_DIR)
     
     eliminar_archivos_antiguos()
 
-    options = webdriver.ChromeOptions()
-    options.add_argument("--start-maximized")
-    options.add_argument("--disable-notifications")
-    options.add_experimental_option("prefs", {
-        "download.default_directory": DOWNLOAD_DIR,
-        "download.prompt_for_download": False,
-        "download.directory_upgrade": True,
-        "safebrowsing.enabled": False,
-    })
-
-    return webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()),
-        options=options
-    )
+    driver = obtener_pool().obtener()
+    fijar_carpeta_descargas(driver, DOWNLOAD_DIR)
+    return driver
 
 def descargar_pacientes(driver):
     """Realiza el proceso completo de descarga del archivo de pacientes"""
     try:
-        print(" Accediendo a esiclinic.com...")
-        driver.get("https://esiclinic.com/")
-        
-        print(" Enviando credenciales...")
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.ID, "esi_user"))
-        ).send_keys(os.getenv("USUARIO_ESICLINIC"))
-        
-        driver.find_element(By.ID, "esi_pass").send_keys(os.getenv("PASSWORD_ESICLINIC"))
-        
-        login_button = WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.ID, "bt_acceder"))
-        )
-        login_button.click()
-        
-        print(" Iniciando sesión...")
-        WebDriverWait(driver, 15).until(EC.url_contains("agenda.php"))
-        print(" Login exitoso")
+        if not iniciar_sesion(driver):
+            raise RuntimeError("No se pudo iniciar sesión en esiclinic")
 
         print(" Navegando a pacientes...")
         driver.get("https://app.esiclinic.com/pacientes.php")
-        time.sleep(5)  # Espera para que cargue la página
+        intentar(esperar_red_inactiva, driver)  # Espera a que cargue la tabla
 
         print(" Descargando Excel...")
         download_button = WebDriverWait(driver, 15).until(
             EC.element_to_be_clickable((By.ID, "bt_excel"))
         )
+        antes = os.listdir(DOWNLOAD_DIR)
         download_button.click()
 
         # Esperar descarga
-        max_espera = 60
-        archivo_descargado = None
-        
-        for _ in range(max_espera):
-            archivos = [f for f in os.listdir(DOWNLOAD_DIR) if f.endswith('.xls') and not f.startswith('~$')]
-            if archivos:
-                archivo_descargado = os.path.join(DOWNLOAD_DIR, archivos[0])
-                archivo_descargado = convertir_a_xlsx(archivo_descargado)
-                print(f" Archivo descargado: {archivo_descargado}")
-                break
-            time.sleep(1)
+        archivo_descargado = esperar_descarga(DOWNLOAD_DIR, EXTENSIONES_PACIENTES, antes, timeout=60)
+        if archivo_descargado:
+            archivo_descargado = preparar_descarga(archivo_descargado)
+            print(f" Archivo descargado: {archivo_descargado}")
         else:
             print(" No se detectó el archivo descargado")
             driver.save_screenshot("error_descarga.png")
@@ -122,7 +86,23 @@ def descargar_pacientes(driver):
         driver.save_screenshot(f"error_{timestamp}.png")
         return False
 
+def descargar_pacientes_http():
+    """Descarga el archivo de pacientes por HTTP con la sesión guardada, sin abrir el navegador"""
+    if not os.path.exists(DOWNLOAD_DIR):
+        os.makedirs(DOWNLOAD_DIR)
+    eliminar_archivos_antiguos()
+    archivo_descargado = descargar_por_http(ClienteEsiclinic.descargar_pacientes, DOWNLOAD_DIR)
+    if not archivo_descargado:
+        return None
+    archivo_descargado = preparar_descarga(archivo_descargado)
+    print(f" Archivo descargado: {archivo_descargado}")
+    return subir_a_google_sheets(archivo_descargado, os.getenv("NOMBRE_HOJA_PACIENTES"))
+
 def main():
+    resultado = descargar_pacientes_http()
+    if resultado is not None:
+        print(" Proceso completado con éxito" if resultado else " Hubo errores durante el proceso")
+        return
     driver = configurar_navegador()
     try:
         if descargar_pacientes(driver):
@@ -130,8 +110,8 @@ def main():
         else:
             print(" Hubo errores durante el proceso")
     finally:
-        driver.quit()
-        print(" Navegador cerrado")
+        obtener_pool().devolver(driver)
+        print(" Navegador devuelto al pool")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,50 +1,31 @@
-import pandas as pd
-import json
-import time
 from datetime import datetime, timedelta
-import os
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
 from dotenv import load_dotenv
 from selenium.webdriver.support.ui import Select
 from selenium.common.exceptions import StaleElementReferenceException
-import subprocess
 import sys
+from pool_navegadores import obtener_pool
+from sesion_esiclinic import iniciar_sesion
+from sincronizar_citas import sincronizar_citas
+from almacen_citas import buscar_por_paciente, citas_del_dia, actualizar_cita, eliminar_cita, obtener_cita
+from disponibilidad import IndiceOcupacion, disponibilidad_dia, imprimir_disponibilidad, horas_libres
+from reglas_horario import REGLAS, a_fecha
+from indice_pacientes import cargar_indice
+from descargar_excel import descargar_excel
+import Crear_usuario
+import gestion_citas
+from esperas import (esperar_ajax, esperar_red_inactiva, esperar_modal, esperar_modal_cerrado, esperar_valor,
+                     esperar_clicable, intentar)
+from selector_hora import establecer_hora
 
 # Configuración global
 load_dotenv("env/.env")
-BASE_URL = "https://esiclinic.com/"
-EXCEL_PACIENTES = "data/clientes/pacientes.xlsx"
-JSON_CITAS = "data/citas_2_semanas.json"
-
-# Configuración de horarios laborales
-# Configuración de horarios
-HORARIO_MANANA_AGENDA_1 = {
-    'inicio': '10:15',
-    'fin': '14:00'
-}
-HORARIO_MANANA_AGENDA_2 = {
-    'inicio': '10:30',  # 15 mins después que Agenda 1
-    'fin': '13:30'      # 30 mins antes que Agenda 1
-}
-
-HORARIO_TARDE_AGENDA_1 = {
-    'inicio': '15:00',
-    'fin': '20:15'
-}
-HORARIO_TARDE_AGENDA_2 = {
-    'inicio': '15:15',  # 15 mins después que Agenda 1
-    'fin': '19:45'      # 30 mins antes que Agenda 1
-}
 
+# Los horarios, facultativos y salas de cada agenda están en reglas_horario.json
 INTERVALO_CITAS = 45  # Duración de cada cita
-DIAS_CON_TARDE = [0, 1, 2, 3, 4]  # Martes, Miércoles, Jueves, Viernes (ahora incluye jueves)
 class GestorCitas:
     def __init__(self):
         self.driver = None
@@ -57,32 +38,13 @@ class GestorCitas:
         self.cita_seleccionada = None
 
     def configurar_navegador(self):
-        options = webdriver.ChromeOptions()
-        options.add_argument("--start-maximized")
-        options.add_argument("--disable-notifications")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        return webdriver.Chrome(
-            service=Service(ChromeDriverManager().install()),
-            options=options
-        )
+        """Presta un navegador del pool compartido"""
+        return obtener_pool().obtener()
 
     def login(self):
         try:
-            print("\n➡️ Iniciando sesión en esiclinic.com...")
-            self.driver.get(BASE_URL)
-            
-            WebDriverWait(self.driver, 15).until(
-                EC.presence_of_element_located((By.ID, "esi_user"))
-            ).send_keys(os.getenv("USUARIO_ESICLINIC"))
-            
-            self.driver.find_element(By.ID, "esi_pass").send_keys(os.getenv("PASSWORD_ESICLINIC"))
-            
-            btn_login = WebDriverWait(self.driver, 15).until(
-                EC.element_to_be_clickable((By.ID, "bt_acceder")))
-            ActionChains(self.driver).move_to_element(btn_login).pause(0.5).click().perform()
-            
-            WebDriverWait(self.driver, 15).until(EC.url_contains("agenda.php"))
-            print("✅ Sesión iniciada correctamente")
+            if not iniciar_sesion(self.driver):
+                raise RuntimeError("No se pudo iniciar sesión en esiclinic")
             return True
         except Exception as e:
             print(f"❌ Error en login: {str(e)}")
@@ -91,17 +53,19 @@ class GestorCitas:
 
     def cargar_datos_paciente(self):
         try:
-            pacientes_df = pd.read_excel(EXCEL_PACIENTES, engine="openpyxl")
+            indice = cargar_indice()
 
             self.datos_usuario["email"] = input("\n✉️ Ingrese su email registrado: ").strip().lower()
-            pacientes = pacientes_df[pacientes_df["E-Mail"].str.lower() == self.datos_usuario["email"]]
+            pacientes = indice.por_email(self.datos_usuario["email"])
 
-            if pacientes.empty:
+            if not pacientes:
                 print("❌ Email no encontrado en la base de datos")
                 opcion = input("¿Desea crear un nuevo paciente? (s/n): ").strip().lower()
                 if opcion == "s":
-                    print("🚀 Ejecutando Crear_usuario.py...")
-                    subprocess.run([sys.executable, "Crear_usuario.py"])
+                    print("🚀 Abriendo la creación de pacientes...")
+                    # Crear_usuario pide su propio navegador: se devuelve antes el nuestro
+                    self.cerrar()
+                    Crear_usuario.main()
                 else:
                     print("\n👋 Programa finalizado, no se ha creado el paciente.")
                 sys.exit(0)
@@ -112,7 +76,7 @@ class GestorCitas:
                 print("----------------------------------------")
                 
                 # Mostrar lista de pacientes con este correo
-                for i, (_, row) in enumerate(pacientes.iterrows(), 1):
+                for i, row in enumerate(pacientes, 1):
                     print(f"{i}. {row['Nombre']} {row['Apellidos']} (DNI: {row['CIF']})")
                 
                 print("----------------------------------------")
@@ -123,11 +87,11 @@ class GestorCitas:
                     
                     # Si ingresa un número de la lista
                     if seleccion.isdigit() and 1 <= int(seleccion) <= len(pacientes):
-                        paciente = pacientes.iloc[int(seleccion)-1]
+                        paciente = pacientes[int(seleccion)-1]
                         break
                     # Si ingresa un DNI
-                    elif seleccion.lower() in pacientes['CIF'].str.lower().values:
-                        paciente = pacientes[pacientes['CIF'].str.lower() == seleccion.lower()].iloc[0]
+                    elif any(p['CIF'].lower() == seleccion.lower() for p in pacientes):
+                        paciente = next(p for p in pacientes if p['CIF'].lower() == seleccion.lower())
                         break
                     else:
                         print("❌ Opción no válida. Intente nuevamente.")
@@ -139,7 +103,7 @@ class GestorCitas:
             
             # Solo un paciente con este correo
             else:
-                paciente = pacientes.iloc[0]
+                paciente = pacientes[0]
                 self.datos_usuario["nombre_completo"] = f"{paciente['Nombre']} {paciente['Apellidos']}"
                 self.datos_usuario["dni"] = paciente['CIF']
                 print(f"\n👤 Paciente encontrado: {self.datos_usuario['nombre_completo']} (DNI: {self.datos_usuario['dni']})")
@@ -151,38 +115,27 @@ class GestorCitas:
 
     def cargar_citas_desde_json(self):
         try:
-            with open(JSON_CITAS, 'r', encoding='utf-8') as f:
-                citas_data = json.load(f)
-            
-            # Generar variantes del nombre (apellidos primero)
-            nombre_completo = self.datos_usuario["nombre_completo"]
-            partes = nombre_completo.split()
-            formatos_nombre = [
-                nombre_completo.lower(),  # "sergi giovanni vique villafuerte"
-                " ".join(partes[-2:] + partes[:-2]).lower(),  # "vique villafuerte sergi giovanni"
-                " ".join(partes[-1:] + partes[:-1]).lower(),  # "villafuerte sergi giovanni vique"
-            ]
+            # Búsqueda indexada por DNI o por las palabras del nombre, en cualquier orden
+            citas_data = buscar_por_paciente(self.datos_usuario["nombre_completo"], self.datos_usuario["dni"])
             
             self.datos_usuario["citas"] = [
                 {
                     "indice": i+1,
+                    "id": c["id"],
                     "fecha": c["dia"],
                     "hora": c["hora_inicio"],
                     "paciente": c["paciente"]
                 }
                 for i, c in enumerate(citas_data)
-                if any(
-                    formato in c["paciente"].lower() 
-                    for formato in formatos_nombre
-                )
             ]
             
             if not self.datos_usuario["citas"]:
                 print("ℹ️ No hay citas registradas para este paciente")
                 opcion = input("¿Desea crear una nueva cita? (s/n): ").strip().lower()
                 if opcion == 's':
-                    print("🚀 Ejecutando gestionar_citas.py...")
-                    subprocess.run([sys.executable, "gestion_citas.py"])
+                    print("🚀 Abriendo la gestión de citas...")
+                    self.cerrar()
+                    gestion_citas.main()
                     sys.exit(0)
                 else:
                     print("\n👋 Programa finalizado, no se ha creado ninguna cita.")
@@ -207,15 +160,13 @@ class GestorCitas:
             input_busqueda = WebDriverWait(self.driver, 20).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, "input#TpacienteWidget.form-control")))
             input_busqueda.clear()
-            time.sleep(1)
+            intentar(esperar_valor, self.driver, input_busqueda, "", 3)
             
-            # Ingresar DNI carácter por carácter
             dni = str(self.datos_usuario["dni"]).upper()
-            for char in dni:
-                input_busqueda.send_keys(char)
-                time.sleep(0.2)
+            input_busqueda.send_keys(dni)
+            intentar(esperar_valor, self.driver, input_busqueda, dni, 3)
             print(f"✓ DNI {dni} ingresado")
-            time.sleep(3)
+            intentar(esperar_red_inactiva, self.driver, 0.5, 10)
             
             # Construir múltiples variantes del nombre para búsqueda
             nombre_completo = self.datos_usuario["nombre_completo"]
@@ -252,14 +203,13 @@ class GestorCitas:
                     for intento in range(3):
                         try:
                             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", opcion)
-                            time.sleep(0.5)
                             opcion.click()
                             print(f"✓ Paciente seleccionado con formato: {formato}")
-                            time.sleep(2)
+                            intentar(esperar_red_inactiva, self.driver, 0.3, 5)
                             break
                         except Exception as e_click:
                             print(f"⚠️ Intento {intento+1} fallido: {str(e_click)}")
-                            time.sleep(1)
+                            intentar(esperar_clicable, self.driver, opcion, 5)
                     else:
                         continue
                     
@@ -298,7 +248,7 @@ class GestorCitas:
                             self.driver.execute_script("arguments[0].click();", btn)
                             
                         print("✓ Botón 'Ver citas' clickeado")
-                        time.sleep(2)
+                        intentar(esperar_red_inactiva, self.driver)
                         
                         return True
                         
@@ -339,7 +289,7 @@ class GestorCitas:
             establecer_fecha("fecha", fecha_inicio)
             establecer_fecha("fecha2", fecha_fin)
             
-            time.sleep(3)
+            intentar(esperar_red_inactiva, self.driver)
             print("✓ Rango de fechas configurado correctamente")
             return True
         except Exception as e:
@@ -421,7 +371,6 @@ class GestorCitas:
                         for intento in range(3):
                             try:
                                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", celdas[0])
-                                time.sleep(0.5)
                                 celdas[0].click()
                                 print(f"✓ Clic en fecha realizado (intento {intento+1})")
                                 
@@ -431,7 +380,7 @@ class GestorCitas:
                                 return True
                             except Exception as e_click:
                                 print(f"⚠️ Intento {intento+1} fallido: {str(e_click)}")
-                                time.sleep(1)
+                                intentar(esperar_clicable, self.driver, celdas[0], 5)
                         
                         print("❌ No se pudo abrir el modal de edición")
                         return False
@@ -455,12 +404,11 @@ class GestorCitas:
             try:
                 fecha_dt = datetime.strptime(fecha, "%d-%m-%Y")
                 dia_semana = fecha_dt.weekday()
-                hora_dt = datetime.strptime(hora, "%H:%M")
 
                 # Esperar a que el modal esté completamente estable
                 WebDriverWait(self.driver, 15).until(
                     EC.presence_of_element_located((By.CSS_SELECTOR, "#citaMotivo, #citaFacultativo")))
-                time.sleep(0.5)
+                intentar(esperar_red_inactiva, self.driver, 0.3, 5)
 
                 # Localizar el select de facultativo
                 select_element = WebDriverWait(self.driver, 10).until(
@@ -485,21 +433,8 @@ class GestorCitas:
                     print("⚠️ No hay facultativos disponibles")
                     return False
 
-                # Lógica de selección según horario y agenda
-                facultativo_seleccionado = None
-                if dia_semana == 0:  # Lunes
-                    if agenda_num == 1:
-                        facultativo_seleccionado = "Arnau Girones" if hora_dt.time() < datetime.strptime("14:00", "%H:%M").time() else "David Ibiza"
-                    else:
-                        facultativo_seleccionado = "Jose Cabanes"
-                elif dia_semana == 1:  # Martes
-                    facultativo_seleccionado = "Arnau Girones"
-                elif dia_semana == 2:  # Miércoles
-                    facultativo_seleccionado = "David Ibiza" if hora_dt.time() < datetime.strptime("12:30", "%H:%M").time() else "Arnau Girones"
-                elif dia_semana == 3:  # Jueves
-                    facultativo_seleccionado = "Jose Cabanes"
-                elif dia_semana == 4:  # Viernes
-                    facultativo_seleccionado = "Arnau Girones"
+                # Facultativo según las reglas de horario de la clínica
+                facultativo_seleccionado = REGLAS.nombre_facultativo(fecha_dt, hora, agenda_num)
 
                 # Seleccionar el facultativo
                 for nombre, opcion in opciones_validas.items():
@@ -521,7 +456,7 @@ class GestorCitas:
             except StaleElementReferenceException:
                 intentos += 1
                 print(f"⚠️ Intento {intentos}: Elemento obsoleto, reintentando...")
-                time.sleep(1)
+                intentar(esperar_ajax, self.driver, 5)
             except Exception as e:
                 print(f"⚠️ Error al seleccionar facultativo: {str(e)}")
                 self.driver.save_screenshot(f"error_facultativo_intento_{intentos}.png")
@@ -530,13 +465,13 @@ class GestorCitas:
         print("❌ No se pudo seleccionar el facultativo después de varios intentos")
         return False
     def seleccionar_sala(self, agenda_num, dia_semana):
-        """Selecciona Box 2 para agenda 2 en lunes/jueves, Box 1 para agenda 1"""
+        """Selecciona la sala de la agenda según las reglas de horario (Box 2 para agenda 2)"""
         try:
             select_element = WebDriverWait(self.driver, 5).until(
                 EC.element_to_be_clickable((By.ID, "modalRoom")))
             select_sala = Select(select_element)
             
-            box = "Box 2" if agenda_num == 2 else "Box 1"
+            box = REGLAS.sala(agenda_num)
             select_sala.select_by_visible_text(box)
             print(f"🏥 Sala seleccionada: {box} (Agenda {agenda_num})")
             return True
@@ -545,16 +480,14 @@ class GestorCitas:
             return False
     def ejecutar_descarga_excel(self):
         try:
-            print("\n⬇️ Ejecutando script de descarga de Excel...")
-            resultado = subprocess.run([sys.executable, "descargar_excel.py"], check=True, capture_output=True, text=True)
-            print("✅ Script de descarga ejecutado correctamente")
-            print(resultado.stdout)
+            print("\n⬇️ Descargando Excel de citas...")
+            if not descargar_excel():
+                print("❌ Error al descargar el Excel de citas")
+                return False
+            print("✅ Descarga ejecutada correctamente")
             return True
-        except subprocess.CalledProcessError as e:
-            print(f"❌ Error al ejecutar descarga_excel.py: {e.stderr}")
-            return False
         except Exception as e:
-            print(f"❌ Error inesperado al ejecutar descarga_excel.py: {str(e)}")
+            print(f"❌ Error inesperado al descargar el Excel: {str(e)}")
             return False
 
     def cancelar_cita(self):
@@ -585,18 +518,7 @@ class GestorCitas:
                 print("❌ Cancelación abortada por el usuario")
                 return False
             
-            try:
-                btn_eliminar1 = WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "button.btn.btn-danger.lock.bt_eliminar")))
-                
-                self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn_eliminar1)
-                time.sleep(1)
-                self.driver.execute_script("arguments[0].click();", btn_eliminar1)
-                print("✓ Primer botón 'Eliminar' clickeado")
-                time.sleep(2)
-            except Exception as e:
-                print(f"❌ Error al hacer clic en el primer botón Eliminar: {str(e)}")
-                self.driver.save_screenshot("error_primer_eliminar.png")
+            if not self.pulsar_eliminar():
                 return False
             
             confirmacion2 = input("\n⚠️ CONFIRMACIÓN FINAL: ¿Está completamente seguro de eliminar esta cita? (s/n): ").strip().lower()
@@ -610,36 +532,63 @@ class GestorCitas:
                     pass
                 return False
             
-            try:
-                WebDriverWait(self.driver, 5).until(
-                    EC.visibility_of_element_located((By.CSS_SELECTOR, "div.jconfirm-box")))
-                
-                btn_eliminar2 = WebDriverWait(self.driver, 10).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, "div.jconfirm-box button.btn-danger")))
-                
-                self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn_eliminar2)
-                time.sleep(1)
-                self.driver.execute_script("arguments[0].click();", btn_eliminar2)
-                print("✓ Segundo botón 'Eliminar' clickeado")
-                time.sleep(3)
-            except Exception as e:
-                print(f"❌ Error al hacer clic en el segundo botón Eliminar: {str(e)}")
-                self.driver.save_screenshot("error_segundo_eliminar.png")
+            if not self.confirmar_eliminacion():
                 return False
-            
-            if not self.actualizar_json_citas(eliminar=True):
-                return False
-                
-            print("\n✅✅✅ CITA CANCELADA CORRECTAMENTE ✅✅✅")
-            if not self.ejecutar_descarga_excel():
-                print("⚠️ Se completó la cancelación pero falló la descarga del Excel")
-            return True
+            return self.finalizar_cancelacion()
             
         except Exception as e:
             print(f"❌ Error cancelando cita: {str(e)}")
             self.driver.save_screenshot("error_cancelar_cita.png")
             return False
 
+    def pulsar_eliminar(self):
+        """Pulsa 'Eliminar' en el modal de la cita abierta (abre la confirmación)"""
+        try:
+            btn_eliminar1 = WebDriverWait(self.driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "button.btn.btn-danger.lock.bt_eliminar")))
+            
+            self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn_eliminar1)
+            self.driver.execute_script("arguments[0].click();", btn_eliminar1)
+            print("✓ Primer botón 'Eliminar' clickeado")
+            intentar(esperar_modal, self.driver, (By.CSS_SELECTOR, "div.jconfirm-box"), 5)
+            return True
+        except Exception as e:
+            print(f"❌ Error al hacer clic en el primer botón Eliminar: {str(e)}")
+            self.driver.save_screenshot("error_primer_eliminar.png")
+            return False
+
+    def confirmar_eliminacion(self):
+        """Pulsa 'Eliminar' en el cuadro de confirmación final"""
+        try:
+            WebDriverWait(self.driver, 5).until(
+                EC.visibility_of_element_located((By.CSS_SELECTOR, "div.jconfirm-box")))
+            
+            btn_eliminar2 = WebDriverWait(self.driver, 10).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, "div.jconfirm-box button.btn-danger")))
+            
+            self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn_eliminar2)
+            self.driver.execute_script("arguments[0].click();", btn_eliminar2)
+            print("✓ Segundo botón 'Eliminar' clickeado")
+            intentar(esperar_modal_cerrado, self.driver)
+            intentar(esperar_red_inactiva, self.driver)
+            return True
+        except Exception as e:
+            print(f"❌ Error al hacer clic en el segundo botón Eliminar: {str(e)}")
+            self.driver.save_screenshot("error_segundo_eliminar.png")
+            return False
+
+    def finalizar_cancelacion(self, descargar=True):
+        if not self.actualizar_json_citas(eliminar=True):
+            return False
+            
+        print("\n✅✅✅ CITA CANCELADA CORRECTAMENTE ✅✅✅")
+        if descargar:
+            # La descarga puede necesitar un navegador del pool: se devuelve antes el nuestro
+            self.cerrar()
+        if descargar and not self.ejecutar_descarga_excel():
+            print("⚠️ Se completó la cancelación pero falló la descarga del Excel")
+        return True
+
     def seleccionar_cita_para_modificar(self):
         try:
             if not self.cargar_citas_desde_json():
@@ -673,85 +622,47 @@ class GestorCitas:
             if not self.mostrar_horas_disponibles(nueva_fecha):
                 return False
             
-            if not self.modificar_campos_cita(nueva_fecha, nueva_hora):
-                return False
-                
-            if not self.guardar_cambios_cita():
-                return False
-                
-            if not self.actualizar_json_citas(nueva_fecha=nueva_fecha, nueva_hora=nueva_hora):
-                return False
-                
-            print("\n✅✅✅ CITA REAGENDADA CORRECTAMENTE ✅✅✅")
-            if not self.ejecutar_descarga_excel():
-                print("⚠️ Se completó el reagendamiento pero falló la descarga del Excel")
-            return True
+            return self.aplicar_reagendamiento(nueva_fecha)
             
         except Exception as e:
             print(f"❌ Error reagendando cita: {str(e)}")
             self.driver.save_screenshot("error_reagendar_cita.png")
             return False
 
+    def aplicar_reagendamiento(self, nueva_fecha, descargar=True):
+        """Cambia fecha y hora (self.nueva_hora / self.nueva_agenda) en el modal abierto y guarda"""
+        if not self.modificar_campos_cita(nueva_fecha, self.nueva_hora):
+            return False
+            
+        if not self.guardar_cambios_cita():
+            return False
+            
+        if not self.actualizar_json_citas(nueva_fecha=nueva_fecha, nueva_hora=self.nueva_hora):
+            return False
+            
+        print("\n✅✅✅ CITA REAGENDADA CORRECTAMENTE ✅✅✅")
+        if descargar:
+            self.cerrar()
+        if descargar and not self.ejecutar_descarga_excel():
+            print("⚠️ Se completó el reagendamiento pero falló la descarga del Excel")
+        return True
+
+    def horas_disponibles_dia(self, fecha):
+        """Lista [(hora, agenda)] de las horas libres de un día (DD-MM-YYYY), sin mostrar nada"""
+        fecha_dt = datetime.strptime(fecha, "%d-%m-%Y")
+        citas_fecha = citas_del_dia(fecha_dt.strftime("%Y-%m-%d"))
+        bloques = disponibilidad_dia(fecha_dt, IndiceOcupacion(citas_fecha), INTERVALO_CITAS)
+        return [(hora, str(agenda)) for hora, agenda in horas_libres(bloques)]
+
     def mostrar_horas_disponibles(self, fecha):
         try:
             fecha_dt = datetime.strptime(fecha, "%d-%m-%Y")
-            dia_semana = fecha_dt.weekday()  # 0=Lunes, 6=Domingo
-
-            with open(JSON_CITAS, 'r', encoding='utf-8') as f:
-                citas = json.load(f)
-
-            citas_fecha = [c for c in citas if c['dia'] == fecha_dt.strftime("%Y-%m-%d")]
+            citas_fecha = citas_del_dia(fecha_dt.strftime("%Y-%m-%d"))
 
             print("\n🕒 Horarios disponibles (duración: 45 minutos):")
-            self.horas_disponibles = []  # Reiniciar lista
-
-            def hora_ocupada(hora_dt, agenda_id):
-                for cita in citas_fecha:
-                    if str(cita.get("agenda", "1")) != str(agenda_id):
-                        continue
-                    inicio = datetime.strptime(cita["hora_inicio"], "%H:%M")
-                    fin = datetime.strptime(cita["hora_fin"], "%H:%M")
-                    if inicio <= hora_dt < fin:
-                        return True
-                return False
-
-            def mostrar_agenda(nombre, inicio_str, fin_str, agenda_id):
-                print(f"\n📋 {nombre} ({inicio_str} - {fin_str})")
-                hora_actual = datetime.strptime(inicio_str, "%H:%M")
-                fin = datetime.strptime(fin_str, "%H:%M")
-
-                while hora_actual + timedelta(minutes=INTERVALO_CITAS) <= fin:
-                    hora_str = hora_actual.strftime("%H:%M")
-                    if not hora_ocupada(hora_actual, agenda_id):
-                        print(f"✅ {hora_str} - Disponible")
-                        self.horas_disponibles.append((hora_str, agenda_id))
-                    else:
-                        print(f"❌ {hora_str} - Ocupado")
-                    hora_actual += timedelta(minutes=INTERVALO_CITAS)
-
-            # Mostrar Agenda 1 - Mañana
-            mostrar_agenda("Agenda Principal (Mañana)", HORARIO_MANANA_AGENDA_1["inicio"], HORARIO_MANANA_AGENDA_1["fin"], "1")
-
-            # Mostrar Agenda 2 - Mañana si lunes o jueves y agenda 1 llena
-            if dia_semana in [0, 3]:
-                agenda1_llena = all(
-                    hora_ocupada(datetime.strptime(HORARIO_MANANA_AGENDA_1["inicio"], "%H:%M") + timedelta(minutes=INTERVALO_CITAS * i), "1")
-                    for i in range(int((datetime.strptime(HORARIO_MANANA_AGENDA_1["fin"], "%H:%M") - datetime.strptime(HORARIO_MANANA_AGENDA_1["inicio"], "%H:%M")).seconds // 60 // INTERVALO_CITAS))
-                )
-                if agenda1_llena:
-                    mostrar_agenda("Agenda Secundaria (Mañana)", HORARIO_MANANA_AGENDA_2["inicio"], HORARIO_MANANA_AGENDA_2["fin"], "2")
-
-            # Mostrar Agenda 1 - Tarde
-            if dia_semana in DIAS_CON_TARDE:
-                mostrar_agenda("Agenda Principal (Tarde)", HORARIO_TARDE_AGENDA_1["inicio"], HORARIO_TARDE_AGENDA_1["fin"], "1")
-
-                if dia_semana == 3:
-                    agenda1_llena_tarde = all(
-                        hora_ocupada(datetime.strptime(HORARIO_TARDE_AGENDA_1["inicio"], "%H:%M") + timedelta(minutes=INTERVALO_CITAS * i), "1")
-                        for i in range(int((datetime.strptime(HORARIO_TARDE_AGENDA_1["fin"], "%H:%M") - datetime.strptime(HORARIO_TARDE_AGENDA_1["inicio"], "%H:%M")).seconds // 60 // INTERVALO_CITAS))
-                    )
-                    if agenda1_llena_tarde:
-                        mostrar_agenda("Agenda Secundaria (Tarde)", HORARIO_TARDE_AGENDA_2["inicio"], HORARIO_TARDE_AGENDA_2["fin"], "2")
+            # Mismo motor y mismos horarios que al crear una cita
+            bloques = disponibilidad_dia(fecha_dt, IndiceOcupacion(citas_fecha), INTERVALO_CITAS)
+            self.horas_disponibles = [(hora, str(agenda)) for hora, agenda in imprimir_disponibilidad(bloques)]
 
             if not self.horas_disponibles:
                 print("❌ No hay horas disponibles.")
@@ -771,59 +682,10 @@ class GestorCitas:
             print(f"❌ Error mostrando horarios: {str(e)}")
             return False
     def modificar_hora_en_modal(self, hora_deseada):
-        """Versión robusta para ajustar hora con timepicker visual"""
+        """Fija la hora del modal con el timepicker (API y, si no está, flechas)"""
         try:
             print(f"🕒 Configurando hora: {hora_deseada}")
-            horas, minutos = map(int, hora_deseada.split(':'))
-
-            # Activar el timepicker
-            reloj_icon = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, ".glyphicon-time"))
-            )
-            ActionChains(self.driver).move_to_element(reloj_icon).pause(0.3).click().perform()
-            time.sleep(1)
-
-            timepicker = WebDriverWait(self.driver, 10).until(
-                EC.visibility_of_element_located((By.CSS_SELECTOR, ".bootstrap-timepicker-widget"))
-            )
-            input_hora = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-hour")
-            input_minuto = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-minute")
-            flecha_hora_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementHour']")
-            flecha_minuto_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementMinute']")
-            flecha_hora_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementHour']")
-            flecha_minuto_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementMinute']")
-
-            # Calcular diferencia de hora
-            hora_actual = int(input_hora.get_attribute("value"))
-            diferencia_horas = horas - hora_actual
-            flecha_hora = flecha_hora_up if diferencia_horas > 0 else flecha_hora_down
-            for _ in range(abs(diferencia_horas)):
-                flecha_hora.click()
-                time.sleep(0.2)
-
-            # Ajustar minutos al múltiplo de 5 más cercano
-            minutos = (minutos // 5) * 5
-            minuto_actual = int(input_minuto.get_attribute("value"))
-            dif_normal = (minutos - minuto_actual) % 60
-            dif_inversa = (minuto_actual - minutos) % 60
-            if minutos == 0 and minuto_actual > 0:
-                flecha = flecha_minuto_down
-                pasos = dif_inversa
-            else:
-                flecha = flecha_minuto_up if dif_normal <= dif_inversa else flecha_minuto_down
-                pasos = min(dif_normal, dif_inversa)
-            for _ in range(pasos // 5):
-                flecha.click()
-                time.sleep(0.15)
-
-            hora_final = f"{input_hora.get_attribute('value')}:{input_minuto.get_attribute('value')}"
-            if hora_final == f"{horas:02d}:{minutos:02d}":
-                print(f"✅ Hora establecida correctamente: {hora_final}")
-                return True
-            else:
-                print(f"⚠️ Hora final no coincide exactamente: {hora_final} (esperado: {hora_deseada})")
-                return False
-
+            return establecer_hora(self.driver, hora_deseada)
         except Exception as e:
             print(f"❌ Error configurando hora visual: {str(e)}")
             self.driver.save_screenshot("error_timepicker_visual.png")
@@ -838,25 +700,13 @@ class GestorCitas:
             self.driver.execute_script("arguments[0].value = '';", input_fecha)
             input_fecha.send_keys(nueva_fecha)
             print(f"✓ Fecha establecida: {nueva_fecha}")
-            time.sleep(1)
+            intentar(esperar_red_inactiva, self.driver, 0.3, 5)
             
             print(f"\n⌛ Configurando nueva hora: {nueva_hora}")
             
-            try:
-                # Método directo
-                input_hora = WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.ID, "citaHora")))
-                
-                self.driver.execute_script("arguments[0].value = arguments[1];", input_hora, nueva_hora)
-                input_hora.send_keys(Keys.TAB)
-                print("✓ Hora establecida directamente")
-
-            except:
-                # 🔄 Si falla el método directo, intenta con el timepicker visual
-                print("ℹ️ Falló el método directo, usando timepicker visual...")
-                if not self.modificar_hora_en_modal(nueva_hora):
-                    print("❌ No se pudo modificar la hora con el timepicker visual")
-                    return False
+            if not self.modificar_hora_en_modal(nueva_hora):
+                print("❌ No se pudo modificar la hora con el timepicker")
+                return False
             
             # ✅ SELECCIONAR EL FACULTATIVO AQUÍ, SIEMPRE, después de poner la hora
             if not self.seleccionar_facultativo_por_horario(nueva_fecha, nueva_hora, self.nueva_agenda):
@@ -871,57 +721,16 @@ class GestorCitas:
             self.driver.save_screenshot("error_estableciendo_hora.png")
             return False
 
-    def ajustar_hora_con_flechas(self, timepicker, hora_deseada, minuto_deseado):
-        try:
-            print("🔧 Usando método de flechas para ajustar hora...")
-            
-            flecha_hora_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementHour']")
-            flecha_hora_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementHour']")
-            flecha_minuto_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementMinute']")
-            flecha_minuto_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementMinute']")
-            
-            hora_input = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-hour")
-            minuto_input = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-minute")
-            
-            hora_actual = int(hora_input.get_attribute("value"))
-            minuto_actual = int(minuto_input.get_attribute("value"))
-            
-            diferencia_horas = int(hora_deseada) - hora_actual
-            if diferencia_horas != 0:
-                flecha = flecha_hora_up if diferencia_horas > 0 else flecha_hora_down
-                for _ in range(abs(diferencia_horas)):
-                    flecha.click()
-                    time.sleep(0.2)
-            
-            minuto_deseado = (int(minuto_deseado) // 5) * 5
-            diferencia_minutos = minuto_deseado - minuto_actual
-            
-            if diferencia_minutos > 0:
-                for _ in range(diferencia_minutos // 5):
-                    flecha_minuto_up.click()
-                    time.sleep(0.1)
-            elif diferencia_minutos < 0:
-                for _ in range(abs(diferencia_minutos) // 5):
-                    flecha_minuto_down.click()
-                    time.sleep(0.1)
-            
-            print("✓ Hora ajustada con flechas")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error ajustando hora con flechas: {str(e)}")
-            return False
-
     def guardar_cambios_cita(self):
         try:
             btn_modificar = WebDriverWait(self.driver, 10).until(
                 EC.element_to_be_clickable((By.ID, "guardarCita")))
             
             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn_modificar)
-            time.sleep(1)
             self.driver.execute_script("arguments[0].click();", btn_modificar)
             print("✓ Cambios guardados (clic en Modificar)")
-            time.sleep(3)
+            intentar(esperar_modal_cerrado, self.driver)
+            intentar(esperar_red_inactiva, self.driver)
             
             return True
             
@@ -932,49 +741,78 @@ class GestorCitas:
 
     def actualizar_json_citas(self, nueva_fecha=None, nueva_hora=None, eliminar=False):
         try:
-            with open(JSON_CITAS, 'r', encoding='utf-8') as f:
-                citas = json.load(f)
-
-            cita_original = self.cita_seleccionada
-            dni_paciente = self.datos_usuario["dni"]
-
-            citas_actualizadas = []
-            modificada = False
-
-            for cita in citas:
-                coincide_fecha = cita["dia"] == cita_original["fecha"]
-                coincide_hora = cita["hora_inicio"] == cita_original["hora"]
-                coincide_paciente = any(nombre.lower() in cita.get("paciente", "").lower() 
-                        for nombre in self.datos_usuario["nombre_completo"].split())
-
-                if coincide_fecha and coincide_hora and coincide_paciente:
-                    if eliminar:
-                        print("🗑️ Eliminando cita del JSON...")
-                        continue  # no se añade a la nueva lista
-                    else:
-                        cita["dia"] = datetime.strptime(nueva_fecha, "%d-%m-%Y").strftime("%Y-%m-%d")
-                        cita["hora_inicio"] = nueva_hora
-                        cita["hora_fin"] = (datetime.strptime(nueva_hora, "%H:%M") + timedelta(minutes=INTERVALO_CITAS)).strftime("%H:%M")
-                        cita["agenda"] = str(self.nueva_agenda)  # 🆕 Actualizar número de agenda
-                        print(f"♻️ Cita actualizada en JSON: {cita}")
-                        modificada = True
+            cita_id = self.cita_seleccionada["id"]
 
-                citas_actualizadas.append(cita)
+            if eliminar:
+                print("🗑️ Eliminando cita del almacén de citas...")
+                if not eliminar_cita(cita_id):
+                    print("⚠️ La cita ya no estaba en el almacén de citas.")
+                print("💾 Citas actualizadas correctamente.")
+                return True
 
-            if not modificada and not eliminar:
-                print("⚠️ No se encontró la cita a modificar en el JSON.")
+            cambios = {
+                "dia": datetime.strptime(nueva_fecha, "%d-%m-%Y").strftime("%Y-%m-%d"),
+                "hora_inicio": nueva_hora,
+                "hora_fin": (datetime.strptime(nueva_hora, "%H:%M") + timedelta(minutes=INTERVALO_CITAS)).strftime("%H:%M"),
+                "agenda": str(self.nueva_agenda),  # 🆕 Actualizar número de agenda
+            }
+            if not actualizar_cita(cita_id, **cambios):
+                print("⚠️ No se encontró la cita a modificar en el almacén de citas.")
                 return False
 
-            with open(JSON_CITAS, 'w', encoding='utf-8') as f:
-                json.dump(citas_actualizadas, f, indent=2, ensure_ascii=False)
-
-            print("💾 JSON actualizado correctamente.")
+            print(f"♻️ Cita actualizada: {cambios}")
+            print("💾 Citas actualizadas correctamente.")
             return True
 
         except Exception as e:
-            print(f"❌ Error actualizando JSON: {str(e)}")
+            print(f"❌ Error actualizando citas: {str(e)}")
             return False
 
+    def preparar_cita(self, cita_id, dni=None):
+        """Carga el paciente y la cita `cita_id` del almacén sin preguntar nada
+
+        Returns:
+            str: Mensaje de error, o None si todo está listo para abrir la cita
+        """
+        cita = obtener_cita(cita_id)
+        if not cita:
+            return "Cita no encontrada"
+        indice = cargar_indice()
+        dni = dni or cita.get("dni")
+        pacientes = indice.por_dni(dni) if dni else indice.por_nombre(cita["paciente"])
+        if len(pacientes) == 1:
+            paciente = pacientes[0]
+            self.datos_usuario["email"] = paciente['E-Mail']
+            self.datos_usuario["nombre_completo"] = f"{paciente['Nombre']} {paciente['Apellidos']}"
+            self.datos_usuario["dni"] = paciente['CIF']
+        elif dni:
+            # Paciente aún no exportado en el Excel: se busca en la agenda con el nombre de la cita
+            self.datos_usuario["nombre_completo"] = cita["paciente"]
+            self.datos_usuario["dni"] = dni
+        else:
+            return "No se pudo identificar al paciente de la cita, indique el DNI"
+        self.cita_seleccionada = {
+            "id": cita["id"],
+            "fecha": cita["dia"],
+            "hora": cita["hora_inicio"],
+            "paciente": cita["paciente"]
+        }
+        return None
+
+    def abrir_cita(self):
+        """Inicia sesión y abre el modal de la cita seleccionada desde el historial del paciente"""
+        self.driver = self.configurar_navegador()
+        cita = self.cita_seleccionada
+        return (self.login()
+                and self.buscar_paciente_por_dni()
+                and self.configurar_rango_fechas(cita["fecha"])
+                and self.buscar_y_seleccionar_cita(cita["fecha"], cita["hora"]))
+
+    def cerrar(self):
+        if self.driver:
+            obtener_pool().devolver(self.driver)
+            self.driver = None
+
     def mostrar_menu(self):
         print("\n=== MENÚ PRINCIPAL ===")
         print("1. Reagendar cita")
@@ -984,9 +822,9 @@ class GestorCitas:
 
     def ejecutar(self):
         try:
-             # ✅ Ejecutar extracción de citas antes de todo
-            print("\n📦 Actualizando JSON de citas (extraer_citas.py)...")
-            subprocess.run([sys.executable, "extraer_citas.py"], check=True)
+            # ✅ Sincronizar citas antes de todo (solo se procesan las semanas con cambios)
+            print("\n📦 Sincronizando JSON de citas...")
+            sincronizar_citas()
             print("✅ JSON actualizado correctamente.\n")
             self.driver = self.configurar_navegador()
             
@@ -1017,9 +855,70 @@ class GestorCitas:
             print(f"❌ Error crítico: {str(e)}")
             sys.exit(1)
         finally:
-            if hasattr(self, 'driver') and self.driver:
-                self.driver.quit()
+            self.cerrar()
+
+def reagendar_cita(cita_id, nueva_fecha, nueva_hora, dni=None, descargar=True):
+    """Reagenda una cita del almacén sin preguntar nada por terminal (para la API y otros scripts)
+
+    Args:
+        cita_id (int): id de la cita en el almacén de citas
+        nueva_fecha: date, 'YYYY-MM-DD' o 'DD-MM-YYYY'
+        nueva_hora (str): 'HH:MM', debe estar libre
+        dni (str): DNI del paciente si la cita no lo tiene asociado
+        descargar (bool): Actualizar después el Excel de citas y Google Sheets
+    Returns:
+        dict: {"ok": bool, "mensaje": str, "cita": cita actualizada o None}
+    """
+    gestor = GestorCitas()
+    error = gestor.preparar_cita(cita_id, dni)
+    if error:
+        return {"ok": False, "mensaje": error, "cita": None}
+    try:
+        nueva_fecha = a_fecha(nueva_fecha).strftime("%d-%m-%Y")
+    except (ValueError, TypeError, IndexError):
+        return {"ok": False, "mensaje": "Formato de fecha incorrecto", "cita": None}
+    agendas = [agenda for hora, agenda in gestor.horas_disponibles_dia(nueva_fecha) if hora == nueva_hora]
+    if not agendas:
+        return {"ok": False, "mensaje": "Hora no disponible", "cita": None}
+    gestor.nueva_hora, gestor.nueva_agenda = nueva_hora, agendas[0]
+
+    try:
+        if not gestor.abrir_cita():
+            return {"ok": False, "mensaje": "No se pudo abrir la cita en la agenda", "cita": None}
+        if not gestor.aplicar_reagendamiento(nueva_fecha, descargar=False):
+            return {"ok": False, "mensaje": "No se pudo reagendar la cita", "cita": None}
+    finally:
+        gestor.cerrar()
+    # El Excel se descarga con el navegador ya devuelto al pool
+    if descargar:
+        gestor.ejecutar_descarga_excel()
+    return {"ok": True, "mensaje": "Cita reagendada", "cita": obtener_cita(cita_id)}
+
+def cancelar_cita_por_id(cita_id, dni=None, descargar=True):
+    """Cancela una cita del almacén sin pedir confirmaciones (para la API y otros scripts)
+
+    Returns:
+        dict: {"ok": bool, "mensaje": str, "cita": cita cancelada o None}
+    """
+    gestor = GestorCitas()
+    error = gestor.preparar_cita(cita_id, dni)
+    if error:
+        return {"ok": False, "mensaje": error, "cita": None}
+    cita = obtener_cita(cita_id)
+    try:
+        if not gestor.abrir_cita():
+            return {"ok": False, "mensaje": "No se pudo abrir la cita en la agenda", "cita": None}
+        if not (gestor.pulsar_eliminar() and gestor.confirmar_eliminacion()
+                and gestor.finalizar_cancelacion(descargar=False)):
+            return {"ok": False, "mensaje": "No se pudo cancelar la cita", "cita": None}
+    finally:
+        gestor.cerrar()
+    if descargar:
+        gestor.ejecutar_descarga_excel()
+    return {"ok": True, "mensaje": "Cita cancelada", "cita": cita}
 
 if __name__ == "__main__":
+    # El navegador arranca mientras se sincronizan las citas
+    obtener_pool().calentar_en_segundo_plano(1)
     gestor = GestorCitas()
     gestor.ejecutar()
\ No newline at end of file
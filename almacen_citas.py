@@ -0,0 +1,277 @@
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import unicodedata
+
+# Base de datos local de citas; el JSON queda como instantánea legible de la última extracción
+RUTA_BD = os.path.abspath(os.path.join("data", "citas.db"))
+RUTA_JSON = os.path.abspath(os.path.join("data", "citas_2_semanas.json"))
+CAMPOS = ("id", "semana", "dia", "hora_inicio", "hora_fin", "paciente", "agenda", "dni")
+
+# AUTOINCREMENT: el id de una cita borrada no se vuelve a asignar, así que un id que ya se
+# entregó (API, GestorCitas) nunca pasa a señalar la cita de otro paciente
+TABLA_CITAS = """
+CREATE TABLE IF NOT EXISTS {tabla} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    semana INTEGER,
+    dia TEXT NOT NULL,
+    hora_inicio TEXT NOT NULL,
+    hora_fin TEXT NOT NULL,
+    paciente TEXT NOT NULL,
+    paciente_norm TEXT NOT NULL,
+    agenda TEXT NOT NULL DEFAULT '1',
+    dni TEXT
+);
+"""
+
+ESQUEMA = TABLA_CITAS.format(tabla="citas") + """
+CREATE INDEX IF NOT EXISTS idx_citas_dia_agenda ON citas (dia, agenda, hora_inicio);
+CREATE INDEX IF NOT EXISTS idx_citas_paciente ON citas (paciente_norm);
+CREATE INDEX IF NOT EXISTS idx_citas_dni ON citas (dni);
+CREATE TABLE IF NOT EXISTS citas_tokens (
+    token TEXT NOT NULL,
+    cita_id INTEGER NOT NULL REFERENCES citas (id) ON DELETE CASCADE,
+    PRIMARY KEY (token, cita_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_tokens_cita ON citas_tokens (cita_id);
+"""
+
+_local = threading.local()
+
+
+def normalizar_nombre(nombre):
+    """Pasa un nombre a minúsculas y sin tildes para poder compararlo"""
+    texto = unicodedata.normalize("NFKD", str(nombre or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.lower().split())
+
+
+def normalizar_dni(dni):
+    return "".join(c for c in str(dni or "").upper() if c.isalnum()) or None
+
+
+def conexion():
+    """Devuelve la conexión del hilo actual, creando el esquema la primera vez"""
+    con = getattr(_local, "con", None)
+    if con is None:
+        os.makedirs(os.path.dirname(RUTA_BD), exist_ok=True)
+        con = sqlite3.connect(RUTA_BD, timeout=30)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        _migrar_autoincremento(con)
+        con.execute("PRAGMA foreign_keys=ON")
+        con.executescript(ESQUEMA)
+        _local.con = con
+        _importar_json_inicial(con)
+    return con
+
+
+def _migrar_autoincremento(con):
+    """Reconstruye con AUTOINCREMENT una tabla de citas creada sin él, conservando los ids
+
+    Se ejecuta con las claves foráneas desactivadas para no borrar en cascada los tokens.
+    """
+    fila = con.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'citas'").fetchone()
+    if fila is None or "AUTOINCREMENT" in fila[0].upper():
+        return
+    with con:
+        con.execute(TABLA_CITAS.format(tabla="citas_migracion"))
+        con.execute("INSERT INTO citas_migracion SELECT id, semana, dia, hora_inicio, hora_fin, "
+                    "paciente, paciente_norm, agenda, dni FROM citas")
+        con.execute("DROP TABLE citas")
+        con.execute("ALTER TABLE citas_migracion RENAME TO citas")
+
+
+def _importar_json_inicial(con):
+    """Si la base está vacía, carga las citas del JSON existente (migración desde el formato antiguo)"""
+    if con.execute("SELECT 1 FROM citas LIMIT 1").fetchone() or not os.path.exists(RUTA_JSON):
+        return
+    try:
+        with open(RUTA_JSON, "r", encoding="utf-8") as f:
+            citas = json.load(f)
+    except ValueError:
+        return
+    with con:
+        for cita in citas:
+            _insertar(con, cita)
+    print(f"📥 {len(citas)} citas importadas desde {os.path.basename(RUTA_JSON)}")
+
+
+def _fila(fila):
+    return {campo: fila[campo] for campo in CAMPOS}
+
+
+def _insertar(con, cita):
+    paciente = cita["paciente"]
+    cursor = con.execute(
+        "INSERT INTO citas (semana, dia, hora_inicio, hora_fin, paciente, paciente_norm, agenda, dni) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (cita.get("semana"), cita["dia"], cita["hora_inicio"], cita["hora_fin"], paciente,
+         normalizar_nombre(paciente), str(cita.get("agenda", "1")), normalizar_dni(cita.get("dni"))),
+    )
+    _indexar_tokens(con, cursor.lastrowid, paciente)
+    return cursor.lastrowid
+
+
+def _indexar_tokens(con, cita_id, paciente):
+    con.execute("DELETE FROM citas_tokens WHERE cita_id = ?", (cita_id,))
+    con.executemany(
+        "INSERT OR IGNORE INTO citas_tokens (token, cita_id) VALUES (?, ?)",
+        [(token, cita_id) for token in set(normalizar_nombre(paciente).split())],
+    )
+
+
+def _clave(cita):
+    """Clave natural de una cita: día, hora de inicio, agenda y paciente"""
+    return (cita["dia"], cita["hora_inicio"], str(cita["agenda"] if cita["agenda"] is not None else "1"),
+            normalizar_nombre(cita["paciente"]))
+
+
+def reemplazar_citas(citas):
+    """Deja la base igual que una extracción completa en una sola transacción
+
+    Las citas se casan por su clave natural (día, hora, agenda y paciente): las que ya existían
+    conservan su id y solo se actualizan, las nuevas se insertan y las que no aparecen se borran.
+    Los DNI ya asociados a un paciente se conservan para las citas nuevas del mismo paciente.
+    """
+    con = conexion()
+    with con:
+        existentes = {}
+        dnis = {}
+        for fila in con.execute("SELECT * FROM citas ORDER BY id"):
+            existentes.setdefault(_clave(fila), []).append(fila)
+            if fila["dni"]:
+                dnis.setdefault(fila["paciente_norm"], fila["dni"])
+        for cita in citas:
+            cita = dict(cita, agenda=cita.get("agenda", "1"))
+            previas = existentes.get(_clave(cita))
+            dni = normalizar_dni(cita.get("dni"))
+            if not previas:
+                _insertar(con, dict(cita, dni=dni or dnis.get(normalizar_nombre(cita["paciente"]))))
+                continue
+            fila = previas.pop(0)
+            nueva = (cita.get("semana"), cita["hora_fin"], cita["paciente"], dni or fila["dni"])
+            if nueva != (fila["semana"], fila["hora_fin"], fila["paciente"], fila["dni"]):
+                con.execute("UPDATE citas SET semana = ?, hora_fin = ?, paciente = ?, dni = ? WHERE id = ?",
+                            (*nueva, fila["id"]))
+                if cita["paciente"] != fila["paciente"]:
+                    _indexar_tokens(con, fila["id"], cita["paciente"])
+        # Los tokens de las citas borradas se van en cascada
+        con.executemany("DELETE FROM citas WHERE id = ?",
+                        [(fila["id"],) for filas in existentes.values() for fila in filas])
+
+
+def todas_las_citas(desde=None):
+    """Citas ordenadas por día y hora, opcionalmente a partir de un día (YYYY-MM-DD)"""
+    consulta = "SELECT * FROM citas"
+    parametros = ()
+    if desde:
+        consulta += " WHERE dia >= ?"
+        parametros = (desde,)
+    filas = conexion().execute(consulta + " ORDER BY dia, hora_inicio, agenda", parametros)
+    return [_fila(f) for f in filas]
+
+
+def citas_del_dia(dia, agenda=None):
+    """Citas de un día (YYYY-MM-DD), opcionalmente de una sola agenda"""
+    if agenda is None:
+        filas = conexion().execute(
+            "SELECT * FROM citas WHERE dia = ? ORDER BY hora_inicio", (dia,))
+    else:
+        filas = conexion().execute(
+            "SELECT * FROM citas WHERE dia = ? AND agenda = ? ORDER BY hora_inicio", (dia, str(agenda)))
+    return [_fila(f) for f in filas]
+
+
+def citas_entre(desde, hasta):
+    """Citas entre dos días (YYYY-MM-DD, ambos incluidos) ordenadas por día, agenda y hora"""
+    filas = conexion().execute(
+        "SELECT * FROM citas WHERE dia BETWEEN ? AND ? ORDER BY dia, agenda, hora_inicio", (desde, hasta))
+    return [_fila(f) for f in filas]
+
+
+def obtener_cita(cita_id):
+    fila = conexion().execute("SELECT * FROM citas WHERE id = ?", (cita_id,)).fetchone()
+    return _fila(fila) if fila else None
+
+
+def buscar_por_dni(dni):
+    filas = conexion().execute(
+        "SELECT * FROM citas WHERE dni = ? ORDER BY dia, hora_inicio", (normalizar_dni(dni),))
+    return [_fila(f) for f in filas]
+
+
+def buscar_por_paciente(nombre, dni=None):
+    """Citas de un paciente por DNI o, si no hay ninguna asociada, por todas las palabras de su nombre
+
+    El orden de nombre y apellidos no importa. Si se indica el DNI, queda asociado a las citas
+    encontradas por nombre para que las siguientes búsquedas vayan directas al índice.
+    """
+    if dni:
+        citas = buscar_por_dni(dni)
+        if citas:
+            return citas
+    tokens = sorted(set(normalizar_nombre(nombre).split()))
+    if not tokens:
+        return []
+    marcas = ", ".join("?" for _ in tokens)
+    con = conexion()
+    filas = con.execute(
+        f"SELECT c.* FROM citas c JOIN ("
+        f"  SELECT cita_id FROM citas_tokens WHERE token IN ({marcas})"
+        f"  GROUP BY cita_id HAVING COUNT(*) = ?"
+        f") t ON t.cita_id = c.id ORDER BY c.dia, c.hora_inicio",
+        (*tokens, len(tokens)),
+    ).fetchall()
+    citas = [_fila(f) for f in filas]
+    if dni and citas:
+        with con:
+            con.executemany("UPDATE citas SET dni = ? WHERE id = ?",
+                            [(normalizar_dni(dni), c["id"]) for c in citas])
+        for cita in citas:
+            cita["dni"] = normalizar_dni(dni)
+    return citas
+
+
+def insertar_cita(dia, hora_inicio, hora_fin, paciente, agenda="1", dni=None, semana=None):
+    """Añade una cita y devuelve su id"""
+    if semana is None:
+        hoy = datetime.now().date()
+        lunes_actual = hoy.toordinal() - hoy.weekday()
+        semana = (datetime.strptime(dia, "%Y-%m-%d").date().toordinal() - lunes_actual) // 7 + 1
+    con = conexion()
+    with con:
+        return _insertar(con, {
+            "semana": semana, "dia": dia, "hora_inicio": hora_inicio, "hora_fin": hora_fin,
+            "paciente": paciente, "agenda": agenda, "dni": dni,
+        })
+
+
+def actualizar_cita(cita_id, **campos):
+    """Modifica los campos indicados de una cita; devuelve False si no existe"""
+    campos = {k: v for k, v in campos.items() if k in CAMPOS and k != "id"}
+    if "agenda" in campos:
+        campos["agenda"] = str(campos["agenda"])
+    if "dni" in campos:
+        campos["dni"] = normalizar_dni(campos["dni"])
+    if "paciente" in campos:
+        campos["paciente_norm"] = normalizar_nombre(campos["paciente"])
+    if not campos:
+        return obtener_cita(cita_id) is not None
+    con = conexion()
+    with con:
+        asignaciones = ", ".join(f"{k} = ?" for k in campos)
+        cursor = con.execute(f"UPDATE citas SET {asignaciones} WHERE id = ?", (*campos.values(), cita_id))
+        if cursor.rowcount and "paciente" in campos:
+            _indexar_tokens(con, cita_id, campos["paciente"])
+    return cursor.rowcount > 0
+
+
+def eliminar_cita(cita_id):
+    """Borra una cita; devuelve False si no existía"""
+    con = conexion()
+    with con:
+        cursor = con.execute("DELETE FROM citas WHERE id = ?", (cita_id,))
+    return cursor.rowcount > 0
@@ -0,0 +1,190 @@
+from contextlib import contextmanager
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# fsync tras cada escritura completa; con "0" se confía en el sistema operativo (más rápido)
+FSYNC = os.getenv("ALMACENAMIENTO_FSYNC", "1") == "1"
+
+_bloqueos = {}
+_bloqueos_guardia = threading.Lock()
+
+
+def _bloqueo_local(ruta):
+    with _bloqueos_guardia:
+        return _bloqueos.setdefault(ruta, [threading.RLock(), 0, None])
+
+
+@contextmanager
+def bloqueo_archivo(ruta):
+    """Bloqueo exclusivo sobre `ruta` entre hilos y procesos (mediante `ruta.lock`)
+
+    Es reentrante dentro del mismo hilo, así que una función que ya tiene el bloqueo
+    puede llamar a otra que también lo pida.
+    """
+    ruta = os.path.abspath(ruta)
+    estado = _bloqueo_local(ruta)
+    with estado[0]:
+        if estado[1] == 0:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            descriptor = open(ruta + ".lock", "a+b")
+            try:
+                if fcntl:
+                    fcntl.flock(descriptor.fileno(), fcntl.LOCK_EX)
+                else:
+                    descriptor.seek(0)
+                    while True:
+                        try:
+                            msvcrt.locking(descriptor.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+            except Exception:
+                descriptor.close()
+                raise
+            estado[2] = descriptor
+        estado[1] += 1
+        try:
+            yield
+        finally:
+            estado[1] -= 1
+            if estado[1] == 0:
+                descriptor, estado[2] = estado[2], None
+                try:
+                    if fcntl:
+                        fcntl.flock(descriptor.fileno(), fcntl.LOCK_UN)
+                    else:
+                        descriptor.seek(0)
+                        msvcrt.locking(descriptor.fileno(), msvcrt.LK_UNLCK, 1)
+                finally:
+                    descriptor.close()
+
+
+def _fsync_directorio(carpeta):
+    if not fcntl:
+        return
+    descriptor = os.open(carpeta, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def escribir_atomico(ruta, contenido, fsync=None, modo=0o644):
+    """Escribe un archivo completo en un temporal y lo renombra, de modo que nunca quede a medias
+
+    Args:
+        ruta (str): Archivo de destino
+        contenido (str | bytes): Contenido completo del archivo
+        fsync (bool): Forzar el volcado a disco antes de renombrar (por defecto ALMACENAMIENTO_FSYNC)
+        modo (int): Permisos del archivo final
+    """
+    fsync = FSYNC if fsync is None else fsync
+    ruta = os.path.abspath(ruta)
+    carpeta = os.path.dirname(ruta)
+    os.makedirs(carpeta, exist_ok=True)
+    binario = isinstance(contenido, bytes)
+    descriptor, temporal = tempfile.mkstemp(prefix=os.path.basename(ruta) + ".", suffix=".tmp", dir=carpeta)
+    try:
+        with os.fdopen(descriptor, "wb" if binario else "w", **({} if binario else {"encoding": "utf-8"})) as f:
+            f.write(contenido)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.chmod(temporal, modo)
+        os.replace(temporal, ruta)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except FileNotFoundError:
+            pass
+        raise
+    if fsync:
+        _fsync_directorio(carpeta)
+
+
+def leer_json(ruta, por_defecto=None):
+    """Lee un JSON; devuelve `por_defecto` si no existe o está vacío/corrupto"""
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return por_defecto
+
+
+def guardar_json(ruta, datos, fsync=None, modo=0o644):
+    """Guarda un JSON de forma atómica y con bloqueo"""
+    contenido = json.dumps(datos, indent=2, ensure_ascii=False)
+    with bloqueo_archivo(ruta):
+        escribir_atomico(ruta, contenido, fsync=fsync, modo=modo)
+
+
+def modificar_json(ruta, funcion, por_defecto=None, fsync=None):
+    """Lee, transforma y vuelve a guardar un JSON sin que otro escritor se cuele en medio
+
+    `funcion` recibe los datos actuales y devuelve los nuevos.
+    """
+    with bloqueo_archivo(ruta):
+        datos = funcion(leer_json(ruta, por_defecto))
+        escribir_atomico(ruta, json.dumps(datos, indent=2, ensure_ascii=False), fsync=fsync)
+        return datos
+
+
+def reescribir_lineas(ruta, filtro, fsync=None):
+    """Reescribe un archivo de texto conservando solo las líneas para las que `filtro` devuelve True"""
+    with bloqueo_archivo(ruta):
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                lineas = [linea for linea in f if filtro(linea.rstrip("\n"))]
+        except FileNotFoundError:
+            return 0
+        escribir_atomico(ruta, "".join(l if l.endswith("\n") else l + "\n" for l in lineas), fsync=fsync)
+        return len(lineas)
+
+
+class RegistroAnexos:
+    """Archivo de registro al que se añaden líneas con bloqueo y fsync agrupado
+
+    Cada línea queda escrita en el sistema operativo al momento (la ven otros lectores),
+    pero el volcado a disco se hace cada `lote` líneas o cada `intervalo` segundos.
+    """
+
+    def __init__(self, ruta, lote=20, intervalo=2.0):
+        self.ruta = os.path.abspath(ruta)
+        self.lote = lote
+        self.intervalo = intervalo
+        self._pendientes = 0
+        self._ultimo_fsync = time.monotonic()
+        atexit.register(self.sincronizar)
+
+    def anexar(self, linea):
+        with bloqueo_archivo(self.ruta):
+            # Se abre en cada escritura: el archivo puede haber sido sustituido por reescribir_lineas
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(linea if linea.endswith("\n") else linea + "\n")
+                f.flush()
+                self._pendientes += 1
+                if FSYNC and (self._pendientes >= self.lote
+                              or time.monotonic() - self._ultimo_fsync >= self.intervalo):
+                    os.fsync(f.fileno())
+                    self._pendientes = 0
+                    self._ultimo_fsync = time.monotonic()
+
+    def sincronizar(self):
+        """Vuelca a disco las líneas pendientes"""
+        if not self._pendientes or not os.path.exists(self.ruta):
+            return
+        with bloqueo_archivo(self.ruta):
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                os.fsync(f.fileno())
+            self._pendientes = 0
+            self._ultimo_fsync = time.monotonic()
@@ -1,24 +1,249 @@
-from fastapi import FastAPI
-import subprocess
+from fastapi import FastAPI, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import date, timedelta
+from disponibilidad import buscar_huecos, disponibilidad
+from trabajos import obtener_gestor
+from extraer_citas import extraer_citas_por_semanas
+from Crear_usuario import crear_paciente, ESIClinicAutomator
+from gestion_citas import validar_reserva, reservar_cita, reservar_lote
+from Reagendar import reagendar_cita, cancelar_cita_por_id
+from almacen_citas import obtener_cita, citas_entre, buscar_por_dni
+from pool_navegadores import obtener_pool
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    # Los navegadores del pool se abren e inician sesión al arrancar, sin bloquear el arranque
+    obtener_pool().calentar_en_segundo_plano()
+    yield
+    obtener_gestor().cerrar()
+    obtener_pool().cerrar()
+
+
+app = FastAPI(lifespan=ciclo_de_vida)
+
+PATRON_HORA = r"^([01]\d|2[0-3]):[0-5]\d$"
+
+
+class PacienteNuevo(BaseModel):
+    nombre: str = Field(min_length=1)
+    apellidos: str = Field(min_length=1)
+    dni: str = Field(min_length=1)
+    movil: str = Field(min_length=1)
+    email: str = Field(min_length=3)
+    fecha_nacimiento: Optional[str] = Field(None, description="DD-MM-YYYY")
+    permitir_email_duplicado: bool = False
+
+
+class CitaNueva(BaseModel):
+    paciente: str = Field(min_length=1, description="DNI (CIF) o correo del paciente")
+    fecha: date
+    hora: str = Field(pattern=PATRON_HORA)
+    agenda: Optional[int] = Field(None, ge=1, le=2)
+    descargar: bool = True
+
+
+class LoteCitas(BaseModel):
+    citas: list[CitaNueva] = Field(min_length=1, max_length=200)
+    descargar: bool = True
+
+
+class CambioCita(BaseModel):
+    fecha: date
+    hora: str = Field(pattern=PATRON_HORA)
+    dni: Optional[str] = None
+    descargar: bool = True
+
+
+def tarea(funcion):
+    """Adapta una operación que devuelve {"ok", "mensaje", ...} a un trabajo que falla si ok es False"""
+    def ejecutar(*args, **kwargs):
+        resultado = funcion(*args, **kwargs)
+        if not resultado["ok"]:
+            raise RuntimeError(resultado["mensaje"] or "La operación no se completó")
+        return resultado
+    return ejecutar
+
+
+def respuesta_trabajo(trabajo):
+    return {"id": trabajo.id, "estado": trabajo.estado}
+
+
+def tarea_extraer_citas(semanas):
+    citas = extraer_citas_por_semanas(semanas=semanas)
+    if citas is None:
+        raise RuntimeError("No se pudieron extraer las citas")
+    return {"citas": len(citas)}
+
+
+def lanzar_extraer_citas(semanas):
+    return obtener_gestor().lanzar("extraer-citas", tarea_extraer_citas, semanas,
+                                   parametros={"semanas": semanas})
+
+
+def lanzar_crear_usuario(datos, permitir_email_duplicado=False):
+    return obtener_gestor().lanzar("crear-usuario", tarea(crear_paciente), datos, permitir_email_duplicado,
+                                   parametros={"dni": datos.get("dni")})
+
+
+def salida_trabajo(trabajo):
+    """Espera a un trabajo y devuelve su salida con el formato de los endpoints antiguos"""
+    trabajo.futuro.result()
+    return {
+        "stdout": "\n".join(trabajo.logs),
+        "stderr": trabajo.error or ""
+    }
+
+
+def datos_paciente(nombre, apellidos, dni, movil, email, fecha_nacimiento):
+    return {
+        "nombre": nombre.strip(),
+        "apellidos": apellidos.strip(),
+        "dni": dni.strip(),
+        "movil": movil.strip(),
+        "email": email.strip().lower(),
+        "fecha_nacimiento": (fecha_nacimiento or "").strip(),
+    }
 
 @app.get("/")
 def home():
     return {"message": "FisioAutomatizacion API online 🚀 (v2)"}
 
+@app.post("/extraer-citas", status_code=202)
+def iniciar_extraer_citas(semanas: int = Query(2, ge=1, le=12)):
+    """Lanza la extracción de citas en segundo plano; el progreso se consulta en /trabajos/{id}"""
+    return respuesta_trabajo(lanzar_extraer_citas(semanas))
+
 @app.get("/extraer-citas")
-def extraer_citas():
-    result = subprocess.run(["python3", "extraer_citas.py"], capture_output=True, text=True)
+def extraer_citas(semanas: int = Query(2, ge=1, le=12)):
+    """Versión bloqueante (compatibilidad): espera turno en la cola de trabajos y devuelve la salida"""
+    return salida_trabajo(lanzar_extraer_citas(semanas))
+
+@app.get("/disponibilidad")
+def consultar_disponibilidad(desde: date = None, hasta: date = None):
+    """Huecos de cada agenda por día, calculados sobre el almacén de citas local"""
+    desde = desde or date.today()
+    hasta = hasta or desde + timedelta(days=13)
+    if hasta < desde or (hasta - desde).days > 92:
+        raise HTTPException(status_code=422, detail="Rango de fechas no válido (máximo 92 días)")
     return {
-        "stdout": result.stdout,
-        "stderr": result.stderr
+        dia: [
+            {
+                "turno": bloque["turno"],
+                "agenda": bloque["agenda"],
+                "inicio": bloque["inicio"],
+                "fin": bloque["fin"],
+                "libres": [hora for hora, libre in bloque["huecos"] if libre],
+                "ocupadas": [hora for hora, libre in bloque["huecos"] if not libre],
+            }
+            for bloque in bloques
+        ]
+        for dia, bloques in disponibilidad(desde, hasta).items()
     }
 
+@app.get("/huecos")
+def proximos_huecos(
+    desde: date = None,
+    hasta: date = None,
+    cantidad: int = Query(5, ge=1, le=100),
+    facultativo: str = None,
+    agenda: int = Query(None, ge=1, le=2),
+    turno: str = Query(None, pattern="^(manana|tarde)$"),
+):
+    """Primeras horas libres a partir de una fecha, filtradas por facultativo, agenda y turno"""
+    if desde and hasta and hasta < desde:
+        raise HTTPException(status_code=422, detail="Rango de fechas no válido")
+    return buscar_huecos(desde, hasta, cantidad, facultativo, agenda, turno)
+
+@app.post("/crear-usuario", status_code=202)
+def iniciar_crear_usuario(nombre: str, apellidos: str, dni: str, movil: str, email: str,
+                          fecha_nacimiento: str = None, permitir_email_duplicado: bool = False):
+    """Lanza la creación de usuario en segundo plano; el progreso se consulta en /trabajos/{id}"""
+    datos = datos_paciente(nombre, apellidos, dni, movil, email, fecha_nacimiento)
+    return respuesta_trabajo(lanzar_crear_usuario(datos, permitir_email_duplicado))
+
 @app.get("/crear-usuario")
-def crear_usuario():
-    result = subprocess.run(["python3", "Crear_usuario.py"], capture_output=True, text=True)
-    return {
-        "stdout": result.stdout,
-        "stderr": result.stderr
-    }
+def crear_usuario(nombre: str, apellidos: str, dni: str, movil: str, email: str,
+                  fecha_nacimiento: str = None, permitir_email_duplicado: bool = False):
+    """Versión bloqueante (compatibilidad): espera turno en la cola de trabajos y devuelve la salida"""
+    datos = datos_paciente(nombre, apellidos, dni, movil, email, fecha_nacimiento)
+    return salida_trabajo(lanzar_crear_usuario(datos, permitir_email_duplicado))
+
+@app.get("/trabajos")
+def listar_trabajos():
+    return [
+        {k: v for k, v in trabajo.a_dict().items() if k != "logs"}
+        for trabajo in obtener_gestor().listar()
+    ]
+
+@app.get("/trabajos/{id_trabajo}")
+def consultar_trabajo(id_trabajo: str, desde_linea: int = Query(0, ge=0)):
+    """Estado, resultado y registro de un trabajo (desde_linea: solo las líneas nuevas)"""
+    trabajo = obtener_gestor().obtener(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo.a_dict(desde_linea)
+
+@app.post("/pacientes", status_code=202)
+def nuevo_paciente(paciente: PacienteNuevo):
+    """Valida y comprueba duplicados al momento; la creación en esiclinic se hace como trabajo"""
+    datos = datos_paciente(paciente.nombre, paciente.apellidos, paciente.dni, paciente.movil,
+                           paciente.email, paciente.fecha_nacimiento)
+    errores = ESIClinicAutomator.validate_patient_data(datos)
+    if errores:
+        raise HTTPException(status_code=422, detail=errores)
+    permitido, mensaje = ESIClinicAutomator.check_excel_duplicates(datos)
+    if not permitido or (mensaje and not paciente.permitir_email_duplicado):
+        raise HTTPException(status_code=409, detail=mensaje)
+    return respuesta_trabajo(lanzar_crear_usuario(datos, paciente.permitir_email_duplicado))
+
+@app.get("/citas")
+def listar_citas(desde: date = None, hasta: date = None, dni: str = None):
+    """Citas del almacén local (con su id) por rango de fechas o por DNI"""
+    if dni:
+        return buscar_por_dni(dni)
+    desde = desde or date.today()
+    hasta = hasta or desde + timedelta(days=13)
+    return citas_entre(desde.isoformat(), hasta.isoformat())
+
+@app.post("/citas", status_code=202)
+def nueva_cita(cita: CitaNueva):
+    """Comprueba paciente y disponibilidad al momento y crea la cita en la agenda como trabajo"""
+    _, errores = validar_reserva(cita.paciente, cita.fecha, cita.hora, cita.agenda)
+    if errores:
+        raise HTTPException(status_code=422, detail=errores)
+    trabajo = obtener_gestor().lanzar("crear-cita", tarea(reservar_cita), cita.paciente, cita.fecha, cita.hora,
+                                      cita.agenda, cita.descargar, parametros=cita.model_dump(mode="json"))
+    return respuesta_trabajo(trabajo)
+
+@app.post("/citas/lote", status_code=202)
+def nuevas_citas(lote: LoteCitas):
+    """Reserva varias citas seguidas en una sola sesión; el resultado de cada una queda en el trabajo"""
+    entradas = [
+        {"paciente": cita.paciente, "fecha": cita.fecha.isoformat(), "hora": cita.hora, "agenda": cita.agenda}
+        for cita in lote.citas
+    ]
+    trabajo = obtener_gestor().lanzar("crear-citas-lote", reservar_lote, entradas, lote.descargar,
+                                      parametros={"citas": len(entradas)})
+    return respuesta_trabajo(trabajo)
+
+@app.patch("/citas/{cita_id}", status_code=202)
+def cambiar_cita(cita_id: int, cambio: CambioCita):
+    """Reagenda una cita del almacén (ids de GET /citas) como trabajo"""
+    if obtener_cita(cita_id) is None:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    trabajo = obtener_gestor().lanzar("reagendar-cita", tarea(reagendar_cita), cita_id, cambio.fecha, cambio.hora,
+                                      cambio.dni, cambio.descargar,
+                                      parametros=dict(cambio.model_dump(mode="json"), id=cita_id))
+    return respuesta_trabajo(trabajo)
+
+@app.delete("/citas/{cita_id}", status_code=202)
+def borrar_cita(cita_id: int, dni: str = None, descargar: bool = True):
+    """Cancela una cita del almacén (ids de GET /citas) como trabajo"""
+    if obtener_cita(cita_id) is None:
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    trabajo = obtener_gestor().lanzar("cancelar-cita", tarea(cancelar_cita_por_id), cita_id, dni, descargar,
+                                      parametros={"id": cita_id, "dni": dni})
+    return respuesta_trabajo(trabajo)
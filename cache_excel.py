@@ -0,0 +1,137 @@
+import io
+import os
+import pandas as pd
+from almacenamiento import bloqueo_archivo, escribir_atomico
+
+# Cada exportación se lee una sola vez y se guarda como DataFrame tipado junto al archivo original.
+# Las columnas derivadas empiezan por "_" (no se suben a Google Sheets):
+#   _fecha     -> columna "Fecha" ya convertida a datetime
+#   _telefono  -> "Móvil" (o "Teléfono") normalizado a formato internacional
+EXTENSION_CACHE = ".cache.pkl"
+
+
+def normalizar_telefono(numero):
+    """Normaliza números de teléfono al formato internacional"""
+    if pd.isna(numero):
+        return None
+    numero = str(numero).strip().replace(" ", "").replace("-", "")
+    if numero.endswith(".0"):  # Números leídos como float desde Excel
+        numero = numero[:-2]
+    if not numero.startswith("+"):
+        if len(numero) == 9 and numero[0] in ['6','7']:
+            return "+34" + numero
+        return None
+    return numero
+
+
+def ruta_cache(ruta, nombre=None):
+    """Ruta de la caché de una exportación: mismo nombre y carpeta, o `nombre` si se indica"""
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    base = nombre or os.path.splitext(os.path.basename(ruta))[0]
+    return os.path.join(carpeta, base + EXTENSION_CACHE)
+
+
+def detectar_formato(cabecera):
+    """Formato real de una exportación a partir de sus primeros bytes: "xlsx", "xls" o "html"
+
+    esiclinic sirve a veces tablas HTML con extensión .xls, así que la extensión no es fiable.
+    """
+    if cabecera.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    if cabecera.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "xls"
+    texto = cabecera.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if texto.startswith(b"<") or b"<table" in texto:
+        return "html"
+    raise ValueError("Formato de exportación desconocido")
+
+
+def exportacion_mas_reciente(carpeta):
+    """Exportación más reciente de una carpeta, reconocida por su contenido y no por su nombre
+
+    Las descargas por HTTP toman el nombre que indica el servidor, que puede no acabar en .xls.
+
+    Returns:
+        str: Ruta del archivo, o None si no hay ninguna
+    """
+    candidatas = []
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        if nombre.startswith("~$") or nombre.endswith((EXTENSION_CACHE, ".part", ".crdownload", ".tmp")):
+            continue
+        try:
+            with open(ruta, "rb") as f:
+                detectar_formato(f.read(2048))
+        except (OSError, ValueError):
+            continue
+        candidatas.append(ruta)
+    return max(candidatas, key=os.path.getmtime, default=None)
+
+
+def leer_exportacion(ruta):
+    """Lee una exportación de esiclinic con el motor adecuado al primer intento"""
+    with open(ruta, "rb") as f:
+        formato = detectar_formato(f.read(2048))
+    if formato == "xlsx":
+        return pd.read_excel(ruta, engine="openpyxl")
+    if formato == "xls":
+        return pd.read_excel(ruta, engine="xlrd")
+    with open(ruta, "rb") as f:
+        tablas = pd.read_html(io.BytesIO(f.read()), thousands=None)
+    # La tabla de datos es la más grande de la página
+    return max(tablas, key=len)
+
+
+def preparar_tabla(df):
+    """Añade las columnas derivadas tipadas a una exportación recién leída"""
+    df = df.copy()
+    if "Fecha" in df.columns:
+        df["_fecha"] = pd.to_datetime(df["Fecha"], dayfirst=True, errors="coerce")
+    telefonos = [c for c in ("Móvil", "Teléfono") if c in df.columns]
+    if telefonos:
+        telefono = df[telefonos[0]]
+        for columna in telefonos[1:]:
+            telefono = telefono.where(telefono.notna(), df[columna])
+        df["_telefono"] = telefono.map(normalizar_telefono)
+    return df
+
+
+def _a_bytes(df):
+    buffer = io.BytesIO()
+    df.to_pickle(buffer)
+    return buffer.getvalue()
+
+
+def cachear_exportacion(ruta, nombre=None):
+    """Lee una exportación de esiclinic y guarda su caché tipada; devuelve el DataFrame"""
+    df = preparar_tabla(leer_exportacion(ruta))
+    destino = ruta_cache(ruta, nombre)
+    with bloqueo_archivo(destino):
+        escribir_atomico(destino, _a_bytes(df), fsync=False)
+    print(f"🗃️ Caché de {os.path.basename(ruta)} actualizada: {os.path.basename(destino)}")
+    return df
+
+
+def actualizar_cache(ruta, nombre=None):
+    """Garantiza que la caché de `ruta` está al día y devuelve su ruta
+
+    Si el archivo original ya no existe (p. ej. se borró tras descargar uno nuevo),
+    se usa la última caché disponible.
+    """
+    destino = ruta_cache(ruta, nombre)
+    if os.path.exists(ruta) and (not os.path.exists(destino)
+                                 or os.path.getmtime(ruta) > os.path.getmtime(destino)):
+        cachear_exportacion(ruta, nombre)
+    if not os.path.exists(destino):
+        raise FileNotFoundError(f"No existe {ruta} ni su caché")
+    return destino
+
+
+def cargar_tabla(ruta, nombre=None):
+    """DataFrame de una exportación desde su caché, creándola si hace falta"""
+    return pd.read_pickle(actualizar_cache(ruta, nombre))
+
+
+def columnas_originales(df):
+    """Quita las columnas derivadas para mostrar o subir la tabla tal cual vino de esiclinic"""
+    return df[[c for c in df.columns if not str(c).startswith("_")]]
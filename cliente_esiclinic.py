@@ -0,0 +1,204 @@
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from dotenv import load_dotenv
+import os
+import re
+import requests
+from sesion_esiclinic import cargar_cookies, sesion_http, sesion_http_valida, iniciar_sesion
+
+# Configuración común
+load_dotenv("env/.env")
+URL_LISTADO_CITAS = "https://app.esiclinic.com/listadodecitas.php"
+URL_PACIENTES = "https://app.esiclinic.com/pacientes.php"
+TAMANO_BLOQUE = 64 * 1024
+
+
+class SesionCaducada(Exception):
+    """La respuesta de esiclinic es la página de login en lugar de los datos pedidos"""
+
+
+class _FormularioExportacion(HTMLParser):
+    """Extrae de la página el formulario que envía el botón `bt_excel`"""
+
+    def __init__(self):
+        super().__init__()
+        self.formularios = []
+        self._actual = None
+        self._select = None
+        self.enlace_excel = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self._actual = {
+                "action": attrs.get("action") or "",
+                "method": (attrs.get("method") or "get").lower(),
+                "campos": [],
+                "ids": {},
+                "exporta": False,
+            }
+            self.formularios.append(self._actual)
+            return
+
+        if attrs.get("id") == "bt_excel":
+            if self._actual is None:
+                if tag == "a" and not (attrs.get("href") or "#").startswith(("#", "javascript")):
+                    self.enlace_excel = attrs["href"]
+                return
+            self._actual["exporta"] = True
+            if attrs.get("formaction"):
+                self._actual["action"] = attrs["formaction"]
+            if attrs.get("name"):
+                self._actual["campos"].append([attrs["name"], attrs.get("value", "")])
+            return
+
+        if self._actual is None:
+            return
+        nombre = attrs.get("name")
+        if tag == "input" and nombre:
+            tipo = (attrs.get("type") or "text").lower()
+            if tipo in ("submit", "button", "image", "reset", "file"):
+                return
+            if tipo in ("checkbox", "radio") and "checked" not in attrs:
+                return
+            self._agregar(nombre, attrs.get("value", ""), attrs.get("id"))
+        elif tag == "textarea" and nombre:
+            self._agregar(nombre, "", attrs.get("id"))
+        elif tag == "select" and nombre:
+            self._select = {"nombre": nombre, "id": attrs.get("id"), "valor": None, "primero": None}
+        elif tag == "option" and self._select is not None:
+            valor = attrs.get("value", "")
+            if self._select["primero"] is None:
+                self._select["primero"] = valor
+            if "selected" in attrs:
+                self._select["valor"] = valor
+
+    def handle_endtag(self, tag):
+        if tag == "select" and self._select is not None:
+            valor = self._select["valor"]
+            if valor is None:
+                valor = self._select["primero"] or ""
+            self._agregar(self._select["nombre"], valor, self._select["id"])
+            self._select = None
+        elif tag == "form":
+            self._actual = None
+
+    def _agregar(self, nombre, valor, id_campo):
+        self._actual["campos"].append([nombre, valor])
+        if id_campo:
+            self._actual["ids"][id_campo] = nombre
+
+    def formulario_excel(self):
+        for formulario in self.formularios:
+            if formulario["exporta"]:
+                return formulario
+        return None
+
+
+def _nombre_archivo(respuesta, por_defecto):
+    """Obtiene el nombre del archivo de la cabecera Content-Disposition"""
+    cabecera = respuesta.headers.get("Content-Disposition", "")
+    coincidencia = re.search(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?', cabecera)
+    if coincidencia:
+        return os.path.basename(coincidencia.group(1).strip())
+    return por_defecto
+
+
+class ClienteEsiclinic:
+    """Cliente HTTP de esiclinic que reutiliza las cookies de la sesión guardada"""
+
+    def __init__(self):
+        self.sesion = None
+
+    def conectar(self):
+        """Abre la sesión HTTP; si las cookies guardadas no valen, inicia sesión con un navegador del pool"""
+        sesion = sesion_http(cargar_cookies())
+        if not sesion_http_valida(sesion):
+            print("🔑 Sin sesión válida, iniciando sesión con el navegador una sola vez...")
+            from pool_navegadores import prestar_navegador
+            with prestar_navegador() as driver:
+                if not iniciar_sesion(driver):
+                    raise SesionCaducada("No se pudo iniciar sesión en esiclinic")
+            sesion = sesion_http(cargar_cookies())
+            if not sesion_http_valida(sesion):
+                raise SesionCaducada("La sesión recién iniciada no es válida para peticiones HTTP")
+        self.sesion = sesion
+        return self
+
+    def _pagina(self, url):
+        respuesta = self.sesion.get(url, timeout=30)
+        respuesta.raise_for_status()
+        if "esi_pass" in respuesta.text:
+            raise SesionCaducada("La sesión de esiclinic ha caducado")
+        return respuesta
+
+    def exportar_excel(self, url_pagina, valores, carpeta, nombre_por_defecto):
+        """Reproduce el envío del botón `bt_excel` de una página y guarda el archivo en disco
+
+        Args:
+            url_pagina (str): Página de esiclinic que contiene el botón de exportación
+            valores (dict): Valores a fijar en el formulario, por id de campo (p. ej. "fecha")
+            carpeta (str): Carpeta de destino
+            nombre_por_defecto (str): Nombre a usar si el servidor no indica ninguno
+        Returns:
+            str: Ruta del archivo descargado
+        """
+        if self.sesion is None:
+            self.conectar()
+        pagina = self._pagina(url_pagina)
+        parser = _FormularioExportacion()
+        parser.feed(pagina.text)
+        formulario = parser.formulario_excel()
+
+        if formulario is not None:
+            campos = formulario["campos"]
+            for id_campo, valor in valores.items():
+                nombre = formulario["ids"].get(id_campo, id_campo)
+                campos = [c for c in campos if c[0] != nombre] + [[nombre, valor]]
+            destino = urljoin(pagina.url, formulario["action"] or pagina.url)
+            if formulario["method"] == "post":
+                respuesta = self.sesion.post(destino, data=campos, stream=True, timeout=120)
+            else:
+                respuesta = self.sesion.get(destino, params=campos, stream=True, timeout=120)
+        elif parser.enlace_excel:
+            destino = urljoin(pagina.url, parser.enlace_excel)
+            respuesta = self.sesion.get(destino, params=valores, stream=True, timeout=120)
+        else:
+            raise ValueError(f"No se encontró la petición de exportación en {url_pagina}")
+
+        with respuesta:
+            respuesta.raise_for_status()
+            tipo = respuesta.headers.get("Content-Type", "")
+            if "Content-Disposition" not in respuesta.headers and "text/html" in tipo:
+                raise SesionCaducada("esiclinic devolvió una página HTML en lugar del Excel")
+            os.makedirs(carpeta, exist_ok=True)
+            ruta = os.path.join(carpeta, _nombre_archivo(respuesta, nombre_por_defecto))
+            temporal = ruta + ".part"
+            with open(temporal, "wb") as f:
+                for bloque in respuesta.iter_content(TAMANO_BLOQUE):
+                    f.write(bloque)
+            os.replace(temporal, ruta)
+        print(f"⬇️ Exportación descargada por HTTP: {ruta}")
+        return ruta
+
+    def descargar_listado_citas(self, fecha_desde, fecha_hasta, carpeta="data"):
+        """Descarga el listado de citas entre dos fechas (formato DD-MM-YYYY)"""
+        return self.exportar_excel(
+            URL_LISTADO_CITAS,
+            {"fecha": fecha_desde, "fecha2": fecha_hasta},
+            carpeta,
+            "listadodecitas.xls",
+        )
+
+    def descargar_pacientes(self, carpeta="data/clientes"):
+        """Descarga el listado completo de pacientes"""
+        return self.exportar_excel(URL_PACIENTES, {}, carpeta, "pacientes.xls")
+
+
+def descargar_por_http(funcion, *args, **kwargs):
+    """Ejecuta una descarga HTTP y devuelve la ruta, o None si hay que recurrir al navegador"""
+    try:
+        return funcion(ClienteEsiclinic().conectar(), *args, **kwargs)
+    except (SesionCaducada, ValueError, requests.RequestException) as e:
+        print(f"⚠️ Descarga HTTP no disponible ({str(e)}), usando el navegador...")
+        return None
@@ -1,16 +1,16 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 from datetime import datetime, timedelta
 import os
-import time
 import traceback
 from dotenv import load_dotenv
 from google_sheets import subir_a_google_sheets
+from pool_navegadores import obtener_pool, fijar_carpeta_descargas
+from sesion_esiclinic import iniciar_sesion
+from cliente_esiclinic import ClienteEsiclinic, descargar_por_http
+from esperas import esperar_red_inactiva, esperar_descarga, intentar
 # Cargar variables de entorno
 load_dotenv("env/.env")
 def eliminar_excel_antiguo():
@@ -22,56 +22,34 @@ def eliminar_excel_antiguo():
                 print(f"Archivo antiguo eliminado: {filename}")
             except Exception as e:
                 print(f"No se pudo eliminar el archivo {filename}: {str(e)}")
-def convertir_a_xlsx(ruta_archivo):
-    """Convierte el archivo a formato .xlsx si es necesario"""
-    if ruta_archivo.endswith('.xls'):
-        nuevo_nombre = ruta_archivo.replace('.xls', '.xlsx')
-        os.rename(ruta_archivo, nuevo_nombre)
-        print(f"Archivo convertido a XLSX: {nuevo_nombre}")
-        return nuevo_nombre
-    return ruta_archivo
+def rango_fechas():
+    """Devuelve el rango de fechas del listado (hoy y dentro de 30 días) en formato DD-MM-YYYY"""
+    fecha_hoy = datetime.now().strftime("%d-%m-%Y")
+    fecha_fin = (datetime.now() + timedelta(days=30)).strftime("%d-%m-%Y")
+    return fecha_hoy, fecha_fin
 def descargar_excel():
     """Descarga el Excel de esiclinic y lo sube a Google Sheets"""
     eliminar_excel_antiguo()
-    # Configuración de Chrome
-    options = webdriver.ChromeOptions()
-    options.add_experimental_option("prefs", {
-        "download.default_directory": os.path.abspath("data"),
-        "download.prompt_for_download": False,
-        "download.directory_upgrade": True,
-        "safebrowsing.enabled": False,
-    })
-    options.add_argument("--start-maximized")
-    options.add_argument("--disable-notifications")
-    driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()),
-        options=options
-    )
+    # Camino rápido: petición HTTP directa con la sesión guardada, sin navegador
+    archivo_descargado = descargar_por_http(ClienteEsiclinic.descargar_listado_citas, *rango_fechas())
+    if archivo_descargado:
+        return subir_a_google_sheets(archivo_descargado, os.getenv("NOMBRE_HOJA"))
+    return descargar_excel_navegador()
+def descargar_excel_navegador():
+    """Descarga el Excel pulsando el botón de exportación en el navegador"""
+    # Navegador prestado por el pool compartido
+    pool = obtener_pool()
+    driver = pool.obtener()
     try:
+        fijar_carpeta_descargas(driver, "data")
         # 1. Acceso e inicio de sesión
-        driver.get("https://esiclinic.com/")
-        print("Accediendo a esiclinic.com...")
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.ID, "esi_user"))
-        ).send_keys(os.getenv("USUARIO_ESICLINIC"))
-        driver.find_element(By.ID, "esi_pass").send_keys(os.getenv("PASSWORD_ESICLINIC"))
-        login_button = WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.ID, "bt_acceder"))
-        )
-        try:
-            login_button.click()
-        except:
-            driver.execute_script("arguments[0].click();", login_button)
-        print("Credenciales enviadas, iniciando sesión...")
-        # 2. Esperar login exitoso
-        WebDriverWait(driver, 15).until(EC.url_contains("agenda.php"))
-        print("Login exitoso")
-        # 3. Navegar a listado de citas
+        if not iniciar_sesion(driver):
+            raise RuntimeError("No se pudo iniciar sesión en esiclinic")
+        # 2. Navegar a listado de citas
         driver.get("https://app.esiclinic.com/listadodecitas.php")
         print("Navegación a Listado de Citas completada")
-        # 4. Configurar fechas
-        fecha_hoy = datetime.now().strftime("%d-%m-%Y")
-        fecha_manana = (datetime.now() + timedelta(days=30)).strftime("%d-%m-%Y")
+        # 3. Configurar fechas
+        fecha_hoy, fecha_manana = rango_fechas()
         def set_fecha(field_id, value):
             field = WebDriverWait(driver, 10).until(
                 EC.element_to_be_clickable((By.ID, field_id))
@@ -83,30 +61,24 @@ def descargar_excel():
             print(f"Fecha {field_id} actualizada a {value}")
         set_fecha("fecha", fecha_hoy)
         set_fecha("fecha2", fecha_manana)
-        # 5. Descargar Excel
-        print("Esperando 10 segundos para la carga de datos...")
-        time.sleep(10)
+        # 4. Descargar Excel
+        print("Esperando a que carguen los datos...")
+        intentar(esperar_red_inactiva, driver, 1, 30)
         download_button = WebDriverWait(driver, 10).until(
             EC.element_to_be_clickable((By.ID, "bt_excel"))
         )
+        antes = os.listdir("data")
         download_button.click()
         print("Descargando Excel...")
-        # 6. Esperar descarga
-        max_espera = 60
-        archivo_descargado = None
-        for _ in range(max_espera):
-            archivos = [f for f in os.listdir("data") if f.endswith('.xls') and not f.startswith('~$')]
-            if archivos:
-                archivo_descargado = os.path.join("data", archivos[0])
-                archivo_descargado = convertir_a_xlsx(archivo_descargado)
-                print(f"Archivo descargado: {archivo_descargado}")
-                break
-            time.sleep(1)
+        # 5. Esperar descarga
+        archivo_descargado = esperar_descarga("data", ('.xls',), antes, timeout=60)
+        if archivo_descargado:
+            print(f"Archivo descargado: {archivo_descargado}")
         else:
             print("No se detectó el archivo descargado")
             driver.save_screenshot("error_descarga.png")
             return False
-        # 7. Subir a Google Sheets
+        # 6. Subir a Google Sheets
         if not subir_a_google_sheets(archivo_descargado, os.getenv("NOMBRE_HOJA")):
             return False
         return True
@@ -117,8 +89,8 @@ def descargar_excel():
         driver.save_screenshot(f"error_{timestamp}.png")
         return False
     finally:
-        driver.quit()
-        print("Navegador cerrado")
+        pool.devolver(driver)
+        print("Navegador devuelto al pool")
 if __name__ == "__main__":
     if descargar_excel():
         print("Proceso completado con éxito")
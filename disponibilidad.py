@@ -0,0 +1,173 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from almacen_citas import citas_entre
+from reglas_horario import REGLAS, a_fecha, a_minutos
+
+DURACION_CITA = REGLAS.duracion_cita  # minutos
+
+
+def a_hora(minutos):
+    """Minutos desde medianoche -> 'HH:MM'"""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def horarios_del_dia(fecha):
+    """Franjas de cada turno y agenda para un día: {turno: {"primaria": (ini, fin), "secundaria": (ini, fin) | None}}"""
+    return REGLAS.horarios_del_dia(fecha)
+
+
+class IndiceOcupacion:
+    """Intervalos ocupados por (día, agenda), ordenados por inicio para consultas en O(log n)
+
+    Para cada agenda y día guarda los inicios ordenados y el máximo acumulado de los finales:
+    un hueco [ini, fin) está ocupado si alguna cita que empieza antes de `fin` termina después de `ini`.
+    """
+
+    def __init__(self, citas=()):
+        intervalos = {}
+        for cita in citas:
+            clave = (cita["dia"], str(cita.get("agenda", "1")))
+            intervalos.setdefault(clave, []).append((a_minutos(cita["hora_inicio"]), a_minutos(cita["hora_fin"])))
+        self._indice = {}
+        for clave, lista in intervalos.items():
+            lista.sort()
+            inicios = [inicio for inicio, _ in lista]
+            max_fin = []
+            maximo = -1
+            for _, fin in lista:
+                maximo = max(maximo, fin)
+                max_fin.append(maximo)
+            self._indice[clave] = (inicios, max_fin)
+
+    @classmethod
+    def desde_almacen(cls, desde, hasta):
+        """Construye el índice con las citas del almacén entre dos fechas"""
+        return cls(citas_entre(a_fecha(desde).isoformat(), a_fecha(hasta).isoformat()))
+
+    def ocupado(self, dia, agenda, inicio, fin):
+        """Indica si el hueco [inicio, fin) (en minutos) se solapa con alguna cita"""
+        entrada = self._indice.get((dia, str(agenda)))
+        if entrada is None:
+            return False
+        inicios, max_fin = entrada
+        posicion = bisect_left(inicios, fin) - 1
+        return posicion >= 0 and max_fin[posicion] > inicio
+
+    def huecos(self, dia, agenda, franja, duracion=DURACION_CITA):
+        """Lista [(hora, libre)] de los huecos de una franja ('HH:MM', 'HH:MM')"""
+        inicio, fin = a_minutos(franja[0]), a_minutos(franja[1])
+        return [
+            (a_hora(minuto), not self.ocupado(dia, agenda, minuto, minuto + duracion))
+            for minuto in range(inicio, fin - duracion + 1, duracion)
+        ]
+
+
+def disponibilidad_dia(fecha, indice, duracion=DURACION_CITA):
+    """Bloques de huecos de un día, con la agenda secundaria solo si la principal está llena
+
+    Returns:
+        list: [{"turno", "agenda", "inicio", "fin", "huecos": [(hora, libre)]}]
+    """
+    fecha = a_fecha(fecha)
+    dia = fecha.isoformat()
+    bloques = []
+    for turno, franjas in horarios_del_dia(fecha).items():
+        if not franjas['primaria']:
+            continue
+        huecos = indice.huecos(dia, 1, franjas['primaria'], duracion)
+        bloques.append({"turno": turno, "agenda": 1, "inicio": franjas['primaria'][0],
+                        "fin": franjas['primaria'][1], "huecos": huecos})
+        if franjas['secundaria'] and not any(libre for _, libre in huecos):
+            bloques.append({"turno": turno, "agenda": 2, "inicio": franjas['secundaria'][0],
+                            "fin": franjas['secundaria'][1],
+                            "huecos": indice.huecos(dia, 2, franjas['secundaria'], duracion)})
+    return bloques
+
+
+def horas_libres(bloques):
+    """Lista [(hora, agenda)] de los huecos libres de unos bloques"""
+    return [(hora, bloque["agenda"]) for bloque in bloques for hora, libre in bloque["huecos"] if libre]
+
+
+def imprimir_disponibilidad(bloques):
+    """Muestra por pantalla los bloques de un día y devuelve las horas libres"""
+    titulos = {"manana": "🌅 Horarios de MAÑANA:", "tarde": "🌇 Horarios de TARDE:"}
+    turno_actual = None
+    for bloque in bloques:
+        if bloque["turno"] != turno_actual:
+            turno_actual = bloque["turno"]
+            print(f"\n{titulos[turno_actual]}")
+        nombre = "Principal" if bloque["agenda"] == 1 else "Secundaria"
+        turno = "Mañana" if bloque["turno"] == "manana" else "Tarde"
+        print(f"\n🏥 Agenda {nombre} {turno} ({bloque['inicio']} - {bloque['fin']}):")
+        for hora, libre in bloque["huecos"]:
+            print(f"{'✅' if libre else '❌'} {hora} - {'Disponible' if libre else 'Ocupado'}")
+    return horas_libres(bloques)
+
+
+def facultativo_de(fecha, hora, agenda):
+    """Facultativo que atiende una agenda a una hora según las reglas de la clínica"""
+    return REGLAS.nombre_facultativo(fecha, hora, agenda)
+
+
+def buscar_huecos(desde=None, hasta=None, cantidad=5, facultativo=None, agenda=None, turno=None,
+                  duracion=DURACION_CITA):
+    """Primeros huecos libres a partir de una fecha, en una sola pasada sobre las citas del periodo
+
+    Args:
+        desde: Primer día a buscar (por defecto hoy; de hoy solo se ofrecen horas futuras)
+        hasta: Último día a buscar (por defecto cuatro semanas después de `desde`)
+        cantidad (int): Número máximo de huecos a devolver
+        facultativo (str): Parte del nombre del facultativo (p. ej. "david")
+        agenda (int): 1 o 2
+        turno (str): "manana" o "tarde"
+    Returns:
+        list: [{"fecha", "hora", "agenda", "turno", "facultativo"}] en orden cronológico
+    """
+    ahora = datetime.now()
+    desde = max(a_fecha(desde or ahora), ahora.date())
+    hasta = a_fecha(hasta) if hasta else desde + timedelta(weeks=4)
+    indice = IndiceOcupacion.desde_almacen(desde, hasta)
+    filtro_facultativo = (facultativo or "").lower()
+    minuto_actual = ahora.hour * 60 + ahora.minute
+
+    huecos = []
+    fecha = desde
+    while fecha <= hasta and len(huecos) < cantidad:
+        if fecha.weekday() < 5:
+            bloques = sorted(disponibilidad_dia(fecha, indice, duracion), key=lambda b: (a_minutos(b["inicio"]), b["agenda"]))
+            candidatos = []
+            for bloque in bloques:
+                if turno and bloque["turno"] != turno:
+                    continue
+                if agenda and bloque["agenda"] != int(agenda):
+                    continue
+                for hora, libre in bloque["huecos"]:
+                    if not libre or (fecha == ahora.date() and a_minutos(hora) <= minuto_actual):
+                        continue
+                    nombre = facultativo_de(fecha, hora, bloque["agenda"])
+                    if filtro_facultativo and filtro_facultativo not in (nombre or "").lower():
+                        continue
+                    candidatos.append({"fecha": fecha.isoformat(), "hora": hora, "agenda": bloque["agenda"],
+                                       "turno": bloque["turno"], "facultativo": nombre})
+            candidatos.sort(key=lambda h: (a_minutos(h["hora"]), h["agenda"]))
+            huecos.extend(candidatos[:cantidad - len(huecos)])
+        fecha += timedelta(days=1)
+    return huecos
+
+
+def disponibilidad(desde, hasta, duracion=DURACION_CITA):
+    """Huecos de cada día laborable entre dos fechas con una sola consulta al almacén
+
+    Returns:
+        dict: {"YYYY-MM-DD": [bloques]} (ver disponibilidad_dia)
+    """
+    desde, hasta = a_fecha(desde), a_fecha(hasta)
+    indice = IndiceOcupacion.desde_almacen(desde, hasta)
+    resultado = {}
+    fecha = desde
+    while fecha <= hasta:
+        if fecha.weekday() < 5:
+            resultado[fecha.isoformat()] = disponibilidad_dia(fecha, indice, duracion)
+        fecha += timedelta(days=1)
+    return resultado
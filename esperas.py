@@ -0,0 +1,188 @@
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+from datetime import date
+import os
+import time
+
+# Esperas por condiciones concretas de la página en lugar de pausas fijas:
+# cada función vuelve en cuanto la página está lista y solo agota el tiempo si no llega a estarlo.
+TIEMPO_MAXIMO = 15
+INTERVALO = 0.1
+
+# Cuenta las peticiones XHR/fetch en curso; se instala una vez por página cargada
+_JS_RED = """
+if (!window.__esperas) {
+    var estado = window.__esperas = {pendientes: 0, ultima: Date.now()};
+    var terminar = function () { estado.pendientes = Math.max(0, estado.pendientes - 1); estado.ultima = Date.now(); };
+    var enviar = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        estado.pendientes++; estado.ultima = Date.now();
+        this.addEventListener('loadend', terminar);
+        return enviar.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var pedir = window.fetch;
+        window.fetch = function () {
+            estado.pendientes++; estado.ultima = Date.now();
+            return pedir.apply(this, arguments).finally(terminar);
+        };
+    }
+}
+var jq = window.jQuery ? window.jQuery.active : 0;
+return [document.readyState, window.__esperas.pendientes + jq, Date.now() - window.__esperas.ultima];
+"""
+
+_JS_CALENDARIO = """
+var $ = window.jQuery;
+if (document.readyState !== 'complete' || ($ && $.active)) { return null; }
+if (!$ || !$.fn.fullCalendar || !$('.fc').length) {
+    return document.querySelector('.fc-view') ? [] : null;
+}
+var vista = $('.fc').first().fullCalendar('getView');
+if (!vista || !vista.start || !document.querySelector('.fc-view')) { return null; }
+return [vista.start.format('YYYY-MM-DD'), vista.end.format('YYYY-MM-DD')];
+"""
+
+# Modal de Bootstrap: con la clase "fade" está listo cuando tiene "in"/"show" y el diálogo ya no se desplaza
+_JS_MODAL_ESTABLE = """
+var $ = window.jQuery;
+if ($ && $(':animated').length) { return false; }
+var modal = arguments[0].closest('.modal');
+if (!modal || !modal.classList.contains('fade')) { return true; }
+if (!modal.classList.contains('in') && !modal.classList.contains('show')) { return false; }
+var dialogo = modal.querySelector('.modal-dialog');
+var transformacion = dialogo ? getComputedStyle(dialogo).transform : 'none';
+return transformacion === 'none' || transformacion === 'matrix(1, 0, 0, 1, 0, 0)';
+"""
+
+_JS_MODALES_ABIERTOS = """
+var visibles = function (selector) {
+    return Array.prototype.some.call(document.querySelectorAll(selector), function (e) { return e.offsetParent !== null; });
+};
+return visibles('.modal.in, .modal.show, .jconfirm-box') || (window.jQuery && window.jQuery(':animated').length > 0);
+"""
+
+
+def _esperar(driver, condicion, timeout=TIEMPO_MAXIMO, mensaje=""):
+    return WebDriverWait(driver, timeout, poll_frequency=INTERVALO).until(condicion, mensaje)
+
+
+def esperar_ajax(driver, timeout=TIEMPO_MAXIMO):
+    """Documento cargado y sin peticiones jQuery en curso"""
+    _esperar(driver, lambda d: d.execute_script(
+        "return document.readyState === 'complete' && !(window.jQuery && window.jQuery.active);"
+    ), timeout, "La página sigue cargando")
+
+
+def esperar_red_inactiva(driver, inactividad=0.5, timeout=TIEMPO_MAXIMO):
+    """Sin peticiones XHR/fetch/jQuery pendientes durante `inactividad` segundos
+
+    Las peticiones solo se cuentan desde la primera llamada en cada página; las que ya
+    estaban en marcha se cubren con jQuery.active.
+    """
+    def inactiva(d):
+        estado, pendientes, desde_ultima = d.execute_script(_JS_RED)
+        return estado == "complete" and pendientes == 0 and desde_ultima >= inactividad * 1000
+    _esperar(driver, inactiva, timeout, "La red no llegó a quedar inactiva")
+
+
+def esperar_calendario(driver, fecha=None, timeout=TIEMPO_MAXIMO):
+    """FullCalendar renderizado y sin cargas pendientes, mostrando `fecha` si se indica
+
+    Returns:
+        tuple: (inicio, fin) de la vista en formato YYYY-MM-DD, o None si no se pudo leer
+    """
+    fecha = fecha.isoformat() if isinstance(fecha, date) else fecha
+
+    def listo(d):
+        rango = d.execute_script(_JS_CALENDARIO)
+        if rango is None:
+            return False
+        if not rango:
+            return True
+        return fecha is None or rango[0] <= fecha < rango[1]
+    _esperar(driver, listo, timeout, "El calendario no terminó de cargar")
+    rango = driver.execute_script(_JS_CALENDARIO)
+    return tuple(rango) if rango else None
+
+
+def esperar_texto_distinto(driver, localizador, anterior, timeout=TIEMPO_MAXIMO):
+    """Espera a que el texto de un elemento cambie (p. ej. el título de la semana al navegar)"""
+    def cambiado(d):
+        try:
+            texto = d.find_element(*localizador).text
+        except Exception:
+            return False
+        return texto if texto and texto != anterior else False
+    return _esperar(driver, cambiado, timeout, "El texto no cambió")
+
+
+def esperar_valor(driver, elemento, valor, timeout=TIEMPO_MAXIMO):
+    """Espera a que un campo contenga exactamente `valor` (value de un input o texto de un contenteditable)"""
+    def igual(d):
+        actual = elemento.get_attribute("value")
+        return (elemento.text if actual is None else actual) == valor
+    _esperar(driver, igual, timeout, f"El campo no llegó a valer {valor!r}")
+
+
+def esperar_sugerencias(driver, localizador, timeout=TIEMPO_MAXIMO):
+    """Sugerencias de un autocompletado visibles y sin peticiones pendientes; las devuelve"""
+    def cargadas(d):
+        if d.execute_script("return !!(window.jQuery && window.jQuery.active);"):
+            return False
+        visibles = [e for e in d.find_elements(*localizador) if e.is_displayed()]
+        return visibles or False
+    return _esperar(driver, cargadas, timeout, "No aparecieron sugerencias")
+
+
+def esperar_clicable(driver, elemento, timeout=TIEMPO_MAXIMO):
+    """Elemento visible y habilitado, sin animaciones jQuery ni peticiones en curso; lo devuelve"""
+    _esperar(driver, lambda d: elemento.is_displayed() and elemento.is_enabled() and d.execute_script(
+        "return !(window.jQuery && (window.jQuery.active || window.jQuery(':animated').length));"
+    ), timeout, "El elemento no llegó a poder pulsarse")
+    return elemento
+
+
+def esperar_modal(driver, localizador, timeout=TIEMPO_MAXIMO):
+    """Elemento de un modal visible y con la animación de apertura terminada; lo devuelve"""
+    elemento = _esperar(driver, EC.visibility_of_element_located(localizador), timeout,
+                        "El modal no apareció")
+    _esperar(driver, lambda d: d.execute_script(_JS_MODAL_ESTABLE, elemento), timeout, "El modal sigue animándose")
+    return elemento
+
+
+def esperar_modal_cerrado(driver, timeout=TIEMPO_MAXIMO):
+    """Ningún modal (Bootstrap o jconfirm) visible ni animándose"""
+    _esperar(driver, lambda d: not d.execute_script(_JS_MODALES_ABIERTOS), timeout, "El modal no se cerró")
+
+
+def esperar_descarga(carpeta, extensiones, antes=(), timeout=60):
+    """Espera a que aparezca en `carpeta` un archivo nuevo y completo con alguna de las extensiones
+
+    Args:
+        antes: Nombres que ya estaban en la carpeta antes de la descarga
+    Returns:
+        str: Ruta del archivo, o None si no aparece a tiempo
+    """
+    limite = time.monotonic() + timeout
+    antes = set(antes)
+    while time.monotonic() < limite:
+        nombres = os.listdir(carpeta)
+        # Chrome escribe en .crdownload hasta terminar
+        if not any(n.endswith((".crdownload", ".tmp")) for n in nombres):
+            for nombre in nombres:
+                if nombre.endswith(extensiones) and not nombre.startswith("~$") and nombre not in antes:
+                    ruta = os.path.join(carpeta, nombre)
+                    if os.path.getsize(ruta) > 0:
+                        return ruta
+        time.sleep(0.25)
+    return None
+
+
+def intentar(espera, *args, **kwargs):
+    """Ejecuta una espera sin fallar si se agota el tiempo; devuelve False en ese caso"""
+    try:
+        return espera(*args, **kwargs) or True
+    except TimeoutException:
+        return False
@@ -1,66 +1,38 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from datetime import datetime, timedelta
 import os
-import json
-import time
 from dotenv import load_dotenv
 import glob
 import re
-from collections import defaultdict
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pool_navegadores import obtener_pool
+from sesion_esiclinic import URL_AGENDA, iniciar_sesion
+from almacen_citas import reemplazar_citas
+from almacenamiento import bloqueo_archivo, guardar_json
+from reglas_horario import REGLAS
+from esperas import esperar_calendario, intentar
 
 # Cargar variables de entorno
 load_dotenv("env/.env")
 
-COLORES = {
-    'jose': (9, 142, 67),
-    'arnau': (108, 14, 33),
-    'david': (242, 159, 44)
-}
-
-def determinar_facultativo(dia_semana: int, hora: str):
-    hora_dt = datetime.strptime(hora, "%H:%M")
-    if dia_semana == 0:  # lunes
-        if hora_dt < datetime.strptime("14:00", "%H:%M"):
-            return 'arnau'
-        else:
-            return 'david'
-    elif dia_semana == 1:  # martes
-        return 'arnau'
-    elif dia_semana == 2:  # miércoles
-        if hora_dt < datetime.strptime("12:30", "%H:%M"):
-            return 'david'
-        else:
-            return 'arnau'
-    elif dia_semana == 3:  # jueves
-        return 'jose'
-    elif dia_semana == 4:  # viernes
-        return 'arnau'
-    return None
-
 def extraer_rgb(style: str):
-    match = re.search(r'rgb\((\d+), (\d+), (\d+)\)', style)
+    """Obtiene el color (r, g, b) de un estilo o color CSS en formato rgb(...) o #rrggbb"""
+    match = re.search(r'rgba?\((\d+),\s*(\d+),\s*(\d+)', style)
     if match:
         return tuple(map(int, match.groups()))
+    match = re.search(r'#([0-9a-fA-F]{6})\b', style)
+    if match:
+        valor = match.group(1)
+        return tuple(int(valor[i:i + 2], 16) for i in (0, 2, 4))
     return None
 
 def determinar_agenda(color_rgb, fecha: str, hora: str):
     try:
-        dia_dt = datetime.strptime(fecha, "%Y-%m-%d")
-        dia_semana = dia_dt.weekday()
-        facultativo = determinar_facultativo(dia_semana, hora)
-        if facultativo is None:
-            return "2"
-
-        color_facultativo = COLORES[facultativo]
-        if color_rgb == color_facultativo:
-            return "1"
-        else:
-            return "2"
+        # Agenda 1 si el color es el del facultativo que tiene la agenda principal a esa hora
+        return REGLAS.agenda_por_color(color_rgb, fecha, hora)
     except Exception as e:
         print(f"⚠️ Error determinando agenda: {e}")
         return "2"
@@ -80,126 +52,358 @@ def parsear_fecha(dia_str):
         año += 1
     return f"{año}-{mes:02d}-{dia:02d}"
 
-def extraer_citas_por_semanas():
-    options = webdriver.ChromeOptions()
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+# Lee en una sola llamada los días de la semana visible y todos sus eventos,
+# calculando en el navegador la columna de cada evento a partir de su posición
+JS_EVENTOS_SEMANA = r"""
+var texto = function (el) { return el ? (el.innerText || el.textContent || '').trim() : ''; };
+var dias = [];
+document.querySelectorAll('.fc-day-header').forEach(function (el) {
+    var dia = texto(el).split('\n')[0].trim();
+    if (dia) { dias.push(dia); }
+});
+var columnas = Array.prototype.map.call(document.querySelectorAll('td.fc-day'), function (el) {
+    var r = el.getBoundingClientRect();
+    return [r.left, r.right];
+});
+var eventos = [];
+document.querySelectorAll('.fc-event-container .fc-event').forEach(function (el) {
+    var tiempo = el.querySelector('.fc-time');
+    var hora = tiempo ? tiempo.getAttribute('data-full') : null;
+    if (!hora) { return; }
+    var r = el.getBoundingClientRect();
+    var centro = r.left + r.width / 2;
+    var columna = 0;
+    for (var i = 0; i < columnas.length; i++) {
+        if (columnas[i][0] <= centro && centro <= columnas[i][1]) { columna = i; break; }
+    }
+    var rgb = /rgb\((\d+), (\d+), (\d+)\)/.exec(el.getAttribute('style') || '');
+    eventos.push({
+        columna: columna,
+        hora: hora,
+        titulo: texto(el.querySelector('.fc-title')),
+        rgb: rgb ? [parseInt(rgb[1], 10), parseInt(rgb[2], 10), parseInt(rgb[3], 10)] : null
+    });
+});
+return {dias: dias, eventos: eventos};
+"""
 
-    try:
-        driver.get("https://esiclinic.com/")
-        print("➡️ Accediendo a esiclinic.com...")
-
-        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.ID, "esi_user"))).send_keys(os.getenv("USUARIO_ESICLINIC"))
-        driver.find_element(By.ID, "esi_pass").send_keys(os.getenv("PASSWORD_ESICLINIC"))
-        login_button = driver.find_element(By.ID, "bt_acceder")
-        driver.execute_script("arguments[0].click();", login_button)
-        print("🔑 Credenciales enviadas, iniciando sesión...")
-
-        WebDriverWait(driver, 15).until(EC.url_contains("agenda.php"))
-        print("✅ Login exitoso. Accediendo a la agenda...")
-
-        boton_semana = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, ".fc-agendaWeek-button"))
-        )
-        boton_semana.click()
-        print("📅 Cambiando a vista SEMANAL...")
-        time.sleep(5)
-
-        citas_totales = []
-        hoy = datetime.now().date()
-
-        for semana in range(2):
-            print(f"\n🔍 Extrayendo citas de la SEMANA {semana + 1}...")
-            try:
-                dias_semana = []
-                encabezados_dias = WebDriverWait(driver, 10).until(
-                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".fc-day-header"))
-                )
-                for dia in encabezados_dias:
-                    dia_texto = dia.text.split('\n')[0].strip()
-                    if dia_texto:
-                        dias_semana.append(dia_texto)
-
-                eventos = WebDriverWait(driver, 5).until(
-                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".fc-event-container .fc-event"))
-                )
-                columnas_dias = driver.find_elements(By.CSS_SELECTOR, "td.fc-day")
-                citas_por_hora = defaultdict(int)
-
-                for evento in eventos:
-                    try:
-                        ubicacion = evento.location
-                        tamaño = evento.size
-                        centro_x = ubicacion['x'] + (tamaño['width'] / 2)
-                        dia_index = 0
-                        for i, columna in enumerate(columnas_dias):
-                            col_x = columna.location['x']
-                            col_width = columna.size['width']
-                            if col_x <= centro_x <= (col_x + col_width):
-                                dia_index = i
-                                break
-                        dia_str = dias_semana[dia_index] if dia_index < len(dias_semana) else "Día no encontrado"
-                        hora_texto = evento.find_element(By.CSS_SELECTOR, ".fc-time").get_attribute("data-full")
-                        hora_inicio, _ = hora_texto.split(" - ")
-                        clave_hora = f"{dia_str}_{hora_inicio.strip()}"
-                        citas_por_hora[clave_hora] += 1
-                    except Exception:
-                        continue
-
-                for evento in eventos:
-                    try:
-                        ubicacion = evento.location
-                        tamaño = evento.size
-                        centro_x = ubicacion['x'] + (tamaño['width'] / 2)
-                        dia_index = 0
-                        for i, columna in enumerate(columnas_dias):
-                            col_x = columna.location['x']
-                            col_width = columna.size['width']
-                            if col_x <= centro_x <= (col_x + col_width):
-                                dia_index = i
-                                break
-
-                        dia_str = dias_semana[dia_index] if dia_index < len(dias_semana) else "Día no encontrado"
-                        fecha_iso = parsear_fecha(dia_str)
-                        fecha_cita = datetime.strptime(fecha_iso, "%Y-%m-%d").date()
-                        if semana == 0 and fecha_cita < hoy:
-                            continue
-
-                        hora_texto = evento.find_element(By.CSS_SELECTOR, ".fc-time").get_attribute("data-full")
-                        hora_inicio, hora_fin = hora_texto.split(" - ")
-                        paciente = evento.find_element(By.CSS_SELECTOR, ".fc-title").text
-
-                        style_attr = evento.get_attribute("style")
-                        color_rgb = extraer_rgb(style_attr)
-                        agenda_id = determinar_agenda(color_rgb, fecha_iso, hora_inicio.strip())
-
-                        citas_totales.append({
-                            "semana": semana + 1,
-                            "dia": fecha_iso,
-                            "hora_inicio": hora_inicio.strip(),
-                            "hora_fin": hora_fin.strip(),
-                            "paciente": paciente,
-                            "agenda": agenda_id
-                        })
-
-                        print(f"   📅 {fecha_iso} ⏰ {hora_inicio}-{hora_fin} - {paciente} (Agenda {agenda_id})")
-                    except Exception as e:
-                        print(f"⚠️ Error extrayendo cita (ignorada): {str(e)}")
-
-                if semana < 1:
-                    boton_siguiente = WebDriverWait(driver, 10).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, ".fc-next-button"))
-                    )
-                    boton_siguiente.click()
-                    print("⏭️ Avanzando a la próxima semana...")
-                    time.sleep(5)
+def extraer_eventos_semana(driver):
+    """Devuelve los días y eventos de la semana visible con un único viaje al navegador"""
+    return driver.execute_script(JS_EVENTOS_SEMANA)
 
-            except Exception as e:
-                print(f"⚠️ Error procesando semana {semana + 1}: {str(e)}")
+# Consulta directamente las fuentes de eventos de FullCalendar (feed JSON o función)
+# para una lista de rangos de fechas, todos a la vez, sin renderizar ni paginar semanas
+JS_FUENTE_EVENTOS = r"""
+var rangos = arguments[0], listo = arguments[arguments.length - 1];
+var $ = window.jQuery;
+if (!$ || !$.fn.fullCalendar || !$('.fc').length) { listo({error: 'FullCalendar no disponible'}); return; }
+var cal = $('.fc').first();
+var fuentes;
+try { fuentes = cal.fullCalendar('getEventSources') || []; } catch (e) { fuentes = []; }
+if (!fuentes.length) { listo({error: 'No se encontraron fuentes de eventos'}); return; }
+var fecha = function (m) { return m && m.format ? m.format('YYYY-MM-DDTHH:mm:ss') : (m ? String(m) : null); };
+var normalizar = function (ev, fuente, desde) {
+    return {
+        id: ev.id !== undefined ? String(ev.id) : null,
+        start: fecha(ev.start), end: fecha(ev.end), title: ev.title || '',
+        color: ev.backgroundColor || ev.color || fuente.backgroundColor || fuente.color || null,
+        rendering: ev.rendering || null,
+        rango: desde
+    };
+};
+var feed = null, eventos = [], pendientes = [];
+fuentes.forEach(function (fuente) { rangos.forEach(function (rango) {
+    var desde = rango[0], hasta = rango[1], d = $.Deferred();
+    var terminar = function (lista) {
+        (lista || []).forEach(function (ev) { eventos.push(normalizar(ev, fuente, desde)); });
+        d.resolve();
+    };
+    var func = fuente.func || (typeof fuente.events === 'function' ? fuente.events : null);
+    if (fuente.url) {
+        var datos = $.extend({}, typeof fuente.data === 'object' ? fuente.data : {});
+        feed = feed || {
+            url: new URL(fuente.url, window.location.href).href, datos: $.extend({}, datos),
+            inicio: fuente.startParam || 'start', fin: fuente.endParam || 'end',
+            color: fuente.backgroundColor || fuente.color || null
+        };
+        datos[fuente.startParam || 'start'] = desde;
+        datos[fuente.endParam || 'end'] = hasta;
+        $.ajax({url: fuente.url, data: datos, dataType: 'json'})
+            .done(terminar).fail(function () { d.reject('Fallo al consultar ' + fuente.url); });
+    } else if (func) {
+        func.call(cal[0], moment(desde), moment(hasta), cal.fullCalendar('option', 'timezone'), terminar);
+    } else {
+        terminar($.isArray(fuente.events) ? fuente.events : []);
+    }
+    pendientes.push(d.promise());
+}); });
+$.when.apply($, pendientes)
+    .done(function () { listo({feed: feed, eventos: eventos}); })
+    .fail(function (motivo) { listo({error: String(motivo)}); });
+"""
+
+SEMANAS = 2  # Horizonte por defecto
+PARALELO = int(os.getenv("EXTRACCION_PARALELA", "2"))  # Semanas extraídas a la vez en modo DOM
+
+def lunes_de(fecha):
+    """Devuelve el lunes de la semana de una fecha"""
+    return fecha - timedelta(days=fecha.weekday())
+
+def rangos_semanales(desde, hasta):
+    """Divide [desde, hasta) en rangos de una semana como pares de fechas ISO"""
+    rangos = []
+    inicio = desde
+    while inicio < hasta:
+        fin = min(inicio + timedelta(weeks=1), hasta)
+        rangos.append([inicio.isoformat(), fin.isoformat()])
+        inicio = fin
+    return rangos
+
+def normalizar_evento(evento, color_fuente=None, rango=None):
+    """Deja un evento del feed JSON con los mismos campos que devuelve JS_FUENTE_EVENTOS"""
+    return {
+        "id": str(evento["id"]) if evento.get("id") is not None else None,
+        "start": evento.get("start"),
+        "end": evento.get("end"),
+        "title": evento.get("title") or "",
+        "color": evento.get("backgroundColor") or evento.get("color") or color_fuente,
+        "rendering": evento.get("rendering"),
+        "rango": rango
+    }
+
+def cita_desde_evento(evento, lunes_inicial):
+    """Convierte un evento crudo de FullCalendar en una cita con el formato del JSON"""
+    if evento.get("rendering") in ("background", "inverse-background") or not evento.get("start"):
+        return None
+    inicio = datetime.fromisoformat(evento["start"][:19])
+    if evento.get("end"):
+        fin = datetime.fromisoformat(evento["end"][:19])
+    else:
+        fin = inicio + timedelta(minutes=45)
+    fecha_iso = inicio.strftime("%Y-%m-%d")
+    hora_inicio = inicio.strftime("%H:%M")
+    color_rgb = extraer_rgb(evento.get("color") or "")
+    return {
+        "semana": (inicio.date() - lunes_inicial).days // 7 + 1,
+        "dia": fecha_iso,
+        "hora_inicio": hora_inicio,
+        "hora_fin": fin.strftime("%H:%M"),
+        "paciente": evento.get("title", ""),
+        "agenda": determinar_agenda(color_rgb, fecha_iso, hora_inicio)
+    }
+
+def clave_cita(cita):
+    """Clave con la que se detectan citas duplicadas al unir semanas"""
+    return (cita["dia"], cita["hora_inicio"], cita["hora_fin"], cita["paciente"], cita["agenda"])
+
+def unir_citas(*listas):
+    """Une listas de citas eliminando duplicados y ordenándolas por día y hora"""
+    unicas = {}
+    for lista in listas:
+        for cita in lista:
+            unicas.setdefault(clave_cita(cita), cita)
+    return sorted(unicas.values(), key=lambda c: (c["dia"], c["hora_inicio"], c["agenda"]))
+
+def leer_fuente_eventos(driver, rangos):
+    """Pide a las fuentes del calendario los eventos de varios rangos a la vez
+
+    Returns:
+        dict: {"feed": datos del feed JSON o None, "eventos": eventos normalizados}
+    """
+    WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, ".fc")))
+    driver.set_script_timeout(60)
+    resultado = driver.execute_async_script(JS_FUENTE_EVENTOS, rangos)
+    if not resultado or resultado.get("error"):
+        raise RuntimeError((resultado or {}).get("error", "Respuesta vacía del calendario"))
+    return resultado
+
+def citas_desde_eventos(eventos, lunes_inicial):
+    """Convierte eventos normalizados en citas futuras, sin duplicados y ordenadas"""
+    if eventos and not any(ev.get("color") for ev in eventos):
+        # Sin color no se puede distinguir la agenda: mejor leer el DOM renderizado
+        raise RuntimeError("Los eventos de la fuente no incluyen color")
+
+    hoy = datetime.now().date()
+    citas = []
+    for evento in eventos:
+        try:
+            cita = cita_desde_evento(evento, lunes_inicial)
+        except Exception as e:
+            print(f"⚠️ Error extrayendo cita (ignorada): {str(e)}")
+            continue
+        if cita is None or datetime.strptime(cita["dia"], "%Y-%m-%d").date() < hoy:
+            continue
+        citas.append(cita)
+    return unir_citas(citas)
+
+def extraer_citas_fuente(driver, desde, hasta):
+    """Lee las citas de [desde, hasta) desde la fuente de eventos del calendario
+
+    Cada semana del rango se pide como una petición independiente y todas se lanzan
+    a la vez desde el navegador.
+    """
+    resultado = leer_fuente_eventos(driver, rangos_semanales(desde, hasta))
+    citas = citas_desde_eventos(resultado["eventos"], lunes_de(desde))
+    for cita in citas:
+        print(f"   📅 {cita['dia']} ⏰ {cita['hora_inicio']}-{cita['hora_fin']} - {cita['paciente']} (Agenda {cita['agenda']})")
+    return citas
+
+def ir_a_semana(driver, lunes, semana_actual, semana):
+    """Muestra en el calendario la semana indicada (por índice desde la semana actual)"""
+    if semana == semana_actual:
+        return
+    saltado = driver.execute_script(
+        "var $ = window.jQuery;"
+        "if (!$ || !$.fn.fullCalendar || !$('.fc').length) { return false; }"
+        "$('.fc').first().fullCalendar('gotoDate', arguments[0]); return true;",
+        lunes.isoformat()
+    )
+    if not saltado:
+        boton = ".fc-next-button" if semana > semana_actual else ".fc-prev-button"
+        for _ in range(abs(semana - semana_actual)):
+            WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, boton))
+            ).click()
+    print(f"⏭️ Mostrando la semana {semana + 1}...")
+    intentar(esperar_calendario, driver, lunes)
+
+def extraer_semana_dom(driver, semana):
+    """Lee las citas de la semana renderizada en pantalla"""
+    citas = []
+    hoy = datetime.now().date()
+    print(f"\n🔍 Extrayendo citas de la SEMANA {semana + 1}...")
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".fc-day-header"))
+    )
+    semana_actual = extraer_eventos_semana(driver)
+    dias_semana = semana_actual["dias"]
+
+    for evento in semana_actual["eventos"]:
+        try:
+            dia_index = evento["columna"]
+            dia_str = dias_semana[dia_index] if dia_index < len(dias_semana) else "Día no encontrado"
+            fecha_iso = parsear_fecha(dia_str)
+            fecha_cita = datetime.strptime(fecha_iso, "%Y-%m-%d").date()
+            if semana == 0 and fecha_cita < hoy:
                 continue
 
-        if not os.path.exists("data"):
-            os.makedirs("data")
+            hora_inicio, hora_fin = evento["hora"].split(" - ")
+            paciente = evento["titulo"]
+
+            color_rgb = tuple(evento["rgb"]) if evento["rgb"] else None
+            agenda_id = determinar_agenda(color_rgb, fecha_iso, hora_inicio.strip())
 
+            citas.append({
+                "semana": semana + 1,
+                "dia": fecha_iso,
+                "hora_inicio": hora_inicio.strip(),
+                "hora_fin": hora_fin.strip(),
+                "paciente": paciente,
+                "agenda": agenda_id
+            })
+
+            print(f"   📅 {fecha_iso} ⏰ {hora_inicio}-{hora_fin} - {paciente} (Agenda {agenda_id})")
+        except Exception as e:
+            print(f"⚠️ Error extrayendo cita (ignorada): {str(e)}")
+    return citas
+
+def extraer_grupo_dom(driver, semanas):
+    """Recorre en un navegador las semanas indicadas (índices desde la semana actual)
+
+    Returns:
+        tuple: (citas leídas, semanas que no se pudieron leer)
+    """
+    boton_semana = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, ".fc-agendaWeek-button"))
+    )
+    boton_semana.click()
+    print("📅 Cambiando a vista SEMANAL...")
+    intentar(esperar_calendario, driver)
+
+    lunes_actual = lunes_de(datetime.now().date())
+    citas = []
+    fallidas = []
+    semana_mostrada = 0
+    for semana in semanas:
+        try:
+            ir_a_semana(driver, lunes_actual + timedelta(weeks=semana), semana_mostrada, semana)
+            semana_mostrada = semana
+            citas.extend(extraer_semana_dom(driver, semana))
+        except Exception as e:
+            print(f"⚠️ Error procesando semana {semana + 1}: {str(e)}")
+            fallidas.append(semana)
+    return citas, fallidas
+
+def navegadores_adicionales(pool, cantidad):
+    """Toma del pool hasta `cantidad` navegadores sin esperar a que se libere ninguno
+
+    Quien llama ya tiene un navegador: esperar aquí a otro podría bloquear para siempre
+    si otro trabajo hace lo mismo con el resto del pool.
+    """
+    extra = []
+    for _ in range(cantidad):
+        try:
+            extra.append(pool.obtener(timeout=0))
+        except TimeoutError:
+            break
+        except Exception as e:
+            print(f"⚠️ No se pudo abrir un navegador adicional: {str(e)}")
+            break
+    return extra
+
+def extraer_citas_dom(driver, semanas=SEMANAS, paralelo=PARALELO):
+    """Lee las citas recorriendo las semanas renderizadas en la vista semanal
+
+    Las semanas se reparten entre el navegador del llamador y los que el pool tenga libres
+    en ese momento; si no hay ninguno, las recorre todas el del llamador. Las semanas que
+    fallan se repiten en el navegador del llamador.
+
+    Raises:
+        RuntimeError: Si alguna semana sigue sin poder leerse; guardar un resultado
+            incompleto borraría del almacén las citas de esas semanas
+    """
+    pool = obtener_pool()
+    extra = navegadores_adicionales(pool, max(1, min(paralelo, semanas, pool.tamano)) - 1)
+    navegadores = [driver] + extra
+    grupos = [list(range(inicio, semanas, len(navegadores))) for inicio in range(len(navegadores))]
+
+    def trabajar(navegador, grupo):
+        if navegador is not driver and not iniciar_sesion(navegador):
+            raise RuntimeError("No se pudo iniciar sesión en un navegador adicional")
+        return extraer_grupo_dom(navegador, grupo)
+
+    resultados = []
+    pendientes = []
+    averiados = set()
+    try:
+        with ThreadPoolExecutor(max_workers=len(navegadores)) as executor:
+            futuros = [executor.submit(trabajar, n, g) for n, g in zip(navegadores, grupos)]
+            for futuro, navegador, grupo in zip(futuros, navegadores, grupos):
+                try:
+                    citas, fallidas = futuro.result()
+                except Exception as e:
+                    print(f"⚠️ Error extrayendo las semanas {[g + 1 for g in grupo]}: {str(e)}")
+                    averiados.add(id(navegador))
+                    citas, fallidas = [], grupo
+                resultados.append(citas)
+                pendientes.extend(fallidas)
+    finally:
+        for otro in extra:
+            pool.devolver(otro, averiado=id(otro) in averiados)
+    if pendientes:
+        print(f"🔁 Repitiendo con el navegador principal las semanas {[p + 1 for p in sorted(pendientes)]}...")
+        # Vuelve a la semana actual: extraer_grupo_dom cuenta las semanas desde ella
+        driver.get(URL_AGENDA)
+        citas, fallidas = extraer_grupo_dom(driver, sorted(pendientes))
+        if fallidas:
+            raise RuntimeError(f"No se pudieron leer las semanas {[f + 1 for f in fallidas]}")
+        resultados.append(citas)
+    return unir_citas(*resultados)
+
+def guardar_citas(citas):
+    """Guarda las citas extraídas en el almacén de citas y una copia en data/citas_2_semanas.json"""
+    archivo_json = os.path.join("data", "citas_2_semanas.json")
+    with bloqueo_archivo(archivo_json):
         archivos_json = glob.glob(os.path.join("data", "citas_2_semanas_*.json"))
         for archivo in archivos_json:
             try:
@@ -208,17 +412,60 @@ def extraer_citas_por_semanas():
             except Exception as e:
                 print(f"⚠️ Error al eliminar archivo {archivo}: {str(e)}")
 
-        archivo_json = os.path.join("data", "citas_2_semanas.json")
-        with open(archivo_json, "w", encoding="utf-8") as f:
-            json.dump(citas_totales, f, indent=2, ensure_ascii=False)
-        print(f"\n💾 Todas las citas guardadas en: {archivo_json}")
+        # Escritura atómica: quien lea el JSON a la vez ve la versión anterior o la nueva, nunca una a medias
+        guardar_json(archivo_json, citas)
+        reemplazar_citas(citas)
+    print(f"\n💾 Todas las citas guardadas en: {archivo_json}")
+    return archivo_json
+
+def extraer_citas_por_semanas(semanas=SEMANAS, modo="fuente", paralelo=PARALELO):
+    """Extrae las citas de las próximas semanas y las guarda en el JSON
+
+    Args:
+        semanas (int): Número de semanas a extraer empezando por la actual
+        modo (str): "fuente" lee la fuente de eventos del calendario en una sola consulta
+            (y recurre al DOM si no está disponible); "dom" recorre las semanas renderizadas
+        paralelo (int): Navegadores del pool que recorren semanas a la vez en modo DOM
+    """
+    pool = obtener_pool()
+    driver = pool.obtener()
+    averiado = False
+
+    try:
+        if not iniciar_sesion(driver):
+            raise RuntimeError("No se pudo iniciar sesión en esiclinic")
+
+        citas = None
+        if modo == "fuente":
+            desde = lunes_de(datetime.now().date())
+            hasta = desde + timedelta(weeks=semanas)
+            print(f"\n🔍 Leyendo citas del {desde} al {hasta} desde la fuente del calendario...")
+            try:
+                citas = extraer_citas_fuente(driver, desde, hasta)
+            except Exception as e:
+                print(f"⚠️ Fuente de eventos no disponible ({str(e)}), recorriendo semanas en pantalla...")
+        if citas is None:
+            citas = extraer_citas_dom(driver, semanas, paralelo)
+
+        guardar_citas(citas)
+        return citas
 
     except Exception as e:
         print(f"❌ Error crítico: {str(e)}")
+        averiado = True
         driver.save_screenshot("error_agenda.png")
     finally:
-        driver.quit()
-        print("🚪 Navegador cerrado")
+        pool.devolver(driver, averiado=averiado)
+        print("🚪 Navegador devuelto al pool")
 
 if __name__ == "__main__":
-    extraer_citas_por_semanas()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extrae las citas de la agenda de esiclinic")
+    parser.add_argument("--modo", choices=["fuente", "dom"], default="fuente",
+                        help="fuente: feed de eventos del calendario; dom: semanas renderizadas")
+    parser.add_argument("--semanas", type=int, default=SEMANAS,
+                        help="número de semanas a extraer desde la actual")
+    parser.add_argument("--paralelo", type=int, default=PARALELO,
+                        help="navegadores que recorren semanas a la vez en modo DOM")
+    args = parser.parse_args()
+    obtener_pool().calentar_en_segundo_plano(args.paralelo if args.modo == "dom" else 1)
+    extraer_citas_por_semanas(semanas=args.semanas, modo=args.modo, paralelo=args.paralelo)
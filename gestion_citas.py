@@ -1,6 +1,3 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -8,100 +5,68 @@ from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import StaleElementReferenceException
 import os
-import time
 import pandas as pd
 import json
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import random
-import subprocess
-import sys
+import argparse
+from pool_navegadores import obtener_pool, fijar_carpeta_descargas
+from sesion_esiclinic import iniciar_sesion
+from almacen_citas import citas_del_dia, insertar_cita
+from disponibilidad import IndiceOcupacion, disponibilidad_dia, imprimir_disponibilidad, buscar_huecos, horas_libres
+from reglas_horario import REGLAS, a_fecha
+from indice_pacientes import cargar_indice
+from esperas import (esperar_ajax, esperar_calendario, esperar_texto_distinto, esperar_modal, esperar_modal_cerrado,
+                     esperar_red_inactiva, esperar_valor, esperar_sugerencias, intentar)
+from selector_hora import establecer_hora
+from descargar_excel import descargar_excel
+import Crear_usuario
 # Configuración común
 load_dotenv("env/.env")
 DOWNLOAD_DIR = os.path.abspath("data/clientes")
-ARCHIVO_EXCEL = os.path.join(DOWNLOAD_DIR, "pacientes.xlsx")
-RUTA_CITAS = os.path.abspath("data/citas_2_semanas.json")
 def configurar_navegador():
-    """Configura y retorna una instancia del navegador Chrome"""
-    options = webdriver.ChromeOptions()
-    options.add_argument("--start-maximized")
-    options.add_experimental_option("prefs", {
-        "download.default_directory": DOWNLOAD_DIR,
-        "download.prompt_for_download": False,
-    })
-    return webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()),
-        options=options
-    )
+    """Presta un navegador del pool compartido con las descargas en DOWNLOAD_DIR"""
+    driver = obtener_pool().obtener()
+    fijar_carpeta_descargas(driver, DOWNLOAD_DIR)
+    return driver
 def login(driver):
-    """Realiza el proceso de login en esiclinic"""
+    """Realiza el proceso de login en esiclinic, reutilizando la sesión guardada si sigue activa"""
     try:
-        print("➡️ Accediendo a esiclinic.com...")
-        driver.get("https://esiclinic.com/")
-        time.sleep(3)
-        print("🔑 Enviando credenciales...")
-        driver.find_element(By.ID, "esi_user").send_keys(os.getenv("USUARIO_ESICLINIC"))
-        driver.find_element(By.ID, "esi_pass").send_keys(os.getenv("PASSWORD_ESICLINIC"))
-        driver.find_element(By.ID, "bt_acceder").click()
-        time.sleep(5)
-        print("📂 Navegando a agenda...")
-        driver.get("https://app.esiclinic.com/agenda.php")
-        time.sleep(5)
+        if not iniciar_sesion(driver):
+            raise RuntimeError("No se pudo iniciar sesión en esiclinic")
+        intentar(esperar_calendario, driver)
         return True
     except Exception as e:
         print(f"❌ Error durante el login: {str(e)}")
         driver.save_screenshot("error_login.png")
         return False
     
-def generar_rango_horas(inicio, fin, intervalo):
-    """Genera todas las horas en un rango con intervalos específicos"""
-    horas = []
-    hora_actual = datetime.strptime(inicio, "%H:%M")
-    hora_fin = datetime.strptime(fin, "%H:%M")
-
-    while hora_actual <= hora_fin - timedelta(minutes=intervalo):
-        horas.append((hora_actual.strftime("%H:%M"), 1))  # Por defecto agenda 1
-        hora_actual += timedelta(minutes=intervalo)
-
-    return horas
-
 def verificar_paciente():
     """Verifica si el paciente existe en el Excel por DNI (CIF) o correo (E-Mail)"""
     try:
         identificador = input("🔍 Ingrese DNI (CIF) o correo (E-Mail) del paciente: ").strip().lower()
-        df = pd.read_excel(ARCHIVO_EXCEL, engine='openpyxl')
-
-        # Verificar columnas esperadas
-        columnas_esperadas = ['CIF', 'E-Mail']
-        for col in columnas_esperadas:
-            if col not in df.columns:
-                raise ValueError(f"❌ Faltan columnas esperadas en el Excel: {col}")
-
-        df['CIF'] = df['CIF'].astype(str).str.strip().str.lower()
-        df['E-Mail'] = df['E-Mail'].astype(str).str.strip().str.lower()
+        tipo, pacientes = cargar_indice().buscar(identificador)
 
-        pacientes = df[(df['CIF'] == identificador) | (df['E-Mail'] == identificador)]
-
-        if not pacientes.empty:
-            if identificador in df['CIF'].values:
-                paciente = pacientes.iloc[0]
+        if pacientes:
+            if tipo == "dni":
+                paciente = pacientes[0]
             else:
                 if len(pacientes) > 1:
                     print("\n⚠️ Este correo está asociado a múltiples pacientes:")
-                    for i, (_, row) in enumerate(pacientes.iterrows(), 1):
+                    for i, row in enumerate(pacientes, 1):
                         print(f"{i}. {row['Nombre']} {row['Apellidos']} (DNI: {row['CIF']})")
                     while True:
                         seleccion = input("🔢 Ingrese el número del paciente o el DNI completo: ").strip().lower()
                         if seleccion.isdigit() and 1 <= int(seleccion) <= len(pacientes):
-                            paciente = pacientes.iloc[int(seleccion)-1]
+                            paciente = pacientes[int(seleccion)-1]
                             break
-                        elif seleccion in pacientes['CIF'].values:
-                            paciente = pacientes[pacientes['CIF'] == seleccion].iloc[0]
+                        elegido = [p for p in pacientes if p['CIF'].lower() == seleccion]
+                        if elegido:
+                            paciente = elegido[0]
                             break
-                        else:
-                            print("❌ Opción no válida. Intente nuevamente.")
+                        print("❌ Opción no válida. Intente nuevamente.")
                 else:
-                    paciente = pacientes.iloc[0]
+                    paciente = pacientes[0]
 
             nombre_completo = f"{paciente['Nombre']} {paciente['Apellidos']}"
             print(f"\n🎉 ¡Paciente encontrado!\n👤 Nombre: {nombre_completo}\n🆔 DNI: {paciente['CIF']}\n📧 Correo: {paciente['E-Mail']}")
@@ -112,23 +77,39 @@ def verificar_paciente():
 
     except Exception as e:
         print(f"\n⚠️ Error al verificar paciente: {str(e)}")
-        print("Posibles causas:\n- El archivo pacientes.xlsx no tiene las columnas esperadas (CIF, E-Mail)\n- El archivo está abierto en otro programa\n- El formato del archivo no es compatible")
+        print("Posibles causas:\n- El archivo de pacientes no tiene las columnas esperadas (CIF, E-Mail)\n- El archivo está abierto en otro programa\n- El formato del archivo no es compatible")
         return None
     
-def lunes_con_agenda_2(fecha_dt):
-    base = datetime(2025, 4, 14)
-    diferencia_semanas = (fecha_dt.date() - base.date()).days // 7
-    return diferencia_semanas % 2 == 0
+def elegir_proximo_hueco(cantidad=10):
+    """Muestra las próximas horas libres de todas las agendas y deja elegir una"""
+    turno = input("🌓 Turno (m = mañana, t = tarde, Enter = cualquiera): ").strip().lower()
+    turno = {"m": "manana", "t": "tarde"}.get(turno)
+    facultativo = input("👨‍⚕️ Facultativo (Enter = cualquiera): ").strip() or None
+    huecos = buscar_huecos(cantidad=cantidad, turno=turno, facultativo=facultativo)
+    if not huecos:
+        print("\n❌ No hay horas libres en las próximas semanas con esos filtros")
+        return None
 
+    print("\n📋 Próximas horas libres:")
+    for i, hueco in enumerate(huecos, 1):
+        fecha = datetime.strptime(hueco["fecha"], "%Y-%m-%d").strftime("%d-%m-%Y")
+        print(f"[{i}] {fecha} {hueco['hora']} | Agenda {hueco['agenda']} | {hueco['facultativo']}")
+    seleccion = input("\nSeleccione un número (Enter para volver): ").strip()
+    if not seleccion.isdigit() or not 1 <= int(seleccion) <= len(huecos):
+        return None
+    hueco = huecos[int(seleccion) - 1]
+    return datetime.strptime(hueco["fecha"], "%Y-%m-%d").strftime("%d-%m-%Y"), hueco["hora"], hueco["agenda"]
 
 def seleccionar_cita():
     """Seleccionar cita con manejo automático de agendas secundarias"""
     try:
-        with open(RUTA_CITAS, 'r', encoding='utf-8') as f:
-            citas = json.load(f)
-            
         while True:
-            fecha_input = input("📅 Ingrese fecha (DD-MM-YYYY): ").strip()
+            fecha_input = input("📅 Ingrese fecha (DD-MM-YYYY) o 'p' para ver las próximas horas libres: ").strip()
+            if fecha_input.lower() == 'p':
+                eleccion = elegir_proximo_hueco()
+                if eleccion:
+                    return eleccion
+                continue
             try:
                 fecha_dt = datetime.strptime(fecha_input, "%d-%m-%Y")
                 fecha_iso = fecha_dt.strftime("%Y-%m-%d")
@@ -143,7 +124,7 @@ def seleccionar_cita():
                     continue
                     
                 # Obtener citas existentes para esta fecha
-                citas_fecha = [c for c in citas if c['dia'] == fecha_iso]
+                citas_fecha = citas_del_dia(fecha_iso)
                 
                 # Mostrar citas existentes
                 if citas_fecha:
@@ -151,85 +132,9 @@ def seleccionar_cita():
                     for c in citas_fecha:
                         print(f"⏰ {c['hora_inicio']}-{c['hora_fin']} | {c['paciente']} (Agenda {c.get('agenda', '1')}")
                 
-                # Definir horarios por día y tipo de agenda
-                horarios = {
-                    'manana': {
-                        'primaria': ("10:15", "14:00"),
-                        'secundaria': ("10:15", "14:00") if dia_semana == 0 and lunes_con_agenda_2(fecha_dt) else ("10:30", "13:30") if dia_semana == 3 else None  # Lunes(0): mismo horario | Jueves(3): escalonado
-                    },
-                    'tarde': {
-                        'primaria': ("15:00", "20:15"),
-                        'secundaria': ("15:00", "20:15") if dia_semana == 0 and lunes_con_agenda_2(fecha_dt) else ("15:30", "20:00") if dia_semana == 3 else None  # Lunes(0): mismo horario | Jueves(3): escalonado
-                    }
-                }
-                
-                # Función para verificar disponibilidad en una agenda específica
-                def verificar_disponibilidad(inicio, fin, agenda_num):
-                    disponibles = []
-                    hora_actual = datetime.strptime(inicio, "%H:%M")
-                    hora_fin = datetime.strptime(fin, "%H:%M")
-                    
-                    while hora_actual <= hora_fin - timedelta(minutes=45):
-                        hora_str = hora_actual.strftime("%H:%M")
-                        conflicto = False
-                        
-                        for cita in citas_fecha:
-                            # Solo verificar conflictos en la misma agenda
-                            if cita.get('agenda', '1') == str(agenda_num):
-                                inicio_cita = datetime.strptime(cita['hora_inicio'], "%H:%M")
-                                fin_cita = datetime.strptime(cita['hora_fin'], "%H:%M")
-                                if inicio_cita <= hora_actual < fin_cita:
-                                    conflicto = True
-                                    break
-                        
-                        if not conflicto:
-                            disponibles.append((hora_str, agenda_num))
-                        
-                        hora_actual += timedelta(minutes=45)
-                    return disponibles
-                
-                # Verificar disponibilidad en todas las agendas
-                todas_disponibles = []
-                
-                # MAÑANA - Primero agenda primaria
-                print("\n🌅 Horarios de MAÑANA:")
-                disp_manana_primaria = verificar_disponibilidad(*horarios['manana']['primaria'], 1)
-                print(f"\n🏥 Agenda Principal Mañana ({horarios['manana']['primaria'][0]} - {horarios['manana']['primaria'][1]}):")
-                for hora, agenda in generar_rango_horas(*horarios['manana']['primaria'], 45):
-                    disp = any(h == hora for h, a in disp_manana_primaria)
-                    print(f"{'✅' if disp else '❌'} {hora} - {'Disponible' if disp else 'Ocupado'}")
-                    if disp:
-                        todas_disponibles.append((hora, 1))
-
-                # MAÑANA - Agenda secundaria si primaria está llena y existe
-                if horarios['manana']['secundaria'] and len(disp_manana_primaria) == 0:
-                    disp_manana_secundaria = verificar_disponibilidad(*horarios['manana']['secundaria'], 2)
-                    print(f"\n🏥 Agenda Secundaria Mañana ({horarios['manana']['secundaria'][0]} - {horarios['manana']['secundaria'][1]}):")
-                    for hora, agenda in generar_rango_horas(*horarios['manana']['secundaria'], 45):
-                        disp = any(h == hora for h, a in disp_manana_secundaria)
-                        print(f"{'✅' if disp else '❌'} {hora} - {'Disponible' if disp else 'Ocupado'}")
-                        if disp:
-                            todas_disponibles.append((hora, 2))
-                
-                # TARDE - Primero agenda primaria
-                print("\n🌇 Horarios de TARDE:")
-                disp_tarde_primaria = verificar_disponibilidad(*horarios['tarde']['primaria'], 1)
-                print(f"\n🏥 Agenda Principal Tarde ({horarios['tarde']['primaria'][0]} - {horarios['tarde']['primaria'][1]}):")
-                for hora, agenda in generar_rango_horas(*horarios['tarde']['primaria'], 45):
-                    disp = any(h == hora for h, a in disp_tarde_primaria)
-                    print(f"{'✅' if disp else '❌'} {hora} - {'Disponible' if disp else 'Ocupado'}")
-                    if disp:
-                        todas_disponibles.append((hora, 1))
-                
-                # TARDE - Agenda secundaria si primaria está llena y existe
-                if horarios['tarde']['secundaria'] and len(disp_tarde_primaria) == 0:
-                    disp_tarde_secundaria = verificar_disponibilidad(*horarios['tarde']['secundaria'], 2)
-                    print(f"\n🏥 Agenda Secundaria Tarde ({horarios['tarde']['secundaria'][0]} - {horarios['tarde']['secundaria'][1]}):")
-                    for hora, agenda in generar_rango_horas(*horarios['tarde']['secundaria'], 45):
-                        disp = any(h == hora for h, a in disp_tarde_secundaria)
-                        print(f"{'✅' if disp else '❌'} {hora} - {'Disponible' if disp else 'Ocupado'}")
-                        if disp:
-                            todas_disponibles.append((hora, 2))
+                # Huecos libres de cada agenda (la secundaria solo si la principal está llena)
+                indice = IndiceOcupacion(citas_fecha)
+                todas_disponibles = imprimir_disponibilidad(disponibilidad_dia(fecha_dt, indice))
                 
                 if not todas_disponibles:
                     print("\n❌ No hay horarios disponibles para este día")
@@ -270,6 +175,7 @@ def navegar_a_fecha(driver, fecha):
         
         while intentos < max_intentos:
             try:
+                intentar(esperar_calendario, driver)
                 rango_fechas = WebDriverWait(driver, 10).until(
                     EC.presence_of_element_located((By.CSS_SELECTOR, ".fc-center h2"))
                 ).text
@@ -300,7 +206,8 @@ def navegar_a_fecha(driver, fecha):
                     WebDriverWait(driver, 10).until(
                         EC.element_to_be_clickable((By.CSS_SELECTOR, ".fc-prev-button"))).click()
                     print("⏮️ Retrocediendo a la semana anterior...")
-                time.sleep(3)
+                # El título de la semana cambia cuando el calendario ha pintado la nueva vista
+                esperar_texto_distinto(driver, (By.CSS_SELECTOR, ".fc-center h2"), rango_fechas, timeout=10)
                 intentos += 1
             except Exception as e:
                 print(f"⚠️ Error al interpretar rango de fechas: {str(e)}")
@@ -334,13 +241,12 @@ def seleccionar_facultativo_por_horario(driver, fecha, hora, agenda_num):
     while intentos < max_intentos:
         try:
             fecha_dt = datetime.strptime(fecha, "%d-%m-%Y")
-            dia_semana = fecha_dt.weekday()
-            hora_dt = datetime.strptime(hora, "%H:%M")
 
             # Esperar a que el modal esté completamente estable
             WebDriverWait(driver, 15).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, "#citaMotivo, #citaFacultativo")))
-            time.sleep(0.5)  # Espera corta para estabilización
+            # Las opciones de facultativo se recargan al cambiar la hora
+            intentar(esperar_red_inactiva, driver, 0.3, 5)
 
             # Localizar el select de facultativo FRESCO
             select_element = WebDriverWait(driver, 10).until(
@@ -365,21 +271,8 @@ def seleccionar_facultativo_por_horario(driver, fecha, hora, agenda_num):
                 print("⚠️ No hay facultativos disponibles")
                 return False
 
-            # Lógica de selección según horario
-            facultativo_seleccionado = None
-            if dia_semana == 0:  # Lunes
-                if agenda_num == 1:
-                    facultativo_seleccionado = "Arnau Girones" if hora_dt.time() < datetime.strptime("14:00", "%H:%M").time() else "David Ibiza"
-                else:
-                    facultativo_seleccionado = "Jose Cabanes"
-            elif dia_semana == 1:  # Martes
-                facultativo_seleccionado = "Arnau Girones"
-            elif dia_semana == 2:  # Miércoles
-                facultativo_seleccionado = "David Ibiza" if datetime.strptime("10:00", "%H:%M").time() <= hora_dt.time() <= datetime.strptime("12:30", "%H:%M").time() else "Arnau Girones"
-            elif dia_semana == 3:  # Jueves
-                facultativo_seleccionado = "Jose Cabanes"
-            elif dia_semana == 4:  # Viernes
-                facultativo_seleccionado = "Arnau Girones"
+            # Facultativo según las reglas de horario de la clínica
+            facultativo_seleccionado = REGLAS.nombre_facultativo(fecha_dt, hora, agenda_num)
 
             # Seleccionar el facultativo con manejo de errores
             try:
@@ -404,7 +297,7 @@ def seleccionar_facultativo_por_horario(driver, fecha, hora, agenda_num):
         except StaleElementReferenceException:
             intentos += 1
             print(f"⚠️ Intento {intentos}: Elemento obsoleto, reintentando...")
-            time.sleep(1)
+            intentar(esperar_ajax, driver, 5)
         except Exception as e:
             print(f"⚠️ Error al seleccionar facultativo: {str(e)}")
             driver.save_screenshot(f"error_facultativo_intento_{intentos}.png")
@@ -413,13 +306,13 @@ def seleccionar_facultativo_por_horario(driver, fecha, hora, agenda_num):
     print("❌ No se pudo seleccionar el facultativo después de varios intentos")
     return False
 def seleccionar_sala(driver, agenda_num, dia_semana):
-    """Selecciona Box 2 para agenda 2 en lunes/jueves, Box 1 para agenda 1"""
+    """Selecciona la sala de la agenda según las reglas de horario (Box 2 para agenda 2)"""
     try:
         select_element = WebDriverWait(driver, 5).until(
             EC.element_to_be_clickable((By.ID, "modalRoom")))
         select_sala = Select(select_element)
         
-        box = "Box 2" if agenda_num == 2 else "Box 1"  # Simplificado
+        box = REGLAS.sala(agenda_num)
         select_sala.select_by_visible_text(box)
         print(f"🏥 Sala seleccionada: {box} (Agenda {agenda_num})")
         return True
@@ -427,91 +320,10 @@ def seleccionar_sala(driver, agenda_num, dia_semana):
         print(f"⚠️ Error al seleccionar sala: {str(e)}")
         return False
 def modificar_hora_en_modal(driver, hora_deseada):
+    """Fija la hora del modal de cita con el timepicker (ver selector_hora)"""
     try:
         print(f"🕒 Configurando hora: {hora_deseada}")
-        horas, minutos = map(int, hora_deseada.split(':'))
-        if not (0 <= horas <= 23 and 0 <= minutos <= 59):
-            raise ValueError("Hora fuera de rango")
-        minutos = (minutos // 5) * 5
-        if minutos == 60:
-            minutos = 55
-        hora_deseada = f"{horas:02d}:{minutos:02d}"
-        print(f"🔄 Hora ajustada a formato timepicker: {hora_deseada}")
-
-        reloj_icon = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, ".glyphicon-time"))
-        )
-        ActionChains(driver).move_to_element(reloj_icon).pause(0.3).click().perform()
-        time.sleep(1)
-
-        timepicker = WebDriverWait(driver, 10).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, ".bootstrap-timepicker-widget"))
-        )
-        input_hora = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-hour")
-        input_minuto = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-minute")
-        flecha_hora_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementHour']")
-        flecha_hora_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementHour']")
-        flecha_minuto_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementMinute']")
-        flecha_minuto_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementMinute']")
-
-        hora_actual = int(input_hora.get_attribute("value"))
-        minuto_actual = int(input_minuto.get_attribute("value"))
-
-        # Detectar si al bajar los minutos se va a restar 1 hora visualmente
-        if minutos < minuto_actual:
-            if horas == hora_actual:
-                print("⚠️ Prevención: Añadiendo 1 a la hora porque vamos a bajar minutos")
-                flecha_hora_up.click()
-                time.sleep(0.2)
-
-        # Ajustar la hora al valor deseado
-        hora_actual = int(input_hora.get_attribute("value"))
-        diferencia_horas = horas - hora_actual
-        if diferencia_horas != 0:
-            print(f"🕑 Ajustando horas de {hora_actual:02d} a {horas:02d}")
-            flecha_hora = flecha_hora_up if diferencia_horas > 0 else flecha_hora_down
-            for _ in range(abs(diferencia_horas)):
-                flecha_hora.click()
-                time.sleep(0.2)
-
-
-        # Ajustar los minutos al valor deseado
-        minuto_actual = int(input_minuto.get_attribute("value"))
-        dif_normal = (minutos - minuto_actual) % 60
-        dif_inversa = (minuto_actual - minutos) % 60
-
-        if dif_normal <= dif_inversa:
-            flecha = flecha_minuto_up
-            pasos = dif_normal
-            print(f"↑ Subir {pasos//5} clicks (de {minuto_actual:02d} a {minutos:02d})")
-        else:
-            flecha = flecha_minuto_down
-            pasos = dif_inversa
-            print(f"↓ Bajar {pasos//5} clicks (de {minuto_actual:02d} a {minutos:02d})")
-
-        for _ in range(pasos // 5):
-            flecha.click()
-            time.sleep(0.15)
-
-        # 🛠 Verificar si la hora ha bajado tras ajustar minutos y corregir
-        hora_final_actual = int(input_hora.get_attribute("value"))
-        if hora_final_actual < horas:
-            print("⚠️ Se detectó que la hora bajó tras ajustar minutos, corrigiendo...")
-            diferencia_horas_final = horas - hora_final_actual
-            for _ in range(diferencia_horas_final):
-                flecha_hora_up.click()
-                time.sleep(0.2)
-
-        # Verificación final
-        hora_final = f"{input_hora.get_attribute('value')}:{input_minuto.get_attribute('value')}"
-        if hora_final == hora_deseada:
-            print(f"✅ Hora establecida correctamente: {hora_final}")
-            return True
-        else:
-            print(f"⚠️ Hora resultante diferente: {hora_final} (esperado: {hora_deseada})")
-            return False
-
-
+        return establecer_hora(driver, hora_deseada)
     except Exception as e:
         print(f"❌ Error crítico: {str(e)}")
         driver.save_screenshot("error_timepicker_final.png")
@@ -522,28 +334,16 @@ def rellenar_modal_cita(driver, nombre_paciente, hora_deseada, fecha, agenda_num
     try:
         print("\n🖋️ Iniciando relleno de formulario...")
         # 1. Esperar a que el modal esté completamente cargado
-        WebDriverWait(driver, 15).until(
-            EC.visibility_of_element_located((By.ID, "citaPaciente")))
-        time.sleep(1)
+        esperar_modal(driver, (By.ID, "citaPaciente"))
         # 2. Autocompletado de paciente - Método mejorado
         input_paciente = driver.find_element(By.ID, "citaPaciente")
-        # Limpiar el campo completamente
-        for _ in range(3):
-            input_paciente.clear()
-            time.sleep(0.3)
-        # Escribir el nombre con pausas naturales
-        for i, char in enumerate(nombre_paciente):
-            input_paciente.send_keys(char)
-            # Pausa más larga después del primer nombre/apellido
-            if char == ' ' or i == len(nombre_paciente.split()[0]):
-                time.sleep(random.uniform(0.2, 0.4))
-            else:
-                time.sleep(random.uniform(0.05, 0.15))
-        # Esperar y manejar sugerencias de autocompletado
+        input_paciente.clear()
+        intentar(esperar_valor, driver, input_paciente, "", 3)
+        input_paciente.send_keys(nombre_paciente)
+        intentar(esperar_valor, driver, input_paciente, nombre_paciente, 3)
+        # Esperar a que el autocompletado responda a la búsqueda completa
         try:
-            WebDriverWait(driver, 3).until(
-                EC.visibility_of_element_located((By.CSS_SELECTOR, ".autocomplete-list")))
-            sugerencias = driver.find_elements(By.CSS_SELECTOR, ".autocomplete-list li")
+            sugerencias = esperar_sugerencias(driver, (By.CSS_SELECTOR, ".autocomplete-list li"), 3)
             if sugerencias:
                 # Buscar coincidencia exacta
                 for sugerencia in sugerencias:
@@ -568,10 +368,8 @@ def rellenar_modal_cita(driver, nombre_paciente, hora_deseada, fecha, agenda_num
                 EC.element_to_be_clickable((By.ID, "citaMotivo"))
             )
             campo_observaciones.click()
-            time.sleep(0.5)
         except Exception as e:
             print(f"ℹ️ No se pudo hacer clic en observaciones: {str(e)}")
-        time.sleep(1)
         
         if not seleccionar_facultativo_por_horario(driver, fecha, hora_deseada, agenda_num):
             print("⚠️ No se pudo seleccionar el facultativo según horario")
@@ -605,7 +403,7 @@ def crear_cita_en_agenda(driver, fecha, hora, nombre_paciente, agenda):
             return False
             
         print("🔍 Buscando slot de 9:00 AM para abrir el modal...")
-        time.sleep(2)
+        intentar(esperar_calendario, driver, datetime.strptime(fecha, "%d-%m-%Y").date())
         
         # Estrategia específica para hacer clic en el slot de 9:00 AM
         try:
@@ -630,10 +428,8 @@ def crear_cita_en_agenda(driver, fecha, hora, nombre_paciente, agenda):
             
             # Scroll y click preciso
             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", celda_agenda)
-            time.sleep(1)
             ActionChains(driver).move_to_element_with_offset(celda_agenda, 10, 10).click().perform()
             print("🖱️ Click realizado en el slot de 9:00 AM")
-            time.sleep(3)
             
         except Exception as e:
             print(f"❌ Error al hacer clic en slot de 9:00 AM: {str(e)}")
@@ -641,8 +437,7 @@ def crear_cita_en_agenda(driver, fecha, hora, nombre_paciente, agenda):
             return False
         # Verificar que el modal se abrió
         try:
-            WebDriverWait(driver, 5).until(
-                EC.visibility_of_element_located((By.ID, "citaPaciente")))
+            esperar_modal(driver, (By.ID, "citaPaciente"), timeout=10)
             print("✅ Modal de cita abierto correctamente")
         except:
             print("❌ El modal no apareció después del click")
@@ -658,10 +453,11 @@ def crear_cita_en_agenda(driver, fecha, hora, nombre_paciente, agenda):
             guardar = WebDriverWait(driver, 10).until(
                 EC.element_to_be_clickable((By.ID, "guardarCita")))
             driver.execute_script("arguments[0].scrollIntoView();", guardar)
-            time.sleep(1)
             guardar.click()
+            # La cita está guardada cuando se cierra el modal y termina la petición al servidor
+            esperar_modal_cerrado(driver)
+            intentar(esperar_red_inactiva, driver)
             print("💾 Cita guardada correctamente")
-            time.sleep(3)
             return True
         except Exception as e:
             print(f"❌ Error al guardar: {str(e)}")
@@ -672,73 +468,241 @@ def crear_cita_en_agenda(driver, fecha, hora, nombre_paciente, agenda):
         print(f"❌ Error crítico: {str(e)}")
         driver.save_screenshot("error_final.png")
         return False
-# Modificar la función actualizar_json_citas()
-def actualizar_json_citas(fecha, hora, paciente, agenda):
-    """Añade la nueva cita al JSON existente incluyendo el número de agenda"""
+def actualizar_json_citas(fecha, hora, paciente, agenda, dni=None):
+    """Registra la nueva cita en el almacén local incluyendo el número de agenda; devuelve su id"""
     try:
-        fecha_dt = datetime.strptime(fecha, "%d-%m-%Y")
-        fecha_iso = fecha_dt.strftime("%Y-%m-%d")
-        
-        # Leer el archivo actual
-        try:
-            with open(RUTA_CITAS, 'r', encoding='utf-8') as f:
-                citas = json.load(f)
-        except FileNotFoundError:
-            citas = []
-            
+        fecha_iso = datetime.strptime(fecha, "%d-%m-%Y").strftime("%Y-%m-%d")
         # Calcular hora de fin (45 minutos después)
         hora_fin = (datetime.strptime(hora, "%H:%M") + timedelta(minutes=45)).strftime("%H:%M")
-        
-        # Añadir nueva cita
-        nueva_cita = {
-            "semana": 1 if len(citas) < 5 else 2,
-            "dia": fecha_iso,
-            "hora_inicio": hora,
-            "hora_fin": hora_fin,
-            "paciente": paciente,
-            "agenda": str(agenda)  # Guardamos el número de agenda usado
-        }
-        citas.append(nueva_cita)
-        
-        # Guardar de nuevo
-        with open(RUTA_CITAS, 'w', encoding='utf-8') as f:
-            json.dump(citas, f, indent=2, ensure_ascii=False)
-            
-        print(f"📄 JSON actualizado con la nueva cita para {paciente} (Agenda {agenda}).")
+        cita_id = insertar_cita(fecha_iso, hora, hora_fin, paciente, agenda, dni)
+        print(f"📄 Citas actualizadas con la nueva cita para {paciente} (Agenda {agenda}).")
+        return cita_id
     except Exception as e:
-        print(f"⚠️ Error al actualizar JSON: {str(e)}")
-def main():
+        print(f"⚠️ Error al actualizar las citas: {str(e)}")
+        return None
+def validar_reserva(identificador, fecha, hora, agenda=None):
+    """Comprueba paciente, fecha y hora de una reserva sin abrir el navegador
+    
+    Args:
+        identificador (str): DNI (CIF) o correo del paciente
+        fecha: date, 'YYYY-MM-DD' o 'DD-MM-YYYY'
+        hora (str): 'HH:MM'
+        agenda (int): 1 o 2; por defecto la que tenga libre esa hora
+    Returns:
+        tuple: (reserva {"paciente", "dni", "fecha" (DD-MM-YYYY), "hora", "agenda"} o None, lista de errores)
+    """
+    errores = []
+    paciente = None
+    try:
+        tipo, pacientes = cargar_indice().buscar(str(identificador).strip().lower())
+        if not pacientes:
+            errores.append("Paciente no encontrado")
+        elif tipo == "email" and len(pacientes) > 1:
+            errores.append("Este correo está asociado a varios pacientes, indique el DNI")
+        else:
+            paciente = pacientes[0]
+    except Exception as e:
+        errores.append(f"No se pudo leer el archivo de pacientes: {str(e)}")
+    try:
+        fecha_dt = a_fecha(fecha)
+        datetime.strptime(hora, "%H:%M")
+    except (ValueError, TypeError, IndexError):
+        errores.append("Formato de fecha u hora incorrecto")
+        return None, errores
+    ahora = datetime.now()
+    if fecha_dt.weekday() >= 5:
+        errores.append("Solo se pueden agendar citas de lunes a viernes")
+    elif fecha_dt < ahora.date() or (fecha_dt == ahora.date() and hora <= ahora.strftime("%H:%M")):
+        errores.append("No se pueden agendar citas en el pasado")
+    else:
+        libres = horas_libres(disponibilidad_dia(fecha_dt, IndiceOcupacion(citas_del_dia(fecha_dt.isoformat()))))
+        agendas = [a for h, a in libres if h == hora and (agenda is None or a == int(agenda))]
+        if not agendas:
+            errores.append("Hora no disponible")
+    if errores:
+        return None, errores
+    return {
+        "paciente": f"{paciente['Nombre']} {paciente['Apellidos']}",
+        "dni": paciente['CIF'],
+        "fecha": fecha_dt.strftime("%d-%m-%Y"),
+        "hora": hora,
+        "agenda": agendas[0],
+    }, []
+def reservar_cita(identificador, fecha, hora, agenda=None, descargar=True):
+    """Crea una cita sin preguntar nada por terminal (para la API y otros scripts)
+    
+    Args:
+        identificador (str): DNI (CIF) o correo del paciente
+        fecha, hora, agenda: ver validar_reserva
+        descargar (bool): Actualizar después el Excel de citas y Google Sheets
+    Returns:
+        dict: {"ok": bool, "mensaje": str, "errores": [str], "cita": reserva con su "id"}
+    """
+    reserva, errores = validar_reserva(identificador, fecha, hora, agenda)
+    if errores:
+        return {"ok": False, "mensaje": errores[0], "errores": errores, "cita": None}
     driver = configurar_navegador()
     try:
         if not login(driver):
-            print("🚫 Error en el login, cerrando programa...")
-            return
-        
-        print("\n=== VERIFICACIÓN DE PACIENTE ===")
-        nombre_paciente = verificar_paciente()
-        if not nombre_paciente:
-            print("\n⚠️ Paciente no encontrado. Ejecutando script para crearlo...")
-            subprocess.run([sys.executable, "Crear_usuario.py"])
-            print("🔄 Vuelve a ejecutar gestion_citas.py después de crear el paciente.")
-            return
+            return {"ok": False, "mensaje": "Error en el login", "errores": ["Error en el login"], "cita": reserva}
+        if not crear_cita_en_agenda(driver, reserva["fecha"], reserva["hora"], reserva["paciente"], reserva["agenda"]):
+            return {"ok": False, "mensaje": "No se pudo crear la cita en la agenda", "errores": [], "cita": reserva}
+    finally:
+        obtener_pool().devolver(driver)
+    reserva["id"] = actualizar_json_citas(reserva["fecha"], reserva["hora"], reserva["paciente"],
+                                          reserva["agenda"], reserva["dni"])
+    if descargar:
+        print("\n🔄 Ejecutando actualización de Excel de citas...")
+        descargar_excel()
+    return {"ok": True, "mensaje": "Cita creada", "errores": [], "cita": reserva}
+def leer_lote(ruta):
+    """Lee un lote de citas de un CSV, Excel o JSON con columnas paciente, fecha, hora y agenda (opcional)"""
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".json":
+        with open(ruta, "r", encoding="utf-8") as f:
+            filas = json.load(f)
+    else:
+        df = pd.read_csv(ruta, dtype=str) if extension == ".csv" else pd.read_excel(ruta, dtype=str)
+        filas = df.astype(object).where(df.notna(), None).to_dict("records")
+    entradas = []
+    for fila in filas:
+        agenda = fila.get("agenda")
+        entradas.append({
+            "paciente": str(fila["paciente"]).strip(),
+            "fecha": str(fila["fecha"]).strip()[:10],
+            "hora": str(fila["hora"]).strip()[:5],
+            "agenda": int(float(agenda)) if agenda not in (None, "") else None,
+        })
+    return entradas
+def sesiones_recurrentes(paciente, fecha, hora, sesiones, cada_dias=7, agenda=None):
+    """Entradas de lote para un tratamiento: `sesiones` citas a la misma hora cada `cada_dias` días"""
+    inicio = a_fecha(fecha)
+    return [
+        {"paciente": paciente, "fecha": (inicio + timedelta(days=cada_dias * i)).isoformat(),
+         "hora": hora, "agenda": agenda}
+        for i in range(sesiones)
+    ]
+def reservar_lote(entradas, descargar=True):
+    """Reserva varias citas seguidas con un solo navegador y una sola sesión
+    
+    Las citas se ordenan por fecha y hora para que la agenda solo avance semana a semana,
+    cada una se valida justo antes de crearla (así ve las del propio lote ya reservadas)
+    y el Excel de citas y Google Sheets se actualizan una sola vez al final.
+    
+    Args:
+        entradas (list): [{"paciente": DNI o correo, "fecha", "hora", "agenda" (opcional)}]
+        descargar (bool): Actualizar el Excel de citas y Google Sheets al terminar
+    Returns:
+        dict: {"ok": bool, "mensaje": str, "creadas": int, "resultados": [{"entrada", "ok", "mensaje", "cita"}]}
+    """
+    def orden(entrada):
+        try:
+            return (a_fecha(entrada["fecha"]).isoformat(), entrada["hora"])
+        except (ValueError, TypeError, IndexError):
+            return ("", entrada["hora"])
+    
+    resultados = []
+    driver = configurar_navegador()
+    try:
+        if not login(driver):
+            return {"ok": False, "mensaje": "Error en el login", "creadas": 0, "resultados": []}
+        for numero, entrada in enumerate(sorted(entradas, key=orden), 1):
+            print(f"\n📋 [{numero}/{len(entradas)}] {entrada['paciente']} - {entrada['fecha']} {entrada['hora']}")
+            reserva, errores = validar_reserva(entrada["paciente"], entrada["fecha"], entrada["hora"], entrada.get("agenda"))
+            if errores:
+                print(f"⏭️ Se omite: {'; '.join(errores)}")
+                resultados.append({"entrada": entrada, "ok": False, "mensaje": "; ".join(errores), "cita": None})
+                continue
+            if crear_cita_en_agenda(driver, reserva["fecha"], reserva["hora"], reserva["paciente"], reserva["agenda"]):
+                reserva["id"] = actualizar_json_citas(reserva["fecha"], reserva["hora"], reserva["paciente"],
+                                                      reserva["agenda"], reserva["dni"])
+                resultados.append({"entrada": entrada, "ok": True, "mensaje": "Cita creada", "cita": reserva})
+            else:
+                resultados.append({"entrada": entrada, "ok": False, "mensaje": "No se pudo crear la cita en la agenda",
+                                   "cita": reserva})
+                # Volver a una agenda limpia por si quedó un modal abierto
+                driver.get("https://app.esiclinic.com/agenda.php")
+                intentar(esperar_calendario, driver)
+    finally:
+        obtener_pool().devolver(driver)
+    
+    creadas = sum(1 for r in resultados if r["ok"])
+    print(f"\n📊 Lote terminado: {creadas} de {len(entradas)} citas creadas")
+    if descargar and creadas:
+        print("\n🔄 Ejecutando actualización de Excel de citas...")
+        descargar_excel()
+    return {"ok": creadas == len(entradas), "mensaje": f"{creadas} de {len(entradas)} citas creadas",
+            "creadas": creadas, "resultados": resultados}
+def agendar_interactivo(driver):
+    """Agenda por terminal una cita con el navegador prestado
+
+    Returns:
+        str: Lo que queda por hacer sin navegador ("crear_paciente", "descargar_excel") o None
+    """
+    if not login(driver):
+        print("🚫 Error en el login, cerrando programa...")
+        return None
+    
+    print("\n=== VERIFICACIÓN DE PACIENTE ===")
+    nombre_paciente = verificar_paciente()
+    if not nombre_paciente:
+        print("\n⚠️ Paciente no encontrado. Abriendo la creación de pacientes...")
+        return "crear_paciente"
+    
+    print("\n=== AGENDAMIENTO DE CITA ===")
+    cita = seleccionar_cita()
+    if cita:
+        fecha, hora, agenda = cita  # Ahora recibimos también el número de agenda
+        print(f"\n✅ Cita provisional agendada (Agenda {agenda}):")
+        print(f"📅 Fecha: {fecha}")
+        print(f"⏰ Hora: {hora}")
         
-        print("\n=== AGENDAMIENTO DE CITA ===")
-        cita = seleccionar_cita()
-        if cita:
-            fecha, hora, agenda = cita  # Ahora recibimos también el número de agenda
-            print(f"\n✅ Cita provisional agendada (Agenda {agenda}):")
-            print(f"📅 Fecha: {fecha}")
-            print(f"⏰ Hora: {hora}")
-            
-            if crear_cita_en_agenda(driver, fecha, hora, nombre_paciente, agenda):
-                actualizar_json_citas(fecha, hora, nombre_paciente, agenda)
-                print("\n🔄 Ejecutando actualización de Excel de citas...")
-                subprocess.run([sys.executable, "descargar_excel.py"])
-                
+        if crear_cita_en_agenda(driver, fecha, hora, nombre_paciente, agenda):
+            actualizar_json_citas(fecha, hora, nombre_paciente, agenda)
+            return "descargar_excel"
+    return None
+def main():
+    driver = configurar_navegador()
+    siguiente = None
+    try:
+        siguiente = agendar_interactivo(driver)
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         driver.save_screenshot("error.png")
     finally:
-        driver.quit()
+        obtener_pool().devolver(driver)
+    # Crear_usuario y descargar_excel piden su propio navegador: se lanzan con este ya
+    # devuelto para no esperar a un pool que puede no tener otro libre
+    if siguiente == "crear_paciente":
+        Crear_usuario.main()
+        print("🔄 Vuelve a ejecutar gestion_citas.py después de crear el paciente.")
+    elif siguiente == "descargar_excel":
+        print("\n🔄 Ejecutando actualización de Excel de citas...")
+        descargar_excel()
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Agenda citas en esiclinic")
+    parser.add_argument("--lote", help="CSV, Excel o JSON con columnas paciente, fecha, hora y agenda (opcional)")
+    parser.add_argument("--paciente", help="DNI o correo para un tratamiento de varias sesiones")
+    parser.add_argument("--fecha", help="primera sesión del tratamiento (DD-MM-YYYY)")
+    parser.add_argument("--hora", help="hora de las sesiones (HH:MM)")
+    parser.add_argument("--sesiones", type=int, default=10, help="número de sesiones del tratamiento")
+    parser.add_argument("--cada", type=int, default=7, help="días entre sesiones")
+    parser.add_argument("--agenda", type=int, choices=[1, 2], help="agenda de las sesiones")
+    args = parser.parse_args()
+    # El navegador arranca e inicia sesión mientras se leen los datos
+    obtener_pool().calentar_en_segundo_plano(1)
+    if args.lote:
+        resumen = reservar_lote(leer_lote(args.lote))
+    elif args.paciente:
+        if not (args.fecha and args.hora):
+            parser.error("--paciente requiere --fecha y --hora")
+        resumen = reservar_lote(sesiones_recurrentes(args.paciente, args.fecha, args.hora, args.sesiones,
+                                                     args.cada, args.agenda))
+    else:
+        main()
+        resumen = None
+    if resumen:
+        for resultado in resumen["resultados"]:
+            entrada = resultado["entrada"]
+            print(f"{'✅' if resultado['ok'] else '❌'} {entrada['fecha']} {entrada['hora']} "
+                  f"{entrada['paciente']}: {resultado['mensaje']}")
\ No newline at end of file
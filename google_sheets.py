@@ -1,60 +1,372 @@
 import gspread
 import pandas as pd
+from gspread.utils import rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
+import random
+import threading
+import time
 import traceback
 import os
+from cache_excel import actualizar_cache, columnas_originales
+from almacenamiento import leer_json, guardar_json
 
-def subir_a_google_sheets(nombre_archivo, nombre_hoja):
+# Copia local de lo último que se subió a cada hoja, para enviar solo los cambios
+CARPETA_SNAPSHOTS = os.path.join("data", "sheets")
+# "diff" envía solo las filas cambiadas; "completo" borra y vuelve a subir toda la hoja
+MODO_SINCRONIZACION = os.getenv("SHEETS_SINCRONIZACION", "diff")
+# Columnas que identifican una fila, por tipo de exportación (citas y pacientes)
+CLAVES = (("DNI", "Fecha", "Hora"), ("CIF",))
+CREDENCIALES = "env/credentials.json"
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+]
+# Los tokens de Google duran una hora; se renuevan un poco antes
+VIDA_TOKEN = 50 * 60
+RUTA_IDS = os.path.join(CARPETA_SNAPSHOTS, "ids.json")
+# Las subidas se hacen por bloques de filas para no superar el tamaño máximo de petición
+FILAS_POR_BLOQUE = int(os.getenv("SHEETS_FILAS_POR_BLOQUE", "2000"))
+MAX_REINTENTOS = 6
+ESPERA_MAXIMA = 64  # segundos
+
+_credenciales = None
+_cliente = None
+_caducidad_cliente = 0
+_hojas = {}
+_bloqueo_cliente = threading.RLock()
+# Pausa entre bloques: crece con cada 429 y se reduce a la mitad con cada bloque aceptado
+_pausa = 0.0
+
+
+def obtener_cliente():
+    """Cliente de gspread compartido por el proceso; se vuelve a autorizar solo cuando el token caduca"""
+    global _credenciales, _cliente, _caducidad_cliente
+    with _bloqueo_cliente:
+        if _credenciales is None:
+            _credenciales = ServiceAccountCredentials.from_json_keyfile_name(CREDENCIALES, SCOPE)
+        if _cliente is None or time.monotonic() >= _caducidad_cliente:
+            _cliente = gspread.authorize(_credenciales)
+            _caducidad_cliente = time.monotonic() + VIDA_TOKEN
+            _hojas.clear()
+        return _cliente
+
+
+def invalidar_cliente():
+    """Fuerza una nueva autorización en la próxima llamada (p. ej. tras un 401)"""
+    global _cliente
+    with _bloqueo_cliente:
+        _cliente = None
+        _hojas.clear()
+
+
+def abrir_hoja(nombre_hoja):
+    """Abre una hoja de cálculo por nombre, recordando su ID para no buscarla en Drive cada vez"""
+    with _bloqueo_cliente:
+        if nombre_hoja in _hojas:
+            return _hojas[nombre_hoja]
+        client = obtener_cliente()
+        ids = leer_json(RUTA_IDS, {})
+        spreadsheet = None
+        if nombre_hoja in ids:
+            try:
+                spreadsheet = client.open_by_key(ids[nombre_hoja])
+            except (gspread.SpreadsheetNotFound, gspread.exceptions.APIError):
+                spreadsheet = None
+        if spreadsheet is None:
+            try:
+                spreadsheet = client.open(nombre_hoja)
+            except gspread.SpreadsheetNotFound:
+                print(f"Creando nueva hoja de cálculo: {nombre_hoja}")
+                spreadsheet = client.create(nombre_hoja)
+                # Compartir con el email autorizado
+                spreadsheet.share(os.getenv("GMAIL_FROM"), perm_type='user', role='writer')
+            if ids.get(nombre_hoja) != spreadsheet.id:
+                ids[nombre_hoja] = spreadsheet.id
+                guardar_json(RUTA_IDS, ids, fsync=False)
+        _hojas[nombre_hoja] = spreadsheet
+        return spreadsheet
+
+
+def _estado_http(error):
+    respuesta = getattr(error, "response", None)
+    return getattr(respuesta, "status_code", None)
+
+
+def _no_autorizado(error):
+    return _estado_http(error) == 401
+
+
+def con_reintentos(funcion, *args, **kwargs):
+    """Ejecuta una llamada a la API esperando y reintentando si Google responde 429 o 5xx
+
+    La espera se duplica en cada intento (con algo de azar) y la pausa entre bloques se
+    ajusta para no volver a chocar con la cuota por minuto.
+    """
+    global _pausa
+    espera = 1.0
+    for intento in range(MAX_REINTENTOS + 1):
+        if _pausa:
+            time.sleep(_pausa)
+        try:
+            resultado = funcion(*args, **kwargs)
+            _pausa = _pausa / 2 if _pausa > 0.1 else 0.0
+            return resultado
+        except gspread.exceptions.APIError as e:
+            estado = _estado_http(e)
+            if intento == MAX_REINTENTOS or not (estado == 429 or (estado or 0) >= 500):
+                raise
+            if estado == 429:
+                _pausa = min(max(_pausa * 2, 1.0), ESPERA_MAXIMA)
+            print(f"⏳ Google Sheets respondió {estado}, reintentando en {espera:.0f}s...")
+            time.sleep(espera + random.uniform(0, espera / 2))
+            espera = min(espera * 2, ESPERA_MAXIMA)
+
+
+def ruta_snapshot(nombre_hoja):
+    return os.path.join(CARPETA_SNAPSHOTS, f"{nombre_hoja}.json")
+
+
+def ruta_progreso(nombre_hoja):
+    return os.path.join(CARPETA_SNAPSHOTS, f"{nombre_hoja}.progreso.json")
+
+
+def filas_texto(df):
+    """Filas de `df` como listas de texto, generadas una a una sin copiar el DataFrame"""
+    for fila in df.itertuples(index=False, name=None):
+        yield [str(valor) for valor in fila]
+
+
+def bloques(filas, tamano=None):
+    """Agrupa un iterable de filas en listas de como mucho `tamano` filas"""
+    tamano = tamano or FILAS_POR_BLOQUE
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) == tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def columnas_clave(cabecera):
+    """Columnas que forman la clave estable de las filas, o None si la tabla no tiene ninguna"""
+    for columnas in CLAVES:
+        if all(c in cabecera for c in columnas):
+            return columnas
+    return None
+
+
+def claves_filas(cabecera, filas):
+    """Clave de cada fila; las repetidas se distinguen por su número de aparición"""
+    columnas = columnas_clave(cabecera)
+    posiciones = [cabecera.index(c) for c in columnas]
+    vistas = {}
+    claves = []
+    for fila in filas:
+        clave = "|".join(fila[p] for p in posiciones)
+        vistas[clave] = vistas.get(clave, 0) + 1
+        claves.append(f"{clave}#{vistas[clave]}")
+    return claves
+
+
+def planificar_cambios(anterior, cabecera, filas):
+    """Calcula qué filas de la hoja hay que reescribir para pasar del snapshot anterior a `filas`
+
+    Las filas que no cambian se quedan donde están. Los huecos de las filas eliminadas se
+    reutilizan para las nuevas y, si sobran, se rellenan con las últimas filas de la hoja
+    para no dejar huecos; así se escribe el mínimo de filas.
+
+    Returns:
+        tuple: (cambios {número de fila de datos (0..n-1): valores}, total de filas antes, nuevo orden de claves)
+    """
+    orden = list(anterior["claves"])
+    previas = dict(zip(anterior["claves"], anterior["filas"]))
+    nuevas = dict(zip(claves_filas(cabecera, filas), filas))
+
+    cambios = {}
+    libres = []
+    for posicion, clave in enumerate(orden):
+        if clave not in nuevas:
+            libres.append(posicion)
+        elif nuevas[clave] != previas[clave]:
+            cambios[posicion] = nuevas[clave]
+
+    añadidas = [clave for clave in nuevas if clave not in previas]
+    for clave in añadidas:
+        posicion = libres.pop(0) if libres else len(orden)
+        if posicion == len(orden):
+            orden.append(clave)
+        else:
+            orden[posicion] = clave
+        cambios[posicion] = nuevas[clave]
+
+    # Huecos que sobran: se mueven a ellos las últimas filas y se recorta la tabla
+    libres = set(libres)
+    while libres:
+        ultima = len(orden) - 1
+        if ultima in libres:
+            libres.discard(ultima)
+            orden.pop()
+            cambios.pop(ultima, None)
+            continue
+        hueco = min(libres)
+        libres.discard(hueco)
+        orden[hueco] = orden.pop()
+        cambios[hueco] = nuevas[orden[hueco]]
+        cambios.pop(ultima, None)
+
+    return cambios, len(anterior["claves"]), orden
+
+
+def rangos_contiguos(cambios, total_anterior, total_nuevo, ancho):
+    """Agrupa las filas cambiadas en rangos A1 contiguos; las filas sobrantes se vacían"""
+    filas = dict(cambios)
+    for posicion in range(total_nuevo, total_anterior):
+        filas[posicion] = [""] * ancho
+    datos = []
+    grupo = []
+    for posicion in sorted(filas):
+        if grupo and posicion != grupo[-1] + 1:
+            datos.append(grupo)
+            grupo = []
+        grupo.append(posicion)
+    if grupo:
+        datos.append(grupo)
+    return [
+        {
+            # +2: la fila 1 de la hoja es la cabecera y las filas de datos empiezan en 0
+            "range": f"{rowcol_to_a1(g[0] + 2, 1)}:{rowcol_to_a1(g[-1] + 2, ancho)}",
+            "values": [list(filas[p]) + [""] * (ancho - len(filas[p])) for p in g],
+        }
+        for g in datos
+    ]
+
+
+def subir_completo(worksheet, nombre_hoja, cabecera, filas, total, firma=None):
+    """Borra la hoja y la sube por bloques, continuando por el último bloque confirmado si se cortó
+
+    Args:
+        filas: Iterable de filas (puede ser un generador)
+        total (int): Número de filas de datos
+        firma: Identifica los datos subidos; solo se reanuda si coincide con la del intento anterior
+    """
+    progreso = leer_json(ruta_progreso(nombre_hoja)) or {}
+    confirmadas = 0
+    if firma is not None and progreso.get("firma") == list(firma) and progreso.get("cabecera") == cabecera:
+        confirmadas = progreso.get("confirmadas", 0)
+        print(f"↪️ Reanudando subida de {nombre_hoja} desde la fila {confirmadas + 1}")
+    else:
+        con_reintentos(worksheet.clear)
+        con_reintentos(worksheet.resize, rows=total + 1, cols=max(worksheet.col_count, len(cabecera)))
+        con_reintentos(worksheet.update, [cabecera], range_name="A1", value_input_option='USER_ENTERED')
+
+    fila_hoja = 2
+    for bloque in bloques(filas):
+        if fila_hoja - 2 + len(bloque) > confirmadas:
+            con_reintentos(worksheet.update, bloque, range_name=rowcol_to_a1(fila_hoja, 1),
+                           value_input_option='USER_ENTERED')
+            confirmadas = fila_hoja - 2 + len(bloque)
+            if firma is not None:
+                guardar_json(ruta_progreso(nombre_hoja), {
+                    "firma": list(firma), "cabecera": cabecera, "confirmadas": confirmadas,
+                }, fsync=False)
+        fila_hoja += len(bloque)
+
+    if os.path.exists(ruta_progreso(nombre_hoja)):
+        os.remove(ruta_progreso(nombre_hoja))
+
+
+def enviar_rangos(worksheet, rangos):
+    """Envía los rangos de un diff en varias peticiones de como mucho FILAS_POR_BLOQUE filas"""
+    lote, filas_lote = [], 0
+    for rango in rangos:
+        if lote and filas_lote + len(rango["values"]) > FILAS_POR_BLOQUE:
+            con_reintentos(worksheet.batch_update, lote, value_input_option='USER_ENTERED')
+            lote, filas_lote = [], 0
+        lote.append(rango)
+        filas_lote += len(rango["values"])
+    if lote:
+        con_reintentos(worksheet.batch_update, lote, value_input_option='USER_ENTERED')
+
+
+def _sincronizar(worksheet, nombre_hoja, df, completo, firma=None):
+    """Envía a la hoja el contenido de `df`, solo con los cambios si es posible"""
+    # Todos los datos se envían como texto para evitar problemas de formato
+    cabecera = [str(c) for c in df.columns.values.tolist()]
+    con_claves = bool(columnas_clave(cabecera))
+
+    # Enviar solo los cambios respecto a lo último que se subió
+    anterior = leer_json(ruta_snapshot(nombre_hoja))
+    if completo is None:
+        completo = MODO_SINCRONIZACION != "diff"
+    # Una subida completa que se cortó deja la hoja a medias: hay que terminarla antes de hacer diffs
+    completo = completo or os.path.exists(ruta_progreso(nombre_hoja))
+    if completo or not anterior or anterior.get("cabecera") != cabecera or not con_claves:
+        # Sin snapshot que guardar, las filas se generan sobre la marcha mientras se suben
+        filas = list(filas_texto(df)) if con_claves else filas_texto(df)
+        subir_completo(worksheet, nombre_hoja, cabecera, filas, len(df), firma)
+        claves = claves_filas(cabecera, filas) if con_claves else []
+        orden_filas = filas
+        print(f"Datos actualizados en Google Sheets: {nombre_hoja} (subida completa, {len(df)} filas)")
+    else:
+        filas = list(filas_texto(df))
+        cambios, total_anterior, claves = planificar_cambios(anterior, cabecera, filas)
+        rangos = rangos_contiguos(cambios, total_anterior, len(claves), len(cabecera))
+        if rangos:
+            filas_necesarias = max(total_anterior, len(claves)) + 1
+            if worksheet.row_count < filas_necesarias:
+                con_reintentos(worksheet.add_rows, filas_necesarias - worksheet.row_count)
+            # Si falla a medias, el snapshot no cambia y el siguiente intento repite el mismo plan
+            enviar_rangos(worksheet, rangos)
+        nuevas = dict(zip(claves_filas(cabecera, filas), filas))
+        orden_filas = [nuevas[clave] for clave in claves]
+        print(f"Datos actualizados en Google Sheets: {nombre_hoja} "
+              f"({len(cambios)} filas cambiadas, {max(0, total_anterior - len(claves))} eliminadas)")
+
+    if con_claves:
+        guardar_json(ruta_snapshot(nombre_hoja), {
+            "actualizado": datetime.now().isoformat(timespec="seconds"),
+            "cabecera": cabecera,
+            "claves": claves,
+            "filas": orden_filas,
+        }, fsync=False)
+    return True
+
+
+def subir_a_google_sheets(nombre_archivo, nombre_hoja, completo=None):
     """""
-    Sube un archivo Excel a Google Sheets, reemplazando los datos existentes
+    Sube un archivo Excel a Google Sheets enviando solo las filas que han cambiado
     Args:
         nombre_archivo (str): Ruta del archivo Excel a subir
         nombre_hoja (str): Nombre de la hoja de cálculo en Google Sheets
+        completo (bool): Borrar y volver a subir toda la hoja (por defecto según SHEETS_SINCRONIZACION)
     """
     try:
         print(f"Subiendo {nombre_archivo} a Google Sheets...")
-        # 1. Configuración de credenciales
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive.file",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
-            "env/credentials.json", scope)
-        client = gspread.authorize(creds)
-        # 2. Leer el archivo Excel (con motor explícito)
+        # 1. Leer la exportación desde su caché (el Excel solo se parsea una vez)
         try:
-            # Primero intentamos con openpyxl (para .xlsx)
-            df = pd.read_excel(nombre_archivo, engine='openpyxl')
-        except:
-            # Si falla, probamos con xlrd (para .xls más antiguos)
+            ruta = actualizar_cache(nombre_archivo)
+            estado = os.stat(ruta)
+            firma = (estado.st_mtime_ns, estado.st_size)
+            df = columnas_originales(pd.read_pickle(ruta))
+        except Exception as e:
+            print(f"No se pudo leer el archivo Excel: {str(e)}")
+            return False
+        # 2. Subir a Google Sheets con el cliente y la hoja ya abiertos (un reintento si el token caducó)
+        for intento in range(2):
             try:
-                df = pd.read_excel(nombre_archivo, engine='xlrd')
-            except Exception as e:
-                print(f"No se pudo leer el archivo Excel: {str(e)}")
-                return False
-        # 3. Subir a Google Sheets
-        try:
-            spreadsheet = client.open(nombre_hoja)
-        except gspread.SpreadsheetNotFound:
-            print(f"Creando nueva hoja de cálculo: {nombre_hoja}")
-            spreadsheet = client.create(nombre_hoja)
-            # Compartir con el email autorizado
-            spreadsheet.share(os.getenv("GMAIL_FROM"), perm_type='user', role='writer')
-        worksheet = spreadsheet.sheet1
-        # 4. Limpiar y actualizar datos
-        worksheet.clear()
-        # Convertir todos los datos a string para evitar problemas de formato
-        data = [df.columns.values.tolist()] + df.astype(str).values.tolist()
-        worksheet.update(
-            data,
-            value_input_option='USER_ENTERED'
-        )
-        print(f"Datos actualizados en Google Sheets: {nombre_hoja}")
-        return True
+                worksheet = abrir_hoja(nombre_hoja).sheet1
+                return _sincronizar(worksheet, nombre_hoja, df, completo, firma)
+            except gspread.exceptions.APIError as e:
+                if intento or not _no_autorizado(e):
+                    raise
+                print("🔑 Token de Google caducado, autorizando de nuevo...")
+                invalidar_cliente()
     except Exception as e:
         print(f"Error al subir a Google Sheets: {str(e)}")
         print(traceback.format_exc())
-        return False
\ No newline at end of file
+        return False
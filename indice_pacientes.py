@@ -0,0 +1,189 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+import unicodedata
+import pandas as pd
+from almacenamiento import bloqueo_archivo, escribir_atomico
+from cache_excel import actualizar_cache
+
+# Índice persistente de pacientes, reconstruido solo cuando cambia la exportación de pacientes
+CARPETA_PACIENTES = os.path.abspath(os.path.join("data", "clientes"))
+NOMBRE_PACIENTES = "pacientes"
+# esiclinic sirve la exportación como .xls, .xlsx o tabla HTML (ver cache_excel.detectar_formato)
+EXTENSIONES_PACIENTES = (".xls", ".xlsx", ".html")
+COLUMNAS = ("Nombre", "Apellidos", "CIF", "E-Mail", "Móvil", "Teléfono")
+VERSION = 1
+
+_cache = {}
+_cache_bloqueo = threading.Lock()
+
+
+def normalizar_dni(dni):
+    return re.sub(r"[^0-9A-Z]", "", str(dni or "").upper())
+
+
+def normalizar_email(email):
+    return str(email or "").strip().lower()
+
+
+def normalizar_telefono(telefono):
+    """Últimos 9 dígitos del número, para comparar con o sin prefijo internacional"""
+    digitos = re.sub(r"\D", "", str(telefono or ""))
+    return digitos[-9:] if len(digitos) >= 9 else ""
+
+
+def normalizar_texto(texto):
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.lower().split())
+
+
+def ruta_pacientes(extension=None):
+    """Ruta de la exportación de pacientes
+
+    Con `extension`, la ruta con la que se guarda una descarga nueva. Sin ella, la exportación
+    más reciente que exista; si no hay ninguna se devuelve la de .xls y actualizar_cache
+    recurre a la caché guardada.
+    """
+    if extension:
+        return os.path.join(CARPETA_PACIENTES, NOMBRE_PACIENTES + extension.lower())
+    existentes = [ruta for ruta in map(ruta_pacientes, EXTENSIONES_PACIENTES) if os.path.exists(ruta)]
+    if existentes:
+        return max(existentes, key=os.path.getmtime)
+    return ruta_pacientes(EXTENSIONES_PACIENTES[0])
+
+
+def _texto(valor):
+    texto = str(valor).strip()
+    return texto[:-2] if texto.endswith(".0") and texto[:-2].isdigit() else texto
+
+
+def _firma(ruta):
+    estado = os.stat(ruta)
+    return estado.st_mtime_ns, estado.st_size
+
+
+def _hash_archivo(ruta):
+    sha1 = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(bloque)
+    return sha1.hexdigest()
+
+
+class IndicePacientes:
+    """Pacientes del Excel indexados por DNI/CIF, email, teléfono y palabras del nombre"""
+
+    def __init__(self, pacientes, firma=None, huella=None):
+        self.pacientes = pacientes
+        self.firma = firma
+        self.huella = huella
+        self._dni = {}
+        self._email = {}
+        self._telefono = {}
+        self._tokens = {}
+        for posicion, paciente in enumerate(pacientes):
+            self._agregar(self._dni, normalizar_dni(paciente.get("CIF")), posicion)
+            self._agregar(self._email, normalizar_email(paciente.get("E-Mail")), posicion)
+            for campo in ("Móvil", "Teléfono"):
+                self._agregar(self._telefono, normalizar_telefono(paciente.get(campo)), posicion)
+            nombre = f"{paciente.get('Nombre', '')} {paciente.get('Apellidos', '')}"
+            for token in set(normalizar_texto(nombre).split()):
+                self._agregar(self._tokens, token, posicion)
+
+    @staticmethod
+    def _agregar(indice, clave, posicion):
+        if clave:
+            posiciones = indice.setdefault(clave, [])
+            if posicion not in posiciones:
+                posiciones.append(posicion)
+
+    @classmethod
+    def desde_tabla(cls, df):
+        columnas = [c for c in COLUMNAS if c in df.columns]
+        if "CIF" not in columnas or "E-Mail" not in columnas:
+            raise ValueError("El archivo de pacientes no tiene las columnas esperadas (CIF, E-Mail)")
+        df = df[columnas].astype(object).where(df[columnas].notna(), "")
+        pacientes = [{c: _texto(v) for c, v in fila.items()} for fila in df.to_dict("records")]
+        return cls(pacientes)
+
+    def _filas(self, posiciones):
+        return [self.pacientes[p] for p in posiciones or []]
+
+    def por_dni(self, dni):
+        return self._filas(self._dni.get(normalizar_dni(dni)))
+
+    def por_email(self, email):
+        return self._filas(self._email.get(normalizar_email(email)))
+
+    def por_telefono(self, telefono):
+        return self._filas(self._telefono.get(normalizar_telefono(telefono)))
+
+    def por_nombre(self, texto):
+        """Pacientes cuyo nombre y apellidos contienen todas las palabras de `texto`"""
+        tokens = set(normalizar_texto(texto).split())
+        if not tokens:
+            return []
+        posiciones = None
+        for token in tokens:
+            encontradas = set(self._tokens.get(token, ()))
+            posiciones = encontradas if posiciones is None else posiciones & encontradas
+            if not posiciones:
+                return []
+        return self._filas(sorted(posiciones))
+
+    def buscar(self, identificador):
+        """Busca por DNI/CIF o email; devuelve (tipo, pacientes) con tipo "dni", "email" o None"""
+        pacientes = self.por_dni(identificador)
+        if pacientes:
+            return "dni", pacientes
+        pacientes = self.por_email(identificador)
+        if pacientes:
+            return "email", pacientes
+        return None, []
+
+
+def cargar_indice(ruta=None):
+    """Devuelve el índice de pacientes, reconstruyéndolo solo si la exportación ha cambiado
+
+    Por defecto se usa la exportación más reciente (ver ruta_pacientes). Se comprueba primero
+    fecha de modificación y tamaño de la caché; si difieren pero el contenido (hash) es el
+    mismo, se reutiliza el índice guardado sin reconstruirlo.
+    """
+    # Se trabaja sobre la caché tipada de la exportación (ver cache_excel)
+    ruta = actualizar_cache(os.path.abspath(ruta or ruta_pacientes()))
+    firma = _firma(ruta)
+    with _cache_bloqueo:
+        indice = _cache.get(ruta)
+        if indice is not None and indice.firma == firma:
+            return indice
+
+    ruta_indice = os.path.splitext(ruta)[0] + ".indice.pickle"
+    with bloqueo_archivo(ruta_indice):
+        guardado = None
+        try:
+            with open(ruta_indice, "rb") as f:
+                datos = pickle.load(f)
+            if datos.get("version") == VERSION:
+                guardado = datos
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+            pass
+
+        if guardado and guardado["firma"] == firma:
+            indice = guardado["indice"]
+        else:
+            huella = _hash_archivo(ruta)
+            if guardado and guardado["huella"] == huella:
+                indice = guardado["indice"]
+            else:
+                print("🗂️ Construyendo índice de pacientes...")
+                indice = IndicePacientes.desde_tabla(pd.read_pickle(ruta))
+            indice.firma, indice.huella = firma, huella
+            escribir_atomico(ruta_indice, pickle.dumps({
+                "version": VERSION, "firma": firma, "huella": huella, "indice": indice,
+            }, protocol=pickle.HIGHEST_PROTOCOL), fsync=False)
+
+    with _cache_bloqueo:
+        _cache[ruta] = indice
+    return indice
@@ -0,0 +1,236 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from sesion_esiclinic import iniciar_sesion
+import atexit
+import os
+import threading
+
+# Configuración común
+load_dotenv("env/.env")
+DESCARGAS_POR_DEFECTO = os.path.abspath("data")
+
+# Tamaño del pool y número de usos antes de reciclar un navegador
+TAMANO_POOL = int(os.getenv("POOL_NAVEGADORES", "2"))
+MAX_USOS = int(os.getenv("POOL_MAX_USOS", "20"))
+HEADLESS = os.getenv("NAVEGADOR_HEADLESS", "0") == "1"
+# Abrir los navegadores al arrancar (API y scripts) en lugar de en el primer uso
+CALENTAR = os.getenv("POOL_CALENTAR", "1") == "1"
+
+_ruta_chromedriver = None
+_bloqueo_driver = threading.Lock()
+
+
+def _chromedriver():
+    """Instala chromedriver una sola vez por proceso"""
+    global _ruta_chromedriver
+    with _bloqueo_driver:
+        if _ruta_chromedriver is None:
+            _ruta_chromedriver = ChromeDriverManager().install()
+        return _ruta_chromedriver
+
+
+def crear_navegador(descargas=DESCARGAS_POR_DEFECTO):
+    """Configura y retorna una instancia nueva del navegador Chrome"""
+    os.makedirs(descargas, exist_ok=True)
+    options = webdriver.ChromeOptions()
+    if HEADLESS:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    options.add_argument("--start-maximized")
+    options.add_argument("--disable-notifications")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option("prefs", {
+        "download.default_directory": descargas,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": False,
+    })
+    return webdriver.Chrome(service=Service(_chromedriver()), options=options)
+
+
+def fijar_carpeta_descargas(driver, carpeta):
+    """Cambia la carpeta de descargas de un navegador ya abierto"""
+    os.makedirs(carpeta, exist_ok=True)
+    driver.execute_cdp_cmd("Page.setDownloadBehavior", {
+        "behavior": "allow",
+        "downloadPath": os.path.abspath(carpeta),
+    })
+
+
+class PoolNavegadores:
+    """Conjunto de navegadores abiertos y con sesión iniciada que se prestan y devuelven"""
+
+    def __init__(self, tamano=TAMANO_POOL, max_usos=MAX_USOS):
+        self.tamano = max(1, tamano)
+        self.max_usos = max_usos
+        self._libres = []
+        self._usos = {}
+        self._abiertos = 0
+        self._condicion = threading.Condition()
+        self._cerrado = False
+
+    def _abrir(self):
+        """Abre un navegador con la sesión iniciada; si el login falla no entra en el pool"""
+        driver = crear_navegador()
+        if not iniciar_sesion(driver):
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            raise RuntimeError("No se pudo iniciar sesión en el navegador nuevo")
+        self._usos[id(driver)] = 0
+        return driver
+
+    def _descartar(self, driver):
+        self._usos.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _sano(driver):
+        """Comprueba que el navegador sigue respondiendo"""
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def calentar(self, cantidad=None):
+        """Abre por adelantado los navegadores que falten hasta llenar el pool"""
+        cantidad = self.tamano if cantidad is None else min(cantidad, self.tamano)
+        while True:
+            with self._condicion:
+                if self._cerrado or self._abiertos >= cantidad:
+                    return
+                self._abiertos += 1
+            try:
+                driver = self._abrir()
+            except Exception as e:
+                with self._condicion:
+                    self._abiertos -= 1
+                    # Quien espera en obtener() puede abrir él mismo el hueco que queda
+                    self._condicion.notify()
+                print(f"⚠️ No se pudo precalentar un navegador: {str(e)}")
+                return
+            with self._condicion:
+                cerrado = self._cerrado
+                if cerrado:
+                    self._abiertos -= 1
+                else:
+                    self._libres.append(driver)
+                    self._condicion.notify()
+            if cerrado:
+                self._descartar(driver)
+                return
+
+    def calentar_en_segundo_plano(self, cantidad=None):
+        """Lanza `calentar` en un hilo para no retrasar el arranque de quien lo llama"""
+        if not CALENTAR:
+            return None
+        hilo = threading.Thread(target=self.calentar, args=(cantidad,), name="calentar-pool", daemon=True)
+        hilo.start()
+        return hilo
+
+    def obtener(self, timeout=None):
+        """Presta un navegador con sesión iniciada, abriéndolo si hay hueco en el pool"""
+        with self._condicion:
+            while True:
+                if self._cerrado:
+                    raise RuntimeError("El pool de navegadores está cerrado")
+                if self._libres:
+                    driver = self._libres.pop()
+                    break
+                if self._abiertos < self.tamano:
+                    self._abiertos += 1
+                    driver = None
+                    break
+                if not self._condicion.wait(timeout):
+                    raise TimeoutError("No hay navegadores libres en el pool")
+
+        if driver is not None and self._sano(driver):
+            self._usos[id(driver)] += 1
+            return driver
+        if driver is not None:
+            print("♻️ Navegador del pool caído, abriendo uno nuevo...")
+            self._descartar(driver)
+        try:
+            driver = self._abrir()
+        except Exception:
+            with self._condicion:
+                self._abiertos -= 1
+                self._condicion.notify()
+            raise
+        self._usos[id(driver)] += 1
+        return driver
+
+    def devolver(self, driver, averiado=False):
+        """Devuelve un navegador al pool, reciclándolo si está gastado o no responde"""
+        reciclar = (
+            averiado
+            or self._cerrado
+            or self._usos.get(id(driver), self.max_usos) >= self.max_usos
+            or not self._sano(driver)
+        )
+        if reciclar:
+            self._descartar(driver)
+        with self._condicion:
+            if reciclar:
+                self._abiertos -= 1
+            else:
+                self._libres.append(driver)
+            self._condicion.notify()
+
+    @contextmanager
+    def prestar(self, descargas=None):
+        """Presta un navegador durante un bloque `with` y lo devuelve al terminar
+
+        Si el bloque lanza una excepción el navegador se descarta: puede haber quedado
+        a medias (p. ej. con un modal abierto) y no debe prestarse así a otro.
+        """
+        driver = self.obtener()
+        averiado = False
+        try:
+            if descargas:
+                fijar_carpeta_descargas(driver, descargas)
+            yield driver
+        except Exception:
+            averiado = True
+            raise
+        finally:
+            self.devolver(driver, averiado=averiado)
+
+    def cerrar(self):
+        """Cierra todos los navegadores libres del pool"""
+        with self._condicion:
+            self._cerrado = True
+            libres, self._libres = self._libres, []
+            self._abiertos -= len(libres)
+            self._condicion.notify_all()
+        for driver in libres:
+            self._descartar(driver)
+
+
+_pool = None
+_bloqueo_pool = threading.Lock()
+
+
+def obtener_pool():
+    """Devuelve el pool compartido del proceso, creándolo la primera vez"""
+    global _pool
+    with _bloqueo_pool:
+        if _pool is None:
+            _pool = PoolNavegadores()
+            atexit.register(_pool.cerrar)
+        return _pool
+
+
+def prestar_navegador(descargas=None):
+    """Atajo para `obtener_pool().prestar()`"""
+    return obtener_pool().prestar(descargas)
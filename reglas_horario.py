@@ -0,0 +1,114 @@
+from datetime import date, datetime
+from functools import lru_cache
+import json
+import os
+
+# Reglas de la clínica (horarios de cada agenda, facultativo por franja, salas y colores)
+RUTA_REGLAS = os.getenv("REGLAS_HORARIO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "reglas_horario.json"))
+MINUTOS_DIA = 24 * 60
+AGENDAS = (1, 2)
+
+
+@lru_cache(maxsize=None)
+def a_minutos(hora):
+    """'HH:MM' -> minutos desde medianoche"""
+    horas, minutos = hora.split(":")
+    return int(horas) * 60 + int(minutos)
+
+
+def a_fecha(fecha):
+    """Acepta date, datetime, 'YYYY-MM-DD' o 'DD-MM-YYYY'"""
+    if isinstance(fecha, datetime):
+        return fecha.date()
+    if isinstance(fecha, date):
+        return fecha
+    formato = "%d-%m-%Y" if fecha[2] == "-" else "%Y-%m-%d"
+    return datetime.strptime(fecha, formato).date()
+
+
+class ReglasHorario:
+    """Reglas de horario compiladas en tablas de consulta directa
+
+    Al cargar se precalcula, para cada paridad de semana, día, agenda y minuto del día,
+    qué facultativo atiende; y para cada paridad y día, las franjas de cada turno.
+    """
+
+    def __init__(self, reglas):
+        self.duracion_cita = reglas.get("duracion_cita", 45)
+        self.semana_base = date.fromisoformat(reglas["semana_base"])
+        self.facultativos = {
+            clave: {"clave": clave, "nombre": datos["nombre"], "color": tuple(datos["color"])}
+            for clave, datos in reglas["facultativos"].items()
+        }
+        self.salas = {int(agenda): sala for agenda, sala in reglas.get("salas", {}).items()}
+
+        # Franjas: [paridad][día] -> {turno: {"primaria": (ini, fin) | None, "secundaria": ...}}
+        self._franjas = [[{} for _ in range(7)] for _ in range(2)]
+        for turno in reglas["turnos"]:
+            papel = "primaria" if turno["agenda"] == 1 else "secundaria"
+            for paridad in self._paridades(turno):
+                for dia in turno["dias"]:
+                    franjas = self._franjas[paridad][dia].setdefault(
+                        turno["turno"], {"primaria": None, "secundaria": None})
+                    franjas[papel] = (turno["inicio"], turno["fin"])
+
+        # Asignaciones: [paridad][día][agenda] -> tupla de MINUTOS_DIA claves de facultativo
+        # (la primera regla que cubre un minuto es la que manda)
+        self._asignacion = {}
+        for paridad in (0, 1):
+            for dia in range(7):
+                for agenda in AGENDAS:
+                    tabla = [None] * MINUTOS_DIA
+                    for regla in reglas["asignaciones"]:
+                        if dia not in regla["dias"] or paridad not in self._paridades(regla):
+                            continue
+                        if regla.get("agenda", agenda) != agenda:
+                            continue
+                        inicio = a_minutos(regla.get("desde", "00:00"))
+                        fin = a_minutos(regla.get("hasta", "24:00"))
+                        for minuto in range(inicio, fin):
+                            if tabla[minuto] is None:
+                                tabla[minuto] = regla["facultativo"]
+                    self._asignacion[(paridad, dia, agenda)] = tuple(tabla)
+
+    @staticmethod
+    def _paridades(regla):
+        return (regla["paridad"],) if "paridad" in regla else (0, 1)
+
+    def paridad(self, fecha):
+        """0 en las semanas pares contadas desde `semana_base`, 1 en las impares"""
+        return ((a_fecha(fecha) - self.semana_base).days // 7) % 2
+
+    def horarios_del_dia(self, fecha):
+        """{turno: {"primaria": (ini, fin) | None, "secundaria": (ini, fin) | None}} de un día"""
+        fecha = a_fecha(fecha)
+        return self._franjas[self.paridad(fecha)][fecha.weekday()]
+
+    def facultativo(self, fecha, hora, agenda=1):
+        """Datos del facultativo que atiende una agenda a una hora, o None"""
+        fecha = a_fecha(fecha)
+        minuto = a_minutos(hora) if isinstance(hora, str) else hora
+        clave = self._asignacion[(self.paridad(fecha), fecha.weekday(), int(agenda))][minuto]
+        return self.facultativos.get(clave)
+
+    def nombre_facultativo(self, fecha, hora, agenda=1):
+        facultativo = self.facultativo(fecha, hora, agenda)
+        return facultativo["nombre"] if facultativo else None
+
+    def sala(self, agenda):
+        return self.salas.get(int(agenda), "Box 1")
+
+    def agenda_por_color(self, color_rgb, fecha, hora):
+        """'1' si el color es el del facultativo de la agenda principal a esa hora, '2' en otro caso"""
+        facultativo = self.facultativo(fecha, hora, 1)
+        if facultativo is None:
+            return "2"
+        return "1" if tuple(color_rgb or ()) == facultativo["color"] else "2"
+
+
+def cargar_reglas(ruta=RUTA_REGLAS):
+    with open(ruta, "r", encoding="utf-8") as f:
+        return ReglasHorario(json.load(f))
+
+
+REGLAS = cargar_reglas()
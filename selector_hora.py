@@ -0,0 +1,140 @@
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.common.by import By
+import re
+import time
+
+# Hora de las citas en el bootstrap-timepicker de esiclinic: se fija en una sola llamada con
+# su API de jQuery ("setTime") y se comprueba una vez. Las flechas del widget, que avanzan de
+# 5 en 5 minutos con un clic por paso, quedan solo como alternativa si la API no está.
+CAMPO_HORA = (By.ID, "citaHora")
+PASO_MINUTOS = 5
+
+# Devuelve el valor del campo tras fijarlo, o null si la página no tiene la API del timepicker
+_JS_FIJAR_HORA = """
+var $ = window.jQuery, campo = arguments[0], hora = arguments[1];
+if (!$ || !$.fn.timepicker) { return null; }
+var tienePicker = function () { return !!$(this).data('timepicker'); };
+var $campo = $(campo).filter(tienePicker);
+if (!$campo.length) {
+    $campo = $(campo).closest('.bootstrap-timepicker, .input-group, .modal').find('input').filter(tienePicker).first();
+}
+if (!$campo.length) { return null; }
+$campo.timepicker('setTime', hora);
+$campo.trigger('change');
+return $campo.val();
+"""
+
+
+def redondear_hora(hora):
+    """Convierte "HH:MM" en (horas, minutos) con los minutos redondeados al paso del timepicker
+
+    Raises:
+        ValueError: Si la hora no es válida
+    """
+    horas, minutos = map(int, str(hora).split(':')[:2])
+    if not (0 <= horas <= 23 and 0 <= minutos <= 59):
+        raise ValueError("Hora fuera de rango")
+    return horas, (minutos // PASO_MINUTOS) * PASO_MINUTOS
+
+
+def leer_hora(texto):
+    """(horas, minutos) de un valor del timepicker ("19:45" o "7:45 PM"), o None"""
+    coincidencia = re.match(r"\s*(\d{1,2}):(\d{2})\s*([AaPp][Mm])?", str(texto or ""))
+    if not coincidencia:
+        return None
+    horas, minutos = int(coincidencia.group(1)), int(coincidencia.group(2))
+    meridiano = (coincidencia.group(3) or "").upper()
+    if meridiano:
+        horas = horas % 12 + (12 if meridiano == "PM" else 0)
+    return horas, minutos
+
+
+def fijar_hora_api(driver, hora, localizador=CAMPO_HORA):
+    """Fija la hora con `$(campo).timepicker('setTime', ...)` y comprueba el valor resultante
+
+    Returns:
+        bool: True si el campo quedó con la hora pedida; None si la API no está disponible
+    """
+    horas, minutos = redondear_hora(hora)
+    try:
+        campo = WebDriverWait(driver, 5).until(EC.presence_of_element_located(localizador))
+    except Exception:
+        return None
+    valor = driver.execute_script(_JS_FIJAR_HORA, campo, f"{horas:02d}:{minutos:02d}")
+    if valor is None:
+        return None
+    return leer_hora(valor) == (horas, minutos)
+
+
+def ajustar_con_flechas(driver, hora, timepicker=None):
+    """Ajusta la hora pulsando las flechas del widget del timepicker, paso a paso
+
+    Args:
+        timepicker: Widget ya abierto; si no se indica, se abre con el icono del reloj
+    """
+    horas, minutos = redondear_hora(hora)
+    if timepicker is None:
+        reloj_icon = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, ".glyphicon-time"))
+        )
+        ActionChains(driver).move_to_element(reloj_icon).pause(0.3).click().perform()
+        timepicker = WebDriverWait(driver, 10).until(
+            EC.visibility_of_element_located((By.CSS_SELECTOR, ".bootstrap-timepicker-widget"))
+        )
+    input_hora = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-hour")
+    input_minuto = timepicker.find_element(By.CSS_SELECTOR, "input.bootstrap-timepicker-minute")
+    flecha_hora_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementHour']")
+    flecha_hora_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementHour']")
+    flecha_minuto_up = timepicker.find_element(By.CSS_SELECTOR, "[data-action='incrementMinute']")
+    flecha_minuto_down = timepicker.find_element(By.CSS_SELECTOR, "[data-action='decrementMinute']")
+
+    def pulsar(flecha, veces, pausa=0.2):
+        for _ in range(veces):
+            flecha.click()
+            time.sleep(pausa)
+
+    # Si al bajar los minutos el widget va a restar 1 hora, se compensa antes
+    if minutos < int(input_minuto.get_attribute("value")) and horas == int(input_hora.get_attribute("value")):
+        pulsar(flecha_hora_up, 1)
+
+    diferencia_horas = horas - int(input_hora.get_attribute("value"))
+    pulsar(flecha_hora_up if diferencia_horas > 0 else flecha_hora_down, abs(diferencia_horas))
+
+    minuto_actual = int(input_minuto.get_attribute("value"))
+    dif_normal = (minutos - minuto_actual) % 60
+    dif_inversa = (minuto_actual - minutos) % 60
+    if dif_normal <= dif_inversa:
+        pulsar(flecha_minuto_up, dif_normal // PASO_MINUTOS, 0.15)
+    else:
+        pulsar(flecha_minuto_down, dif_inversa // PASO_MINUTOS, 0.15)
+
+    # Corregir la hora si ha cambiado al dar la vuelta los minutos
+    diferencia_horas = horas - int(input_hora.get_attribute("value"))
+    pulsar(flecha_hora_up if diferencia_horas > 0 else flecha_hora_down, abs(diferencia_horas))
+
+    return (int(input_hora.get_attribute("value")), int(input_minuto.get_attribute("value"))) == (horas, minutos)
+
+
+def establecer_hora(driver, hora, localizador=CAMPO_HORA):
+    """Fija la hora de la cita: API del timepicker y, si no está disponible, flechas del widget
+
+    Returns:
+        bool: True si la hora quedó establecida y comprobada
+    """
+    horas, minutos = redondear_hora(hora)
+    objetivo = f"{horas:02d}:{minutos:02d}"
+    resultado = fijar_hora_api(driver, objetivo, localizador)
+    if resultado:
+        print(f"✅ Hora establecida correctamente: {objetivo}")
+        return True
+    if resultado is False:
+        print(f"⚠️ El timepicker no aceptó {objetivo}, probando con las flechas...")
+    else:
+        print("ℹ️ API del timepicker no disponible, usando las flechas...")
+    if ajustar_con_flechas(driver, objetivo):
+        print(f"✅ Hora establecida con flechas: {objetivo}")
+        return True
+    print(f"⚠️ La hora resultante no coincide con {objetivo}")
+    return False
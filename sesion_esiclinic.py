@@ -0,0 +1,134 @@
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from datetime import datetime
+from dotenv import load_dotenv
+import json
+import os
+import requests
+from almacenamiento import guardar_json
+
+# Configuración común
+load_dotenv("env/.env")
+URL_LOGIN = "https://esiclinic.com/"
+URL_AGENDA = "https://app.esiclinic.com/agenda.php"
+# Página ligera del dominio de la aplicación, necesaria para poder inyectar cookies
+URL_BASE_APP = "https://app.esiclinic.com/favicon.ico"
+RUTA_SESION = os.path.abspath("data/sesion_esiclinic.json")
+
+
+def cargar_cookies():
+    """Lee las cookies de la última sesión guardada, o None si no hay ninguna"""
+    try:
+        with open(RUTA_SESION, "r", encoding="utf-8") as f:
+            return json.load(f).get("cookies") or None
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def guardar_sesion(driver):
+    """Guarda en disco las cookies de una sesión recién iniciada"""
+    try:
+        datos = {
+            "guardado": datetime.now().isoformat(timespec="seconds"),
+            "cookies": driver.get_cookies(),
+        }
+        # Varios navegadores del pool pueden iniciar sesión a la vez
+        guardar_json(RUTA_SESION, datos, modo=0o600)
+        print("🍪 Sesión de esiclinic guardada para próximas ejecuciones")
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar la sesión: {str(e)}")
+
+
+def borrar_sesion():
+    """Elimina la sesión guardada (por ejemplo, tras detectar que ha caducado)"""
+    try:
+        os.remove(RUTA_SESION)
+    except FileNotFoundError:
+        pass
+
+
+def sesion_http(cookies=None):
+    """Crea una `requests.Session` con las cookies de esiclinic cargadas"""
+    sesion = requests.Session()
+    sesion.headers["User-Agent"] = "Mozilla/5.0 (FisioAutomatizacion)"
+    for cookie in cookies or []:
+        sesion.cookies.set(
+            cookie["name"], cookie["value"],
+            domain=cookie.get("domain"), path=cookie.get("path", "/")
+        )
+    return sesion
+
+
+def sesion_http_valida(sesion):
+    """Comprueba con una sola petición que las cookies siguen dando acceso a la agenda"""
+    try:
+        respuesta = sesion.get(URL_AGENDA, allow_redirects=False, timeout=10)
+        return respuesta.status_code == 200 and "esi_pass" not in respuesta.text
+    except requests.RequestException as e:
+        print(f"⚠️ No se pudo comprobar la sesión guardada: {str(e)}")
+        return False
+
+
+def sesion_iniciada(driver):
+    """Indica si el navegador ya tiene una sesión activa en esiclinic y lo deja en la agenda"""
+    if "esiclinic.com" not in (driver.current_url or ""):
+        # Navegador recién abierto: no hay sesión que comprobar
+        return False
+    driver.get(URL_AGENDA)
+    return "agenda.php" in driver.current_url and not driver.find_elements(By.ID, "esi_user")
+
+
+def inyectar_cookies(driver, cookies):
+    """Carga las cookies guardadas en el navegador y abre la agenda"""
+    driver.get(URL_BASE_APP)
+    for cookie in cookies:
+        cookie = {k: v for k, v in cookie.items() if k in ("name", "value", "domain", "path", "secure", "httpOnly", "expiry")}
+        try:
+            driver.add_cookie(cookie)
+        except Exception:
+            # Cookies de otro dominio (p. ej. esiclinic.com): no hacen falta en la aplicación
+            continue
+    driver.get(URL_AGENDA)
+    return "agenda.php" in driver.current_url and not driver.find_elements(By.ID, "esi_user")
+
+
+def restaurar_sesion(driver):
+    """Reutiliza la sesión del navegador o la guardada en disco; False si hay que hacer login"""
+    try:
+        if sesion_iniciada(driver):
+            print("♻️ Sesión reutilizada del navegador")
+            return True
+        cookies = cargar_cookies()
+        if not cookies:
+            return False
+        if not sesion_http_valida(sesion_http(cookies)):
+            print("⌛ La sesión guardada ha caducado, iniciando sesión de nuevo...")
+            borrar_sesion()
+            return False
+        if inyectar_cookies(driver, cookies):
+            print("🍪 Sesión restaurada desde cookies guardadas")
+            return True
+        return False
+    except Exception as e:
+        print(f"⚠️ No se pudo restaurar la sesión: {str(e)}")
+        return False
+
+
+def iniciar_sesion(driver):
+    """Inicia sesión en esiclinic, reutilizando la sesión guardada si sigue activa"""
+    try:
+        if restaurar_sesion(driver):
+            return True
+        driver.get(URL_LOGIN)
+        WebDriverWait(driver, 15).until(
+            EC.presence_of_element_located((By.ID, "esi_user"))
+        ).send_keys(os.getenv("USUARIO_ESICLINIC"))
+        driver.find_element(By.ID, "esi_pass").send_keys(os.getenv("PASSWORD_ESICLINIC"))
+        driver.execute_script("arguments[0].click();", driver.find_element(By.ID, "bt_acceder"))
+        WebDriverWait(driver, 15).until(EC.url_contains("agenda.php"))
+        guardar_sesion(driver)
+        return True
+    except Exception as e:
+        print(f"⚠️ No se pudo iniciar sesión: {str(e)}")
+        return False
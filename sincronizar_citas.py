@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urljoin
+from dotenv import load_dotenv
+import argparse
+import hashlib
+import json
+import os
+from extraer_citas import (
+    SEMANAS, lunes_de, rangos_semanales, normalizar_evento, leer_fuente_eventos,
+    citas_desde_eventos, unir_citas, clave_cita, guardar_citas, extraer_citas_por_semanas
+)
+from pool_navegadores import prestar_navegador
+from almacen_citas import todas_las_citas
+from almacenamiento import leer_json, guardar_json
+from sesion_esiclinic import URL_AGENDA, cargar_cookies, sesion_http, sesion_http_valida, iniciar_sesion
+
+# Cargar variables de entorno
+load_dotenv("env/.env")
+
+RUTA_CITAS = os.path.join("data", "citas_2_semanas.json")
+RUTA_ESTADO = os.path.join("data", "sincronizacion_citas.json")
+RUTA_DELTA = os.path.join("data", "cambios_citas.json")
+# Si la última sincronización es más reciente que esto, se reutiliza sin consultar nada
+ANTIGUEDAD_MAXIMA = int(os.getenv("SINCRONIZACION_MAX_SEGUNDOS", "60"))
+
+
+def hash_eventos(eventos):
+    """Huella del contenido de una semana, independiente del orden de los eventos"""
+    filas = sorted(
+        json.dumps({k: v for k, v in ev.items() if k != "rango"}, sort_keys=True, ensure_ascii=False)
+        for ev in eventos
+    )
+    return hashlib.sha1("\n".join(filas).encode("utf-8")).hexdigest()
+
+
+def hash_citas(citas):
+    """Huella de las citas guardadas de una semana, para comprobar que el almacén sigue al día"""
+    filas = sorted(
+        json.dumps([c["dia"], c["hora_inicio"], c["hora_fin"], c["paciente"], str(c["agenda"])], ensure_ascii=False)
+        for c in citas
+    )
+    return hashlib.sha1("\n".join(filas).encode("utf-8")).hexdigest()
+
+
+def eventos_por_http(feed, rangos):
+    """Consulta el feed JSON del calendario directamente, sin navegador, una petición por semana"""
+    sesion = sesion_http(cargar_cookies())
+    if not sesion_http_valida(sesion):
+        raise RuntimeError("No hay una sesión guardada válida")
+    url = urljoin(URL_AGENDA, feed["url"])
+
+    def pedir(rango):
+        parametros = dict(feed.get("datos") or {})
+        parametros[feed.get("inicio", "start")] = rango[0]
+        parametros[feed.get("fin", "end")] = rango[1]
+        respuesta = sesion.get(url, params=parametros, timeout=30)
+        respuesta.raise_for_status()
+        return [normalizar_evento(ev, feed.get("color"), rango[0]) for ev in respuesta.json()]
+
+    with ThreadPoolExecutor(max_workers=min(len(rangos), 8) or 1) as executor:
+        listas = list(executor.map(pedir, rangos))
+    return {rango[0]: lista for rango, lista in zip(rangos, listas)}
+
+
+def eventos_por_navegador(rangos):
+    """Consulta las fuentes del calendario desde un navegador del pool"""
+    with prestar_navegador() as driver:
+        if not iniciar_sesion(driver):
+            raise RuntimeError("No se pudo iniciar sesión en esiclinic")
+        resultado = leer_fuente_eventos(driver, rangos)
+    por_semana = {rango[0]: [] for rango in rangos}
+    for evento in resultado["eventos"]:
+        por_semana.setdefault(evento.get("rango"), []).append(evento)
+    return por_semana, resultado.get("feed")
+
+
+def calcular_delta(anteriores, nuevas):
+    """Compara dos listas de citas y devuelve las añadidas, eliminadas y movidas"""
+    previas = {clave_cita(c): c for c in anteriores}
+    actuales = {clave_cita(c): c for c in nuevas}
+    eliminadas = [c for k, c in previas.items() if k not in actuales]
+    añadidas = [c for k, c in actuales.items() if k not in previas]
+
+    # Una cita que desaparece y reaparece para el mismo paciente se considera movida
+    movidas = []
+    for cita in list(eliminadas):
+        destino = next((c for c in añadidas if c["paciente"] == cita["paciente"]), None)
+        if destino is None:
+            continue
+        eliminadas.remove(cita)
+        añadidas.remove(destino)
+        movidas.append({
+            "paciente": cita["paciente"],
+            "antes": {k: cita[k] for k in ("dia", "hora_inicio", "hora_fin", "agenda")},
+            "despues": {k: destino[k] for k in ("dia", "hora_inicio", "hora_fin", "agenda")},
+        })
+    return {"añadidas": añadidas, "eliminadas": eliminadas, "movidas": movidas}
+
+
+def sincronizar_citas(semanas=SEMANAS, forzar=False):
+    """Actualiza el JSON de citas procesando solo las semanas cuyo contenido ha cambiado
+
+    Args:
+        semanas (int): Número de semanas a sincronizar desde la actual
+        forzar (bool): Ignorar la marca de la última sincronización
+    Returns:
+        dict: Cambios detectados ({"añadidas", "eliminadas", "movidas"})
+    """
+    estado = leer_json(RUTA_ESTADO, {})
+    ahora = datetime.now()
+    hoy = ahora.date()
+    sin_cambios = {"añadidas": [], "eliminadas": [], "movidas": []}
+
+    marca = estado.get("marca")
+    if (not forzar and marca and os.path.exists(RUTA_CITAS)
+            and estado.get("horizonte", 0) >= semanas
+            and ahora - datetime.fromisoformat(marca) < timedelta(seconds=ANTIGUEDAD_MAXIMA)):
+        print(f"✅ Citas sincronizadas hace menos de {ANTIGUEDAD_MAXIMA} s, no hace falta consultar")
+        return sin_cambios
+
+    lunes = lunes_de(hoy)
+    rangos = rangos_semanales(lunes, lunes + timedelta(weeks=semanas))
+    feed = estado.get("feed")
+    eventos_semana = None
+
+    if feed:
+        try:
+            eventos_semana = eventos_por_http(feed, rangos)
+            print("⚡ Semanas consultadas por HTTP sin abrir el navegador")
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar el feed por HTTP ({str(e)}), usando el navegador...")
+    if eventos_semana is None:
+        try:
+            eventos_semana, feed = eventos_por_navegador(rangos)
+        except Exception as e:
+            print(f"⚠️ Fuente de eventos no disponible ({str(e)})")
+
+    anteriores = [
+        {k: v for k, v in c.items() if k not in ("id", "dni")}
+        for c in todas_las_citas(desde=hoy.isoformat())
+    ]
+    hashes = {}
+    nuevas = None
+
+    if eventos_semana is not None:
+        previas_por_semana = {}
+        for cita in anteriores:
+            semana = lunes_de(datetime.strptime(cita["dia"], "%Y-%m-%d").date()).isoformat()
+            previas_por_semana.setdefault(semana, []).append(cita)
+        try:
+            partes = []
+            for desde, _ in rangos:
+                huella = hash_eventos(eventos_semana.get(desde, []))
+                previas = previas_por_semana.get(desde, [])
+                # Se reutilizan las citas guardadas solo si los eventos no han cambiado y el
+                # almacén tiene exactamente las citas que se guardaron (p. ej. no se ha borrado citas.db)
+                if estado.get("semanas", {}).get(desde) == {"eventos": huella, "citas": hash_citas(previas)}:
+                    parte = previas
+                else:
+                    print(f"🔄 Semana del {desde} con cambios, actualizando...")
+                    parte = citas_desde_eventos(eventos_semana.get(desde, []), lunes)
+                hashes[desde] = {"eventos": huella, "citas": hash_citas(parte)}
+                partes.append(parte)
+            nuevas = unir_citas(*partes)
+        except Exception as e:
+            print(f"⚠️ No se pudieron procesar los eventos ({str(e)})")
+            hashes = {}
+
+    if nuevas is None:
+        print("🐢 Haciendo una extracción completa de la agenda...")
+        nuevas = extraer_citas_por_semanas(semanas=semanas, modo="dom")
+        if nuevas is None:
+            return sin_cambios
+        feed = None
+
+    for cita in nuevas:
+        cita["semana"] = (datetime.strptime(cita["dia"], "%Y-%m-%d").date() - lunes).days // 7 + 1
+
+    delta = calcular_delta(anteriores, nuevas)
+    if any(delta.values()) or estado.get("lunes") != lunes.isoformat() or not os.path.exists(RUTA_CITAS):
+        guardar_citas(nuevas)
+
+    guardar_json(RUTA_ESTADO, {
+        "marca": ahora.isoformat(timespec="seconds"),
+        "horizonte": semanas,
+        "lunes": lunes.isoformat(),
+        "feed": feed,
+        "semanas": hashes,
+    })
+    guardar_json(RUTA_DELTA, dict(delta, marca=ahora.isoformat(timespec="seconds")))
+
+    print(f"📊 Sincronización: {len(delta['añadidas'])} añadidas, "
+          f"{len(delta['eliminadas'])} eliminadas, {len(delta['movidas'])} movidas")
+    return delta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza de forma incremental las citas de esiclinic")
+    parser.add_argument("--semanas", type=int, default=SEMANAS, help="número de semanas a sincronizar")
+    parser.add_argument("--forzar", action="store_true", help="ignorar la marca de la última sincronización")
+    args = parser.parse_args()
+    sincronizar_citas(semanas=args.semanas, forzar=args.forzar)
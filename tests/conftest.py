@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import almacen_citas
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    """Almacén de citas vacío en una carpeta temporal"""
+    monkeypatch.setattr(almacen_citas, "RUTA_BD", str(tmp_path / "citas.db"))
+    monkeypatch.setattr(almacen_citas, "RUTA_JSON", str(tmp_path / "citas.json"))
+    monkeypatch.setattr(almacen_citas, "_local", almacen_citas.threading.local())
+    yield almacen_citas
+    con = getattr(almacen_citas._local, "con", None)
+    if con is not None:
+        con.close()
@@ -0,0 +1,60 @@
+import sqlite3
+
+
+def cita(dia, hora, paciente, agenda="1", hora_fin="10:00"):
+    return {"semana": 1, "dia": dia, "hora_inicio": hora, "hora_fin": hora_fin,
+            "paciente": paciente, "agenda": agenda}
+
+
+def ids_por_paciente(almacen):
+    return {c["paciente"]: c["id"] for c in almacen.todas_las_citas()}
+
+
+def test_reemplazar_conserva_ids_de_citas_existentes(almacen):
+    almacen.reemplazar_citas([cita("2026-10-20", "09:00", "Ana Ruiz"), cita("2026-10-21", "10:00", "Luis Paz")])
+    antes = ids_por_paciente(almacen)
+
+    almacen.reemplazar_citas([cita("2026-10-21", "10:00", "Luis Paz", hora_fin="10:45"),
+                              cita("2026-10-20", "09:00", "Ana Ruiz")])
+
+    assert ids_por_paciente(almacen) == antes
+    assert almacen.obtener_cita(antes["Luis Paz"])["hora_fin"] == "10:45"
+
+
+def test_ids_de_citas_borradas_no_se_reutilizan(almacen):
+    almacen.reemplazar_citas([cita("2026-10-20", "09:00", "Ana Ruiz")])
+    id_ana = ids_por_paciente(almacen)["Ana Ruiz"]
+
+    almacen.reemplazar_citas([cita("2026-10-21", "10:00", "Luis Paz")])
+
+    assert almacen.obtener_cita(id_ana) is None
+    assert ids_por_paciente(almacen)["Luis Paz"] != id_ana
+    assert almacen.buscar_por_paciente("ruiz ana") == []
+
+
+def test_reemplazar_mantiene_dni_conocido(almacen):
+    id_cita = almacen.insertar_cita("2026-10-20", "09:00", "09:45", "Ana Ruiz", dni="12345678z")
+    almacen.reemplazar_citas([cita("2026-10-20", "09:00", "Ana Ruiz"), cita("2026-10-27", "09:00", "Ana Ruiz")])
+
+    citas = almacen.buscar_por_dni("12345678Z")
+    assert [c["dia"] for c in citas] == ["2026-10-20", "2026-10-27"]
+    assert citas[0]["id"] == id_cita
+
+
+def test_migra_tabla_sin_autoincremento(tmp_path, almacen):
+    con = sqlite3.connect(almacen.RUTA_BD)
+    con.executescript("""
+        CREATE TABLE citas (id INTEGER PRIMARY KEY, semana INTEGER, dia TEXT NOT NULL, hora_inicio TEXT NOT NULL,
+            hora_fin TEXT NOT NULL, paciente TEXT NOT NULL, paciente_norm TEXT NOT NULL,
+            agenda TEXT NOT NULL DEFAULT '1', dni TEXT);
+        CREATE TABLE citas_tokens (token TEXT NOT NULL, cita_id INTEGER NOT NULL REFERENCES citas (id)
+            ON DELETE CASCADE, PRIMARY KEY (token, cita_id)) WITHOUT ROWID;
+        INSERT INTO citas VALUES (7, 1, '2026-10-20', '09:00', '09:45', 'Ana Ruiz', 'ana ruiz', '1', NULL);
+        INSERT INTO citas_tokens VALUES ('ana', 7), ('ruiz', 7);
+    """)
+    con.commit()
+    con.close()
+
+    assert [c["id"] for c in almacen.buscar_por_paciente("Ana Ruiz")] == [7]
+    almacen.reemplazar_citas([cita("2026-10-21", "10:00", "Luis Paz")])
+    assert ids_por_paciente(almacen)["Luis Paz"] == 8
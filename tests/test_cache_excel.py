@@ -0,0 +1,60 @@
+import os
+import pandas as pd
+import pytest
+import indice_pacientes
+from cache_excel import detectar_formato, leer_exportacion, exportacion_mas_reciente
+from indice_pacientes import ruta_pacientes
+
+
+@pytest.mark.parametrize("cabecera, formato", [
+    (b"PK\x03\x04\x14\x00\x06\x00", "xlsx"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1\x00\x00", "xls"),
+    (b"<html><body><table>", "html"),
+    (b"\xef\xbb\xbf\r\n  <TABLE border=1>", "html"),  # BOM, saltos de línea y mayúsculas
+    (b"Listado de pacientes\n<table>", "html"),      # texto antes de la tabla
+])
+def test_detectar_formato(cabecera, formato):
+    assert detectar_formato(cabecera) == formato
+
+
+@pytest.mark.parametrize("cabecera", [b"", b"Nombre;DNI\n", b"PK\x03", b"%PDF-1.4"])
+def test_formato_desconocido(cabecera):
+    with pytest.raises(ValueError):
+        detectar_formato(cabecera)
+
+
+def test_xlsx_con_extension_xls_se_lee_por_contenido(tmp_path):
+    ruta = tmp_path / "pacientes.xls"
+    pd.DataFrame({"Nombre": ["Ana"], "CIF": ["12345678Z"]}).to_excel(ruta, index=False, engine="openpyxl")
+    df = leer_exportacion(str(ruta))
+    assert df.to_dict("records") == [{"Nombre": "Ana", "CIF": "12345678Z"}]
+
+
+def test_ruta_pacientes_elige_la_exportacion_mas_reciente(tmp_path, monkeypatch):
+    monkeypatch.setattr(indice_pacientes, "CARPETA_PACIENTES", str(tmp_path))
+    assert ruta_pacientes() == str(tmp_path / "pacientes.xls")
+    assert ruta_pacientes(".XLSX") == str(tmp_path / "pacientes.xlsx")
+
+    for extension, antiguedad in ((".xls", 200), (".html", 100), (".xlsx", 300)):
+        ruta = tmp_path / ("pacientes" + extension)
+        ruta.write_bytes(b"")
+        os.utime(ruta, (1_000_000 - antiguedad, 1_000_000 - antiguedad))
+    assert ruta_pacientes() == str(tmp_path / "pacientes.html")
+
+
+def test_exportacion_mas_reciente_se_reconoce_por_contenido(tmp_path):
+    assert exportacion_mas_reciente(str(tmp_path)) is None
+    archivos = {
+        "listadodecitas.xls": b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",
+        "listado_2026-10-18": b"<html><table></table></html>",  # nombre de Content-Disposition sin extensión
+        "listadodecitas.cache.pkl": b"PK\x03\x04",
+        "citas.json": b"[]",
+        "descarga.xlsx.part": b"PK\x03\x04",
+    }
+    # Cada archivo es más reciente que el anterior
+    for orden, (nombre, contenido) in enumerate(archivos.items()):
+        ruta = tmp_path / nombre
+        ruta.write_bytes(contenido)
+        os.utime(ruta, (1_000_000 + orden, 1_000_000 + orden))
+    (tmp_path / "sheets").mkdir()
+    assert exportacion_mas_reciente(str(tmp_path)) == str(tmp_path / "listado_2026-10-18")
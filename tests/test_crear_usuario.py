@@ -0,0 +1,60 @@
+import importlib
+import pandas as pd
+import pytest
+
+PACIENTES = [
+    {"nombre": "Ana", "apellidos": "Ruiz", "dni": "12345678Z", "movil": "600111222", "email": "ana@example.com"},
+    {"nombre": "Luis", "apellidos": "Gil", "dni": "87654321X", "movil": "600333444", "email": "luis@example.com"},
+]
+
+
+@pytest.fixture
+def crear_usuario(tmp_path, monkeypatch):
+    """Crear_usuario con un automatizador sin navegador que crea siempre al paciente"""
+    # Al importarse crea la carpeta logs/ en el directorio actual
+    monkeypatch.chdir(tmp_path)
+    modulo = importlib.import_module("Crear_usuario")
+
+    def sin_indice(ruta=None):
+        raise FileNotFoundError(ruta)
+
+    creados = []
+    monkeypatch.setattr(modulo, "cargar_indice", sin_indice)
+    monkeypatch.setattr(modulo.ESIClinicAutomator, "__init__", lambda self: setattr(self, "driver", None))
+    monkeypatch.setattr(modulo.ESIClinicAutomator, "login", lambda self: True)
+    monkeypatch.setattr(modulo.ESIClinicAutomator, "close", lambda self: None)
+    monkeypatch.setattr(modulo.ESIClinicAutomator, "create_patient",
+                        lambda self, paciente, reload_page=True: creados.append(paciente['dni']) or True)
+    modulo.creados = creados
+    return modulo
+
+
+def test_reanuda_desde_el_informe_anterior(crear_usuario, tmp_path):
+    ruta = str(tmp_path / "pacientes.csv")
+    pd.DataFrame(PACIENTES).to_csv(ruta, index=False)
+    pd.DataFrame([
+        {"fila": 1, "dni": "12345678Z", "nombre": "Ana", "apellidos": "Ruiz", "estado": "creado", "mensaje": "2026-10-01T10:00:00"},
+        {"fila": 2, "dni": "87654321X", "nombre": "Luis", "apellidos": "Gil", "estado": "error", "mensaje": "Hubo un error"},
+    ]).to_csv(crear_usuario.ruta_informe(ruta), index=False)
+
+    resumen = crear_usuario.importar_pacientes(ruta)
+
+    assert crear_usuario.creados == ["87654321X"]
+    assert resumen["creados"] == 1 and resumen["fallidos"] == 0
+    informe = pd.read_csv(resumen["informe"], dtype=str)
+    assert informe["fila"].tolist() == ["1", "2"]
+    assert informe["estado"].tolist() == ["creado", "creado"]
+    assert informe["mensaje"][0] == "2026-10-01T10:00:00"
+
+
+def test_informe_con_otro_dni_en_la_fila_no_se_reutiliza(crear_usuario, tmp_path):
+    ruta = str(tmp_path / "pacientes.csv")
+    pd.DataFrame(PACIENTES).to_csv(ruta, index=False)
+    pd.DataFrame([
+        {"fila": 1, "dni": "11111111H", "nombre": "Eva", "apellidos": "Sanz", "estado": "creado", "mensaje": ""},
+    ]).to_csv(crear_usuario.ruta_informe(ruta), index=False)
+
+    resumen = crear_usuario.importar_pacientes(ruta)
+
+    assert crear_usuario.creados == ["12345678Z", "87654321X"]
+    assert resumen["creados"] == 2
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+import pytest
+from disponibilidad import IndiceOcupacion, disponibilidad_dia, horas_libres, buscar_huecos, a_hora
+from reglas_horario import a_minutos
+
+DIA = "2026-10-22"
+
+
+def cita(hora_inicio, hora_fin, agenda="1", dia=DIA, paciente="Ana Ruiz"):
+    return {"dia": dia, "hora_inicio": hora_inicio, "hora_fin": hora_fin, "agenda": agenda, "paciente": paciente}
+
+
+def proximo_jueves():
+    hoy = date.today()
+    return hoy + timedelta(days=(3 - hoy.weekday()) % 7 or 7)
+
+
+@pytest.mark.parametrize("inicio, fin, ocupado", [
+    ("10:00", "10:45", True),   # misma franja
+    ("10:30", "11:15", True),   # empieza dentro
+    ("09:30", "10:15", True),   # termina dentro
+    ("09:15", "10:00", False),  # termina justo cuando empieza la cita
+    ("10:45", "11:30", False),  # empieza justo cuando termina la cita
+])
+def test_ocupado_respeta_los_bordes(inicio, fin, ocupado):
+    indice = IndiceOcupacion([cita("10:00", "10:45")])
+    assert indice.ocupado(DIA, 1, a_minutos(inicio), a_minutos(fin)) is ocupado
+
+
+def test_cita_larga_tapa_las_que_empiezan_despues():
+    # La cita de 11:00 termina a las 11:15, pero la de 10:00 sigue abierta hasta las 13:00
+    indice = IndiceOcupacion([cita("10:00", "13:00"), cita("11:00", "11:15")])
+    assert indice.ocupado(DIA, 1, a_minutos("12:15"), a_minutos("12:30"))
+    assert not indice.ocupado(DIA, 1, a_minutos("13:00"), a_minutos("13:45"))
+
+
+def test_agendas_y_dias_independientes():
+    indice = IndiceOcupacion([cita("10:00", "10:45", agenda="2")])
+    assert indice.ocupado(DIA, 2, a_minutos("10:00"), a_minutos("10:45"))
+    assert indice.ocupado(DIA, "2", a_minutos("10:00"), a_minutos("10:45"))
+    assert not indice.ocupado(DIA, 1, a_minutos("10:00"), a_minutos("10:45"))
+    assert not indice.ocupado("2026-10-23", 2, a_minutos("10:00"), a_minutos("10:45"))
+
+
+def test_huecos_de_una_franja():
+    indice = IndiceOcupacion([cita("11:00", "11:45")])
+    assert indice.huecos(DIA, 1, ("10:15", "12:30"), 45) == [("10:15", True), ("11:00", False), ("11:45", True)]
+
+
+def test_a_hora():
+    assert a_hora(615) == "10:15"
+    assert a_hora(0) == "00:00"
+
+
+def test_agenda_secundaria_solo_si_la_principal_esta_llena():
+    jueves = proximo_jueves().isoformat()
+    libre = disponibilidad_dia(jueves, IndiceOcupacion())
+    assert [(b["turno"], b["agenda"]) for b in libre] == [("manana", 1), ("tarde", 1)]
+
+    mañana_llena = IndiceOcupacion([cita("10:15", "14:00", dia=jueves)])
+    bloques = disponibilidad_dia(jueves, mañana_llena)
+    assert [(b["turno"], b["agenda"]) for b in bloques] == [("manana", 1), ("manana", 2), ("tarde", 1)]
+    assert horas_libres(bloques)[:2] == [("10:30", 2), ("11:15", 2)]
+
+
+def test_buscar_huecos_salta_los_ocupados_y_filtra(almacen):
+    jueves = proximo_jueves()
+    almacen.insertar_cita(jueves.isoformat(), "10:15", "11:00", "Ana Ruiz", agenda="1")
+
+    huecos = buscar_huecos(desde=jueves, hasta=jueves, cantidad=2)
+    assert [(h["hora"], h["agenda"]) for h in huecos] == [("11:00", 1), ("11:45", 1)]
+    assert {h["facultativo"] for h in huecos} == {"Jose Cabanes"}
+
+    assert buscar_huecos(desde=jueves, hasta=jueves, facultativo="david") == []
+    tarde = buscar_huecos(desde=jueves, hasta=jueves, cantidad=1, turno="tarde")
+    assert [(h["hora"], h["turno"]) for h in tarde] == [("15:00", "tarde")]
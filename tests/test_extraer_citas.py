@@ -0,0 +1,108 @@
+import pytest
+import extraer_citas
+
+
+class NavegadorFalso:
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.visitas = []
+
+    def get(self, url):
+        self.visitas.append(url)
+
+
+class PoolFalso:
+    def __init__(self, libres):
+        self.tamano = len(libres) + 1
+        self.libres = list(libres)
+        self.devueltos = []
+
+    def obtener(self, timeout=None):
+        if not self.libres:
+            raise TimeoutError
+        return self.libres.pop(0)
+
+    def devolver(self, driver, averiado=False):
+        self.devueltos.append((driver.nombre, averiado))
+
+
+def cita(semana):
+    return {"dia": f"2026-10-{semana + 10}", "hora_inicio": "10:00", "hora_fin": "10:45",
+            "paciente": "Ana Ruiz", "agenda": "1", "semana": semana + 1}
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    """Pool con un navegador libre y un lector de semanas que falla donde se le indique"""
+    pool = PoolFalso([NavegadorFalso("extra")])
+    fallos = {}  # nombre del navegador -> "todo" o semanas que fallan
+    leidas = []
+
+    def extraer_grupo(driver, semanas):
+        fallo = fallos.get(driver.nombre, ())
+        if fallo == "todo":
+            raise RuntimeError("navegador caído")
+        leidas.append((driver.nombre, list(semanas)))
+        return [cita(s) for s in semanas if s not in fallo], [s for s in semanas if s in fallo]
+
+    monkeypatch.setattr(extraer_citas, "obtener_pool", lambda: pool)
+    monkeypatch.setattr(extraer_citas, "iniciar_sesion", lambda driver: True)
+    monkeypatch.setattr(extraer_citas, "extraer_grupo_dom", extraer_grupo)
+    return pool, fallos, leidas
+
+
+def test_reparte_las_semanas_y_devuelve_los_navegadores(entorno):
+    pool, _, leidas = entorno
+    citas = extraer_citas.extraer_citas_dom(NavegadorFalso("principal"), semanas=4, paralelo=2)
+    assert [c["semana"] for c in citas] == [1, 2, 3, 4]
+    assert sorted(leidas) == [("extra", [1, 3]), ("principal", [0, 2])]
+    assert pool.devueltos == [("extra", False)]
+
+
+def test_navegador_adicional_caido_se_descarta_y_sus_semanas_se_repiten(entorno):
+    pool, fallos, leidas = entorno
+    fallos["extra"] = "todo"
+    principal = NavegadorFalso("principal")
+    citas = extraer_citas.extraer_citas_dom(principal, semanas=4, paralelo=2)
+    assert [c["semana"] for c in citas] == [1, 2, 3, 4]
+    assert pool.devueltos == [("extra", True)]
+    assert leidas[-1] == ("principal", [1, 3])
+    assert principal.visitas == [extraer_citas.URL_AGENDA]
+
+
+def test_semana_fallida_del_principal_se_repite(entorno, monkeypatch):
+    _, fallos, leidas = entorno
+    intentos = []
+
+    def falla_una_vez(driver, semanas):
+        intentos.append(list(semanas))
+        fallo = [2] if len(intentos) == 1 else []
+        return [cita(s) for s in semanas if s not in fallo], fallo
+
+    monkeypatch.setattr(extraer_citas, "extraer_grupo_dom", falla_una_vez)
+    monkeypatch.setattr(extraer_citas, "navegadores_adicionales", lambda pool, cantidad: [])
+    citas = extraer_citas.extraer_citas_dom(NavegadorFalso("principal"), semanas=3, paralelo=1)
+    assert [c["semana"] for c in citas] == [1, 2, 3]
+    assert intentos == [[0, 1, 2], [2]]
+
+
+def test_semana_que_sigue_fallando_no_devuelve_un_resultado_incompleto(entorno):
+    pool, fallos, _ = entorno
+    fallos["principal"] = [0]
+    with pytest.raises(RuntimeError):
+        extraer_citas.extraer_citas_dom(NavegadorFalso("principal"), semanas=4, paralelo=2)
+    assert pool.devueltos == [("extra", False)]
+
+
+def test_extraccion_fallida_no_guarda_y_descarta_el_navegador(entorno, monkeypatch):
+    pool, fallos, _ = entorno
+    principal = NavegadorFalso("principal")
+    principal.save_screenshot = lambda ruta: None
+    pool.libres.insert(0, principal)
+    fallos["principal"] = "todo"
+    guardadas = []
+    monkeypatch.setattr(extraer_citas, "guardar_citas", guardadas.append)
+
+    assert extraer_citas.extraer_citas_por_semanas(semanas=2, modo="dom", paralelo=1) is None
+    assert guardadas == []
+    assert ("principal", True) in pool.devueltos
@@ -0,0 +1,129 @@
+import random
+from gspread.utils import a1_to_rowcol
+from google_sheets import claves_filas, planificar_cambios, rangos_contiguos, enviar_rangos
+
+CABECERA = ["Paciente", "DNI", "Fecha", "Hora", "Agenda"]
+
+
+def fila(dni, fecha="2026-10-22", hora="10:00", paciente="Ana Ruiz", agenda="1"):
+    return [paciente, dni, fecha, hora, agenda]
+
+
+def snapshot(filas):
+    return {"claves": claves_filas(CABECERA, filas), "filas": filas}
+
+
+def aplicar(hoja, rangos):
+    """Escribe los rangos sobre una hoja simulada (lista de filas de datos, sin cabecera)"""
+    hoja = [list(f) for f in hoja]
+    for rango in rangos:
+        inicio, fin = rango["range"].split(":")
+        fila_inicio, columna = a1_to_rowcol(inicio)
+        fila_fin, ultima_columna = a1_to_rowcol(fin)
+        assert columna == 1 and ultima_columna == len(CABECERA)
+        assert fila_fin - fila_inicio + 1 == len(rango["values"])
+        for desplazamiento, valores in enumerate(rango["values"]):
+            posicion = fila_inicio - 2 + desplazamiento
+            while len(hoja) <= posicion:
+                hoja.append([""] * len(CABECERA))
+            hoja[posicion] = list(valores)
+    return hoja
+
+
+def sincronizar(anterior, nuevas):
+    """Aplica el plan a la hoja anterior; devuelve (hoja resultante, cambios, claves)"""
+    cambios, total_anterior, claves = planificar_cambios(snapshot(anterior), CABECERA, nuevas)
+    rangos = rangos_contiguos(cambios, total_anterior, len(claves), len(CABECERA))
+    return aplicar(anterior, rangos), cambios, claves
+
+
+def comprobar(anterior, nuevas):
+    hoja, cambios, claves = sincronizar(anterior, nuevas)
+    por_clave = dict(zip(claves_filas(CABECERA, nuevas), nuevas))
+    assert sorted(claves) == sorted(por_clave)
+    assert hoja[:len(claves)] == [por_clave[c] for c in claves]
+    # Las filas que sobran al final quedan vacías
+    assert all(f == [""] * len(CABECERA) for f in hoja[len(claves):])
+    return hoja, cambios, claves
+
+
+def test_sin_cambios_no_escribe_nada():
+    filas = [fila("1"), fila("2"), fila("3")]
+    cambios, total, claves = planificar_cambios(snapshot(filas), CABECERA, [list(f) for f in filas])
+    assert cambios == {} and total == 3
+    assert rangos_contiguos(cambios, total, len(claves), len(CABECERA)) == []
+
+
+def test_fila_modificada_se_reescribe_en_su_sitio():
+    anterior = [fila("1"), fila("2"), fila("3")]
+    nuevas = [fila("1"), fila("2", paciente="Ana Ruiz Gil"), fila("3")]
+    _, cambios, claves = comprobar(anterior, nuevas)
+    assert cambios == {1: nuevas[1]}
+    assert claves == snapshot(anterior)["claves"]
+
+
+def test_filas_nuevas_ocupan_los_huecos_de_las_eliminadas():
+    anterior = [fila("1"), fila("2"), fila("3")]
+    nuevas = [fila("1"), fila("3"), fila("4")]
+    _, cambios, _ = comprobar(anterior, nuevas)
+    assert cambios == {1: fila("4")}
+
+
+def test_eliminadas_se_rellenan_con_las_ultimas_y_se_recorta():
+    anterior = [fila(str(i)) for i in range(1, 6)]
+    nuevas = [fila("2"), fila("3"), fila("4")]
+    hoja, cambios, claves = comprobar(anterior, nuevas)
+    # La última fila pasa al hueco de la primera; la 5 ya no existe y se vacía
+    assert cambios == {0: fila("4")}
+    assert len(claves) == 3 and len(hoja) == 5
+
+
+def test_filas_repetidas_se_distinguen_por_aparicion():
+    claves = claves_filas(CABECERA, [fila("1"), fila("1"), fila("2")])
+    assert claves == ["1|2026-10-22|10:00#1", "1|2026-10-22|10:00#2", "2|2026-10-22|10:00#1"]
+    comprobar([fila("1"), fila("1"), fila("2")], [fila("1"), fila("2")])
+
+
+def test_rangos_contiguos_agrupa_y_vacia_las_sobrantes():
+    cambios = {0: ["a", "b"], 1: ["c"], 4: ["d", "e"]}
+    rangos = rangos_contiguos(cambios, 7, 5, 2)
+    assert rangos == [
+        {"range": "A2:B3", "values": [["a", "b"], ["c", ""]]},
+        {"range": "A6:B8", "values": [["d", "e"], ["", ""], ["", ""]]},
+    ]
+
+
+def test_enviar_rangos_parte_las_peticiones(monkeypatch):
+    import google_sheets
+    monkeypatch.setattr(google_sheets, "FILAS_POR_BLOQUE", 3)
+
+    class Hoja:
+        def __init__(self):
+            self.peticiones = []
+
+        def batch_update(self, rangos, **kwargs):
+            self.peticiones.append([r["range"] for r in rangos])
+
+    hoja = Hoja()
+    rangos = rangos_contiguos({0: ["a"], 1: ["b"], 3: ["c"], 5: ["d"], 6: ["e"]}, 7, 7, 1)
+    enviar_rangos(hoja, rangos)
+    assert hoja.peticiones == [["A2:A3", "A5:A5"], ["A7:A8"]]
+
+
+def test_plan_aleatorio_reproduce_la_hoja():
+    aleatorio = random.Random(1234)
+    horas = [f"{h:02d}:{m:02d}" for h in range(9, 14) for m in (0, 30)]
+
+    def fila_aleatoria():
+        return fila(str(aleatorio.randint(1, 6)), hora=aleatorio.choice(horas),
+                    paciente=aleatorio.choice(["Ana Ruiz", "Luis Gil", "Eva Sanz"]))
+
+    for _ in range(300):
+        anterior = [fila_aleatoria() for _ in range(aleatorio.randint(0, 15))]
+        nuevas = [list(f) for f in anterior if aleatorio.random() > 0.3]
+        for f in nuevas:
+            if aleatorio.random() < 0.2:
+                f[0] = aleatorio.choice(["Ana Ruiz", "Luis Gil", "Eva Sanz", "Pablo Ramos"])
+        nuevas += [fila_aleatoria() for _ in range(aleatorio.randint(0, 6))]
+        aleatorio.shuffle(nuevas)
+        comprobar(anterior, nuevas)
@@ -0,0 +1,59 @@
+import pytest
+import pool_navegadores
+
+
+class NavegadorFalso:
+    def __init__(self):
+        self.cerrado = False
+
+    def execute_script(self, *args):
+        return 1
+
+    def quit(self):
+        self.cerrado = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(pool_navegadores, "crear_navegador", NavegadorFalso)
+    monkeypatch.setattr(pool_navegadores, "iniciar_sesion", lambda driver: True)
+    return pool_navegadores.PoolNavegadores(tamano=2)
+
+
+def test_login_fallido_no_entra_en_el_pool(pool, monkeypatch):
+    abiertos = []
+    monkeypatch.setattr(pool_navegadores, "crear_navegador", lambda: abiertos.append(NavegadorFalso()) or abiertos[-1])
+    monkeypatch.setattr(pool_navegadores, "iniciar_sesion", lambda driver: False)
+
+    with pytest.raises(RuntimeError):
+        pool.obtener()
+
+    assert abiertos[0].cerrado
+    assert pool._abiertos == 0 and pool._libres == []
+
+
+def test_calentar_abre_el_pool_completo(pool):
+    pool.calentar()
+    assert len(pool._libres) == 2
+    pool.calentar()
+    assert len(pool._libres) == 2
+
+
+def test_prestar_descarta_el_navegador_si_el_bloque_falla(pool):
+    with pytest.raises(ValueError):
+        with pool.prestar() as driver:
+            raise ValueError("modal abierto")
+
+    assert driver.cerrado
+    assert pool._abiertos == 0
+
+    with pool.prestar() as otro:
+        assert otro is not driver
+    assert pool._libres == [otro]
+
+
+def test_obtener_sin_espera_falla_si_no_hay_libres(pool):
+    pool.obtener()
+    pool.obtener()
+    with pytest.raises(TimeoutError):
+        pool.obtener(timeout=0)
@@ -0,0 +1,99 @@
+from datetime import date, datetime
+import pytest
+from reglas_horario import ReglasHorario, REGLAS, a_fecha, a_minutos
+
+LUNES_PAR = date(2025, 4, 14)     # semana_base de las reglas de prueba
+LUNES_IMPAR = date(2025, 4, 21)
+
+
+@pytest.fixture
+def reglas():
+    return ReglasHorario({
+        "duracion_cita": 30,
+        "semana_base": LUNES_PAR.isoformat(),
+        "facultativos": {
+            "ana": {"nombre": "Ana", "color": [1, 2, 3]},
+            "luis": {"nombre": "Luis", "color": [4, 5, 6]},
+        },
+        "salas": {"1": "Box 1", "2": "Box 2"},
+        "turnos": [
+            {"dias": [0, 1], "agenda": 1, "turno": "manana", "inicio": "09:00", "fin": "13:00"},
+            {"dias": [0], "agenda": 2, "turno": "manana", "inicio": "09:30", "fin": "12:00", "paridad": 1},
+        ],
+        "asignaciones": [
+            {"dias": [0], "agenda": 1, "hasta": "11:00", "facultativo": "ana"},
+            {"dias": [0], "agenda": 1, "facultativo": "luis"},
+            {"dias": [0], "agenda": 2, "facultativo": "ana", "paridad": 1},
+            {"dias": [1], "desde": "10:00", "hasta": "10:30", "facultativo": "luis"},
+            {"dias": [1], "facultativo": "ana"},
+        ],
+    })
+
+
+def test_a_minutos_y_a_fecha():
+    assert a_minutos("00:00") == 0
+    assert a_minutos("20:15") == 20 * 60 + 15
+    assert a_fecha("22-10-2026") == a_fecha("2026-10-22") == date(2026, 10, 22)
+    assert a_fecha(datetime(2026, 10, 22, 9, 30)) == date(2026, 10, 22)
+
+
+def test_paridad_alterna_cada_semana(reglas):
+    assert reglas.paridad(LUNES_PAR) == 0
+    assert reglas.paridad(LUNES_IMPAR) == 1
+    assert reglas.paridad(date(2025, 4, 27)) == 1   # domingo de la semana impar
+    assert reglas.paridad(date(2025, 4, 28)) == 0
+
+
+def test_franjas_por_paridad(reglas):
+    assert reglas.horarios_del_dia(LUNES_PAR) == {"manana": {"primaria": ("09:00", "13:00"), "secundaria": None}}
+    assert reglas.horarios_del_dia(LUNES_IMPAR) == {
+        "manana": {"primaria": ("09:00", "13:00"), "secundaria": ("09:30", "12:00")}}
+    assert reglas.horarios_del_dia(date(2025, 4, 16)) == {}
+
+
+@pytest.mark.parametrize("hora, nombre", [
+    ("09:00", "Ana"),
+    ("10:59", "Ana"),
+    ("11:00", "Luis"),   # "hasta" no incluye el minuto final
+    ("19:00", "Luis"),
+])
+def test_facultativo_por_minuto(reglas, hora, nombre):
+    assert reglas.nombre_facultativo(LUNES_PAR, hora, 1) == nombre
+
+
+def test_la_primera_regla_que_cubre_el_minuto_manda(reglas):
+    martes = date(2025, 4, 15)
+    assert reglas.nombre_facultativo(martes, "09:59") == "Ana"
+    assert reglas.nombre_facultativo(martes, "10:00") == "Luis"
+    assert reglas.nombre_facultativo(martes, "10:29") == "Luis"
+    assert reglas.nombre_facultativo(martes, "10:30") == "Ana"
+    # Sin "agenda" la regla vale para las dos
+    assert reglas.nombre_facultativo(martes, "10:00", 2) == "Luis"
+
+
+def test_agenda_secundaria_segun_paridad(reglas):
+    assert reglas.nombre_facultativo(LUNES_PAR, "10:00", 2) is None
+    assert reglas.nombre_facultativo(LUNES_IMPAR, "10:00", 2) == "Ana"
+
+
+def test_agenda_por_color(reglas):
+    assert reglas.agenda_por_color((1, 2, 3), LUNES_PAR, "10:00") == "1"
+    assert reglas.agenda_por_color((4, 5, 6), LUNES_PAR, "10:00") == "2"
+    assert reglas.agenda_por_color((4, 5, 6), LUNES_PAR, "12:00") == "1"
+    assert reglas.agenda_por_color(None, LUNES_PAR, "10:00") == "2"
+    assert reglas.agenda_por_color((1, 2, 3), date(2025, 4, 16), "10:00") == "2"
+
+
+def test_salas(reglas):
+    assert reglas.sala(2) == "Box 2"
+    assert reglas.sala("3") == "Box 1"
+
+
+def test_reglas_de_la_clinica():
+    assert REGLAS.duracion_cita == 45
+    lunes = REGLAS.semana_base
+    assert REGLAS.nombre_facultativo(lunes, "10:15", 1) == "Arnau Girones"
+    assert REGLAS.nombre_facultativo(lunes, "15:00", 1) == "David Ibiza"
+    assert REGLAS.nombre_facultativo(lunes, "15:00", 2) == "Jose Cabanes"
+    assert REGLAS.horarios_del_dia(lunes)["tarde"]["secundaria"] == ("15:00", "20:15")
+    assert REGLAS.horarios_del_dia(date.fromordinal(lunes.toordinal() + 7))["tarde"]["secundaria"] is None
@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+import pytest
+import sincronizar_citas
+from extraer_citas import lunes_de
+
+
+def cita(dia, hora, paciente, agenda="1"):
+    return {"dia": dia, "hora_inicio": hora, "hora_fin": "10:00", "paciente": paciente, "agenda": agenda}
+
+
+def test_delta_detecta_añadidas_y_eliminadas():
+    antes = [cita("2026-10-20", "09:00", "Ana Ruiz")]
+    despues = [cita("2026-10-21", "11:00", "Luis Paz")]
+
+    delta = sincronizar_citas.calcular_delta(antes, despues)
+
+    assert delta["añadidas"] == despues
+    assert delta["eliminadas"] == antes
+    assert delta["movidas"] == []
+
+
+def test_delta_agrupa_como_movida_la_cita_del_mismo_paciente():
+    antes = [cita("2026-10-20", "09:00", "Ana Ruiz"), cita("2026-10-20", "12:00", "Luis Paz")]
+    despues = [cita("2026-10-22", "17:00", "Ana Ruiz", agenda="2"), cita("2026-10-20", "12:00", "Luis Paz")]
+
+    delta = sincronizar_citas.calcular_delta(antes, despues)
+
+    assert delta["añadidas"] == [] and delta["eliminadas"] == []
+    assert delta["movidas"] == [{
+        "paciente": "Ana Ruiz",
+        "antes": {"dia": "2026-10-20", "hora_inicio": "09:00", "hora_fin": "10:00", "agenda": "1"},
+        "despues": {"dia": "2026-10-22", "hora_inicio": "17:00", "hora_fin": "10:00", "agenda": "2"},
+    }]
+
+
+def test_delta_sin_cambios():
+    citas = [cita("2026-10-20", "09:00", "Ana Ruiz")]
+    assert not any(sincronizar_citas.calcular_delta(citas, list(citas)).values())
+
+
+def test_hash_eventos_no_depende_del_orden():
+    a = {"id": "1", "start": "2026-10-20T09:00:00", "title": "Ana", "rango": "x"}
+    b = {"id": "2", "start": "2026-10-20T10:00:00", "title": "Luis", "rango": "y"}
+    assert sincronizar_citas.hash_eventos([a, b]) == sincronizar_citas.hash_eventos([dict(b, rango="z"), a])
+
+
+@pytest.fixture
+def semana_siguiente(almacen, tmp_path, monkeypatch):
+    """Sincronización contra un calendario falso con una cita la semana que viene"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(sincronizar_citas, "RUTA_CITAS", str(tmp_path / "data" / "citas.json"))
+    monkeypatch.setattr(sincronizar_citas, "RUTA_ESTADO", str(tmp_path / "data" / "estado.json"))
+    monkeypatch.setattr(sincronizar_citas, "RUTA_DELTA", str(tmp_path / "data" / "delta.json"))
+
+    lunes = lunes_de(date.today())
+    siguiente = lunes + timedelta(weeks=1)
+    evento = {"id": "7", "start": f"{siguiente.isoformat()}T09:00:00", "end": f"{siguiente.isoformat()}T09:45:00",
+              "title": "Ana Ruiz", "color": "rgb(1, 2, 3)", "rendering": None}
+
+    def eventos_por_navegador(rangos):
+        return {desde: ([dict(evento, rango=desde)] if desde == siguiente.isoformat() else [])
+                for desde, _ in rangos}, None
+    monkeypatch.setattr(sincronizar_citas, "eventos_por_navegador", eventos_por_navegador)
+    return siguiente.isoformat()
+
+
+def test_semana_sin_cambios_se_reconstruye_si_el_almacen_la_perdio(almacen, semana_siguiente):
+    sincronizar_citas.sincronizar_citas(forzar=True)
+    assert [c["dia"] for c in almacen.todas_las_citas()] == [semana_siguiente]
+
+    # citas.db borrada o reconstruida: el estado conserva la huella de la semana
+    almacen.reemplazar_citas([])
+    delta = sincronizar_citas.sincronizar_citas(forzar=True)
+
+    assert [c["paciente"] for c in delta["añadidas"]] == ["Ana Ruiz"]
+    assert [c["dia"] for c in almacen.todas_las_citas()] == [semana_siguiente]
+
+
+def test_semana_sin_cambios_reutiliza_las_citas_guardadas(almacen, semana_siguiente, monkeypatch):
+    sincronizar_citas.sincronizar_citas(forzar=True)
+
+    def no_usar(*args):
+        raise AssertionError("la semana no ha cambiado")
+    monkeypatch.setattr(sincronizar_citas, "citas_desde_eventos", no_usar)
+    delta = sincronizar_citas.sincronizar_citas(forzar=True)
+
+    assert not any(delta.values())
@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import io
+import logging
+import sys
+import threading
+import traceback
+import uuid
+from pool_navegadores import TAMANO_POOL
+
+# Trabajos largos (sesiones de Selenium) lanzados desde la API y consultados por ID.
+# Se ejecutan dentro del mismo proceso, compartiendo el pool de navegadores, y el número
+# de trabajos simultáneos no pasa del número de navegadores del pool.
+MAX_TRABAJOS_GUARDADOS = 200
+MAX_LINEAS_LOG = 2000
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+
+class Trabajo:
+    """Estado, resultado y registro de un trabajo en segundo plano"""
+
+    def __init__(self, nombre, parametros=None):
+        self.id = uuid.uuid4().hex
+        self.nombre = nombre
+        self.parametros = parametros or {}
+        self.estado = PENDIENTE
+        self.creado = datetime.now()
+        self.iniciado = None
+        self.terminado = None
+        self.resultado = None
+        self.error = None
+        self.logs = []
+        self.futuro = None
+        self._bloqueo = threading.Lock()
+
+    def log(self, linea):
+        with self._bloqueo:
+            self.logs.append(linea.rstrip("\n"))
+            if len(self.logs) > MAX_LINEAS_LOG:
+                del self.logs[:len(self.logs) - MAX_LINEAS_LOG]
+
+    def a_dict(self, desde_linea=0):
+        """Vista serializable del trabajo; `desde_linea` permite pedir solo los logs nuevos"""
+        with self._bloqueo:
+            logs = self.logs[desde_linea:]
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "parametros": self.parametros,
+            "estado": self.estado,
+            "creado": self.creado.isoformat(timespec="seconds"),
+            "iniciado": self.iniciado.isoformat(timespec="seconds") if self.iniciado else None,
+            "terminado": self.terminado.isoformat(timespec="seconds") if self.terminado else None,
+            "resultado": self.resultado,
+            "error": self.error,
+            "logs": logs,
+        }
+
+
+_trabajo_del_hilo = threading.local()
+
+
+def trabajo_actual():
+    """Trabajo que se está ejecutando en este hilo, o None"""
+    return getattr(_trabajo_del_hilo, "trabajo", None)
+
+
+class SalidaPorHilo(io.TextIOBase):
+    """Sustituye a sys.stdout/sys.stderr: lo que imprime un trabajo va a su registro
+
+    Los hilos que no ejecutan ningún trabajo escriben en la salida original.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self._pendiente = threading.local()
+
+    def write(self, texto):
+        trabajo = trabajo_actual()
+        if trabajo is None:
+            return self.original.write(texto)
+        texto = getattr(self._pendiente, "texto", "") + texto
+        *lineas, self._pendiente.texto = texto.split("\n")
+        for linea in lineas:
+            trabajo.log(linea)
+        return len(texto)
+
+    def flush(self):
+        trabajo = trabajo_actual()
+        if trabajo is None:
+            return self.original.flush()
+        if getattr(self._pendiente, "texto", ""):
+            trabajo.log(self._pendiente.texto)
+            self._pendiente.texto = ""
+
+    def isatty(self):
+        return False
+
+
+class ManejadorLogTrabajo(logging.Handler):
+    """Copia en el registro del trabajo los mensajes de logging emitidos desde su hilo"""
+
+    def emit(self, registro):
+        trabajo = trabajo_actual()
+        if trabajo is not None:
+            trabajo.log(self.format(registro))
+
+
+def capturar_salida():
+    """Redirige print y logging de los trabajos a su registro (idempotente)"""
+    if not isinstance(sys.stdout, SalidaPorHilo):
+        sys.stdout = SalidaPorHilo(sys.stdout)
+    if not isinstance(sys.stderr, SalidaPorHilo):
+        sys.stderr = SalidaPorHilo(sys.stderr)
+    raiz = logging.getLogger()
+    if not any(isinstance(h, ManejadorLogTrabajo) for h in raiz.handlers):
+        manejador = ManejadorLogTrabajo()
+        manejador.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+        raiz.addHandler(manejador)
+
+
+class GestorTrabajos:
+    """Cola de trabajos con un número máximo de ejecuciones simultáneas"""
+
+    def __init__(self, max_simultaneos=TAMANO_POOL):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_simultaneos), thread_name_prefix="trabajo")
+        self._trabajos = OrderedDict()
+        self._bloqueo = threading.Lock()
+        capturar_salida()
+
+    def lanzar(self, nombre, funcion, *args, parametros=None, **kwargs):
+        """Encola `funcion(*args, **kwargs)` y devuelve el trabajo sin esperar
+
+        Lo que la función imprima queda en el registro del trabajo y lo que devuelva, como
+        resultado. Si lanza una excepción, el trabajo termina en estado "error".
+        """
+        trabajo = Trabajo(nombre, parametros)
+        with self._bloqueo:
+            self._trabajos[trabajo.id] = trabajo
+            while len(self._trabajos) > MAX_TRABAJOS_GUARDADOS:
+                antiguo = next(iter(self._trabajos.values()))
+                if antiguo.estado in (PENDIENTE, EN_CURSO):
+                    break
+                self._trabajos.popitem(last=False)
+        trabajo.futuro = self._executor.submit(self._ejecutar, trabajo, funcion, args, kwargs)
+        return trabajo
+
+    @staticmethod
+    def _ejecutar(trabajo, funcion, args, kwargs):
+        trabajo.estado = EN_CURSO
+        trabajo.iniciado = datetime.now()
+        _trabajo_del_hilo.trabajo = trabajo
+        try:
+            trabajo.resultado = funcion(*args, **kwargs)
+            trabajo.estado = COMPLETADO
+        except (Exception, SystemExit) as e:
+            # SystemExit incluido: las funciones de los scripts pueden terminar con sys.exit
+            trabajo.error = str(e) or e.__class__.__name__
+            trabajo.log(traceback.format_exc())
+            trabajo.estado = ERROR
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            _trabajo_del_hilo.trabajo = None
+            trabajo.terminado = datetime.now()
+        return trabajo
+
+    def obtener(self, id_trabajo):
+        with self._bloqueo:
+            return self._trabajos.get(id_trabajo)
+
+    def listar(self):
+        with self._bloqueo:
+            return list(self._trabajos.values())
+
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_gestor = None
+_bloqueo_gestor = threading.Lock()
+
+
+def obtener_gestor():
+    """Gestor de trabajos compartido del proceso"""
+    global _gestor
+    with _bloqueo_gestor:
+        if _gestor is None:
+            _gestor = GestorTrabajos()
+        return _gestor
@@ -1,15 +1,16 @@
 import os
-import pandas as pd
 from datetime import datetime, timedelta
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import time
 from dotenv import load_dotenv
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
+from almacenamiento import RegistroAnexos, reescribir_lineas
+from cache_excel import cargar_tabla, exportacion_mas_reciente
+from esperas import esperar_valor, intentar
 
 # Cargar variables de entorno
 load_dotenv("env/.env")
@@ -18,24 +19,13 @@ load_dotenv("env/.env")
 WHATSAPP_SESSION_DIR = os.path.abspath("./whatsapp_session")
 TU_NUMERO_WHATSAPP = "+34643053023"  # Tu número en formato internacional
 REGISTRO_ENVIOS = os.path.abspath("./data/registro_envios.txt")  # Archivo de registro
-
-def normalizar_telefono(numero):
-    """Normaliza números de teléfono al formato internacional"""
-    if pd.isna(numero):
-        return None
-    numero = str(numero).strip().replace(" ", "").replace("-", "")
-    if not numero.startswith("+"):
-        if len(numero) == 9 and numero[0] in ['6','7']:
-            return "+34" + numero
-        return None
-    return numero
+registro = RegistroAnexos(REGISTRO_ENVIOS)
 
 def registrar_envio(telefono, fecha_cita, DNI):
     """Registra un mensaje enviado para evitar duplicados"""
     os.makedirs(os.path.dirname(REGISTRO_ENVIOS), exist_ok=True)
     print(f"Guardando en el archivo de registro: {REGISTRO_ENVIOS}")
-    with open(REGISTRO_ENVIOS, "a", encoding="utf-8") as f:
-        f.write(f"{telefono},{fecha_cita},{DNI}\n")
+    registro.anexar(f"{telefono},{fecha_cita},{DNI}")
     print(f"Mensaje registrado para {telefono} en la fecha {fecha_cita} y DNI {DNI}")  
 
 def fue_enviado(telefono, fecha_cita, DNI):
@@ -61,27 +51,24 @@ def limpiar_registro():
         return
     
     hoy = datetime.now().strftime("%d-%m-%Y")
-    lineas_validas = []
-    
-    with open(REGISTRO_ENVIOS, "r", encoding="utf-8") as f:
-        for linea in f:
-            linea = linea.strip()
-            if not linea:  # Saltar líneas vacías
-                continue
-                
-            partes = linea.split(",")
-            if len(partes) < 3:  # Saltar líneas mal formateadas
-                continue
-                
-            fecha = partes[1].strip()
-            try:
-                if fecha >= hoy:  # Mantener solo futuras o de hoy
-                    lineas_validas.append(linea + "\n")
-            except TypeError:
-                continue
+
+    def es_valida(linea):
+        linea = linea.strip()
+        if not linea:  # Saltar líneas vacías
+            return False
+            
+        partes = linea.split(",")
+        if len(partes) < 3:  # Saltar líneas mal formateadas
+            return False
+            
+        fecha = partes[1].strip()
+        try:
+            return fecha >= hoy  # Mantener solo futuras o de hoy
+        except TypeError:
+            return False
     
-    with open(REGISTRO_ENVIOS, "w", encoding="utf-8") as f:
-        f.writelines(lineas_validas)
+    # Con el bloqueo, un envío registrado mientras se limpia no se pierde
+    reescribir_lineas(REGISTRO_ENVIOS, es_valida)
 
 def iniciar_whatsapp():
     """Inicia sesión en WhatsApp Web"""
@@ -134,8 +121,8 @@ def enviar_whatsapp(driver, numero, mensaje):
             input_box.send_keys(Keys.SHIFT + Keys.ENTER)  # Nuevo línea sin enviar
         input_box.send_keys(Keys.RETURN)  # Enviar final
         
-        # Pequeña pausa para asegurar el envío
-        time.sleep(2)
+        # Al enviarse el mensaje WhatsApp vacía el cuadro de texto
+        intentar(esperar_valor, driver, input_box, "", 10)
         
         # Verificación simple de envío
         try:
@@ -160,34 +147,28 @@ def procesar_citas():
     limpiar_registro()  # Limpia registros antiguos
     
     try:
-        # Buscar archivo Excel más reciente
-        archivos = [f for f in os.listdir(carpeta_descargas) 
-                   if f.endswith((".xls", ".xlsx")) and not f.startswith("~$")]
+        # Exportación más reciente, sea cual sea su extensión
+        archivo_excel = exportacion_mas_reciente(carpeta_descargas)
         
-        if not archivos:
+        if not archivo_excel:
             print("No se encontró ningún archivo Excel en la carpeta 'data'")
             return
         
-        archivo_excel = os.path.join(carpeta_descargas, archivos[0])
         print(f"Procesando archivo: {archivo_excel}")
         
-        # Leer archivo Excel
+        # Leer la exportación desde su caché (fechas ya convertidas y teléfonos normalizados)
         try:
-            df = pd.read_excel(archivo_excel, engine="openpyxl")  # Intentamos con openpyxl primero
-        except Exception as e:
-            try:
-                df = pd.read_excel(archivo_excel, engine="xlrd")  # Si falla, intentamos con xlrd
-            except Exception as ex:
-                print(f"Error al leer el archivo Excel: {ex}")
-                return
+            df = cargar_tabla(archivo_excel)
+        except Exception as ex:
+            print(f"Error al leer el archivo Excel: {ex}")
+            return
         
         # Verificar columnas necesarias
         if not all(col in df.columns for col in ["Fecha", "Hora", "Paciente", "DNI"]):
             print("El archivo Excel no tiene las columnas esperadas (Fecha, Hora, Paciente, DNI)")
             return
         
-        # Convertir la columna de fecha
-        df["Fecha"] = pd.to_datetime(df["Fecha"], dayfirst=True, errors="coerce")
+        df["Fecha"] = df["_fecha"]
         
         # Filtrar citas de hoy y mañana
         ahora = datetime.now()
@@ -212,8 +193,7 @@ def procesar_citas():
         for _, fila in citas_recientes.iterrows():
             DNI = fila.get("DNI", "DNI")
             nombre = fila.get("Paciente", "Paciente")
-            telefono = fila.get("Móvil") if pd.notna(fila.get("Móvil")) else fila.get("Teléfono")
-            telefono = normalizar_telefono(telefono)
+            telefono = fila.get("_telefono")
             
             if not telefono:
                 print(f"No se encontró teléfono para {DNI}")